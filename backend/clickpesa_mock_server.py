@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Local mock of the ClickPesa API for development and tests
+Run it and point the backend at it:
+    python clickpesa_mock_server.py            # listens on http://localhost:8099
+    CLICKPESA_BASE_URL=http://localhost:8099 uvicorn main:app
+Or serve it in-process with httpx.ASGITransport(app=app) as a ClickPesaClient transport.
+
+Besides the two API endpoints the backend uses, /mock/* endpoints inspect
+counters, inject failures and send payment webhooks to the backend.
+"""
+
+import itertools
+import os
+import secrets
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse
+
+# Seconds before a mock token is rejected with 401
+MOCK_TOKEN_TTL = float(os.getenv("CLICKPESA_MOCK_TOKEN_TTL", "3600"))
+
+app = FastAPI(title="ClickPesa Mock")
+
+
+class MockState:
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.tokens: Dict[str, float] = {}  # Token -> expiry (time.monotonic)
+        self.bills: Dict[str, Dict] = {}  # billReference -> bill
+        self.counts = {"generate_token": 0, "create_control_number": 0}
+        self.failures: List[int] = []  # Status codes returned by the next API requests, in order
+        self.control_numbers = itertools.count(55000001)
+
+
+state = MockState()
+
+
+def _injected_failure() -> Optional[JSONResponse]:
+    if state.failures:
+        return JSONResponse(status_code=state.failures.pop(0), content={"message": "Injected failure"})
+    return None
+
+
+def _authorized(authorization: Optional[str]) -> bool:
+    expires_at = state.tokens.get(authorization or "")
+    return expires_at is not None and time.monotonic() < expires_at
+
+
+@app.post("/third-parties/generate-token")
+async def generate_token(api_key: Optional[str] = Header(None), client_id: Optional[str] = Header(None)):
+    state.counts["generate_token"] += 1
+    failure = _injected_failure()
+    if failure:
+        return failure
+    if not api_key or not client_id:
+        return JSONResponse(status_code=401, content={"success": False, "message": "Invalid credentials"})
+    token = f"Bearer mock-{secrets.token_hex(16)}"
+    state.tokens[token] = time.monotonic() + MOCK_TOKEN_TTL
+    return {"success": True, "token": token}
+
+
+@app.post("/third-parties/billpay/create-customer-control-number")
+async def create_customer_control_number(request: Request, authorization: Optional[str] = Header(None)):
+    state.counts["create_control_number"] += 1
+    failure = _injected_failure()
+    if failure:
+        return failure
+    if not _authorized(authorization):
+        return JSONResponse(status_code=401, content={"message": "Unauthorized"})
+    data = await request.json()
+    reference = data.get("billReference")
+    if not reference or not data.get("customerName"):
+        return JSONResponse(status_code=400, content={"message": "customerName and billReference are required"})
+    if reference not in state.bills:
+        state.bills[reference] = {
+            "billPayNumber": str(next(state.control_numbers)),
+            "billReference": reference,
+            "billAmount": data.get("billAmount"),
+            "billDescription": data.get("billDescription"),
+            "billPaymentMode": data.get("billPaymentMode"),
+            "customerName": data.get("customerName"),
+        }
+    return state.bills[reference]
+
+
+@app.get("/mock/state")
+async def get_state():
+    return {"counts": state.counts, "bills": len(state.bills), "pending_failures": state.failures}
+
+
+@app.post("/mock/reset")
+async def reset_state():
+    state.reset()
+    return {"message": "Mock state reset"}
+
+
+@app.post("/mock/fail")
+async def inject_failures(status_code: int = 503, count: int = 1):
+    """Make the next count API requests return status_code"""
+    state.failures.extend([status_code] * count)
+    return {"pending_failures": state.failures}
+
+
+@app.post("/mock/expire-tokens")
+async def expire_tokens():
+    """Reject every issued token, as ClickPesa does once they expire"""
+    state.tokens.clear()
+    return {"message": "Tokens expired"}
+
+
+@app.post("/mock/pay/{bill_reference}")
+async def pay_bill(bill_reference: str, webhook_url: str, amount: Optional[float] = None, status: str = "completed"):
+    """Send the payment webhook ClickPesa would send once a customer pays the bill"""
+    bill = state.bills.get(bill_reference)
+    if not bill:
+        return JSONResponse(status_code=404, content={"message": "Bill not found"})
+    payload = {
+        "paymentReference": bill_reference,
+        "billPayNumber": bill["billPayNumber"],
+        "amount": amount if amount is not None else bill["billAmount"],
+        "status": status,
+    }
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        response = await client.post(webhook_url, json=payload)
+    return {"webhook_status": response.status_code, "payload": payload}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.getenv("CLICKPESA_MOCK_PORT", "8099"))
+    uvicorn.run(app, host="127.0.0.1", port=port)
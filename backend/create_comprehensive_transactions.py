@@ -14,7 +14,8 @@ import random
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database import get_db
-from models.transaction import Transaction, TransactionType, PaymentMethod
+from models.transaction import Transaction, LedgerRollup
+from services.transaction_import import ingest_transactions
 
 def create_comprehensive_transactions():
     """Create comprehensive sample transactions covering all accounting categories"""
@@ -26,6 +27,7 @@ def create_comprehensive_transactions():
         # Clear existing transactions (optional - comment out if you want to keep existing data)
         print("Clearing existing transactions...")
         db.query(Transaction).delete()
+        db.query(LedgerRollup).delete()
         db.commit()
         
         # Generate transactions for the last 12 months
@@ -198,8 +200,8 @@ def create_comprehensive_transactions():
             {"description": "Bond Investment", "category": "Investments", "amount": 1500000, "payment_method": "BANK", "reference": "INVEST-002"},
             
             # Deposits & Guarantees
-            {"description": "Security Deposit", "category": "Deposits & Guarantees", "amount": 300000, "payment_method": "BANK", "reference": "DEP-001"},
-            {"description": "Performance Guarantee", "category": "Deposits & Guarantees", "amount": 500000, "payment_method": "BANK", "reference": "DEP-002"},
+            {"description": "Security Deposit", "category": "Deposits & Guarantees", "amount": 300000, "payment_method": "BANK", "reference": "DEP-003"},
+            {"description": "Performance Guarantee", "category": "Deposits & Guarantees", "amount": 500000, "payment_method": "BANK", "reference": "DEP-004"},
         ]
         
         # LIABILITY TRANSACTIONS
@@ -278,7 +280,7 @@ def create_comprehensive_transactions():
         other_transactions = [
             {"description": "Charitable Donation", "category": "Donations / Grants", "amount": 100000, "payment_method": "BANK", "reference": "DON-001"},
             {"description": "Asset Disposal Gain", "category": "Asset Disposal Gain or Loss", "amount": 150000, "payment_method": "BANK", "reference": "DIS-001"},
-            {"description": "Late Payment Penalty", "category": "Penalties / Fines", "amount": 25000, "payment_method": "BANK", "reference": "PEN-001"},
+            {"description": "Late Payment Penalty", "category": "Penalties / Fines", "amount": 25000, "payment_method": "BANK", "reference": "PEN-003"},
             {"description": "Bad Debt Write-off", "category": "Write-offs", "amount": 75000, "payment_method": "OTHER", "reference": "WO-001"},
             {"description": "Rounding Adjustment", "category": "Rounding Differences", "amount": 5, "payment_method": "OTHER", "reference": "ROUND-001"},
             {"description": "Opening Balance Adjustment", "category": "Opening Balances", "amount": 1000000, "payment_method": "OTHER", "reference": "OPEN-001"},
@@ -316,44 +318,27 @@ def create_comprehensive_transactions():
         for transaction in other_transactions:
             all_transactions.append({**transaction, "type": "OTHER"})
         
-        # Generate unique transaction IDs and create transactions
-        import uuid
-        transaction_id_counter = 1
-        
+        # Random dates within the last 12 months, inserted in bulk through the import pipeline
+        feed = []
         for transaction_data in all_transactions:
-            # Generate unique transaction ID
-            transaction_id = f"TXN-{str(uuid.uuid4())[:8].upper()}"
-            
-            # Check if transaction ID already exists
-            while db.query(Transaction).filter(Transaction.transaction_id == transaction_id).first():
-                transaction_id = f"TXN-{str(uuid.uuid4())[:8].upper()}"
-            
-            # Generate random date within the last 12 months
             random_days = random.randint(0, 365)
-            transaction_date = base_date + timedelta(days=random_days)
-            
-            # Create transaction object
-            transaction = Transaction(
-                transaction_id=transaction_id,
-                description=transaction_data["description"],
-                type=TransactionType(transaction_data["type"]),
-                category=transaction_data["category"],
-                amount=transaction_data["amount"],
-                payment_method=PaymentMethod(transaction_data["payment_method"]),
-                reference=transaction_data["reference"],
-                account="Business Account",
-                notes=f"Sample transaction for {transaction_data['category']}",
-                created_by="comprehensive-sample-script",
-                transaction_date=transaction_date
-            )
-            
-            # Add to database
-            db.add(transaction)
-            print(f"Added {transaction_data['type']}: {transaction_data['description']} - {transaction_id}")
+            feed.append({
+                **transaction_data,
+                "account": "Business Account",
+                "notes": f"Sample transaction for {transaction_data['category']}",
+                "created_by": "comprehensive-sample-script",
+                "transaction_date": (base_date + timedelta(days=random_days)).isoformat()
+            })
+        result = ingest_transactions(db, enumerate(feed, start=1))
         
-        # Commit all transactions
-        db.commit()
-        print(f"\n✅ Successfully created {len(all_transactions)} comprehensive sample transactions!")
+        for line in result["results"]:
+            transaction_data = all_transactions[line["line"] - 1]
+            if line["status"] == "created":
+                print(f"Added {transaction_data['type']}: {transaction_data['description']} - {line['transaction_id']}")
+            else:
+                print(f"Skipped {transaction_data['type']}: {transaction_data['description']} - {line.get('error')}")
+        
+        print(f"\n✅ Successfully created {result['created']} comprehensive sample transactions!")
         print(f"📊 Transaction breakdown:")
         print(f"   - Revenue: {len(revenue_transactions)}")
         print(f"   - Expenses: {len(expense_transactions)}")
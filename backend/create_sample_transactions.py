@@ -13,7 +13,7 @@ from sqlalchemy.orm import Session
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database import get_db
-from models.transaction import Transaction, TransactionType, PaymentMethod
+from services.transaction_import import ingest_transactions
 
 def create_sample_transactions():
     """Create sample transactions in the database"""
@@ -136,40 +136,17 @@ def create_sample_transactions():
             }
         ]
         
-        # Generate unique transaction IDs
-        import uuid
-        transaction_id_counter = 1
+        # Insert in bulk through the import pipeline (IDs, classification, rollup, dedupe)
+        result = ingest_transactions(db, enumerate(sample_transactions, start=1))
         
-        for transaction_data in sample_transactions:
-            # Generate unique transaction ID
-            transaction_id = f"TXN-{str(uuid.uuid4())[:8].upper()}"
-            
-            # Check if transaction ID already exists
-            while db.query(Transaction).filter(Transaction.transaction_id == transaction_id).first():
-                transaction_id = f"TXN-{str(uuid.uuid4())[:8].upper()}"
-            
-            # Create transaction object
-            transaction = Transaction(
-                transaction_id=transaction_id,
-                description=transaction_data["description"],
-                type=TransactionType(transaction_data["type"]),
-                category=transaction_data["category"],
-                amount=transaction_data["amount"],
-                payment_method=PaymentMethod(transaction_data["payment_method"]),
-                reference=transaction_data["reference"],
-                account=transaction_data["account"],
-                notes=transaction_data["notes"],
-                created_by=transaction_data["created_by"],
-                transaction_date=datetime.now()
-            )
-            
-            # Add to database
-            db.add(transaction)
-            print(f"Added transaction: {transaction_data['description']} - {transaction_id}")
+        for line in result["results"]:
+            transaction_data = sample_transactions[line["line"] - 1]
+            if line["status"] == "created":
+                print(f"Added transaction: {transaction_data['description']} - {line['transaction_id']}")
+            else:
+                print(f"Skipped transaction: {transaction_data['description']} - {line.get('error')}")
         
-        # Commit all transactions
-        db.commit()
-        print(f"\n✅ Successfully created {len(sample_transactions)} sample transactions in the database!")
+        print(f"\n✅ Successfully created {result['created']} sample transactions in the database!")
         
     except Exception as e:
         print(f"❌ Error creating sample transactions: {str(e)}")
@@ -2,7 +2,9 @@ from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
-from database import get_db, Base, engine
+from database import get_db, engine
+from services.clickpesa_client import clickpesa_client
+from services.schema_upgrade import upgrade_database
 from datetime import datetime
 import os
 from dotenv import load_dotenv
@@ -24,6 +26,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Mount static files for uploaded images and videos
@@ -51,7 +54,12 @@ app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
 # Create database tables
 @app.on_event("startup")
 async def startup_event():
-    Base.metadata.create_all(bind=engine)
+    # Creates missing tables and adds columns/indexes newer than an existing database
+    upgrade_database(engine)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await clickpesa_client.aclose()
 
 @app.get("/api/v1/health")
 async def health_check():
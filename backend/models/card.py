@@ -37,7 +37,7 @@ class CardTransaction(Base):
     currency = Column(String(3), default="TZS")
     
     # Customer BillPay Control Number - generated per payment, used to identify which business
-    customer_billpay_control_number = Column(String(50), nullable=False)
+    customer_billpay_control_number = Column(String(50), nullable=False, index=True)
     
     # Payment reference - unique for each transaction
     payment_reference = Column(String(100), unique=True, nullable=False)
@@ -63,4 +63,22 @@ class CardTransaction(Base):
     blockchain_block = Column(Integer)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
+
+class CardPaymentCredit(Base):
+    __tablename__ = "card_payment_credits"
+    
+    # Append-only: one row per payment credited to a card, never updated or deleted.
+    # Distinct from the blockchain audit ledger (models.blockchain.CardBalanceLedger)
+    id = Column(Integer, primary_key=True, index=True)
+    card_id = Column(Integer, ForeignKey("cards.id"), nullable=False, index=True)
+    card_transaction_id = Column(Integer, ForeignKey("card_transactions.id"))
+    
+    # Idempotency key - a payment reference is credited at most once
+    payment_reference = Column(String(100), unique=True, nullable=False)
+    
+    amount = Column(Float, nullable=False)  # Positive for credits
+    balance_after = Column(Float, nullable=False)
+    entry_type = Column(String(50), default="customer_payment")
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
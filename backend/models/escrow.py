@@ -48,7 +48,7 @@ class Escrow(Base):
     
     # Status and Tracking
     status = Column(Enum(EscrowStatus), default=EscrowStatus.PENDING)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), index=True)  # Newest-first listing; InnoDB appends the id
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # Milestone Information (if payment_type is milestone)
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, BigInteger, DateTime
+from datetime import datetime
+from database import Base
+
+class IdSequence(Base):
+    __tablename__ = "id_sequences"
+    
+    name = Column(String(50), primary_key=True)  # e.g. escrow, staff, transaction
+    next_value = Column(BigInteger, nullable=False, default=1)  # First value not yet handed out to any process
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
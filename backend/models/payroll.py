@@ -243,6 +243,8 @@ class PayrollRecord(Base):
     status = Column(String(20), default="pending")  # pending, processed, paid
     processed_at = Column(DateTime)
     paid_at = Column(DateTime)
+    input_fingerprint = Column(String(40))  # Hash of the staff inputs this record was computed from
+    branch_id = Column(Integer, index=True)  # Staff's branch when the run computed this record; scopes branch operations
     
     # System Information
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -282,3 +284,61 @@ class PayrollCalculation(Base):
     
     # Relationships
     branch = relationship("Branch")
+    payment_files = relationship("PaymentBatchFile", back_populates="calculation", cascade="all, delete-orphan")
+
+class PaymentBatchFile(Base):
+    __tablename__ = "payment_batch_files"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    calculation_id = Column(Integer, ForeignKey("payroll_calculations.id"), nullable=False, index=True)
+    payroll_period = Column(String(20), nullable=False)
+    bank_name = Column(String(100), nullable=False)
+    
+    # File on disk
+    file_name = Column(String(255), nullable=False)
+    file_path = Column(String(500), nullable=False)
+    file_size = Column(Integer, default=0)
+    file_sha256 = Column(String(64))
+    
+    # Control totals repeated in the file trailer
+    line_count = Column(Integer, default=0)
+    total_amount = Column(Float, default=0)
+    account_hash_total = Column(String(20))  # Sum of account numbers mod 10^12, as banks use to verify a batch
+    
+    # System Information
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    calculation = relationship("PayrollCalculation", back_populates="payment_files")
+
+class TaxRuleSet(Base):
+    __tablename__ = "tax_rule_sets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    effective_from = Column(Date, nullable=False, index=True)  # Applies to payroll periods starting on or after this date
+    
+    # Employer levy rates (fractions, e.g. 0.035 for 3.5%)
+    sdl_rate = Column(Float, nullable=False, default=0)
+    wcf_rate = Column(Float, nullable=False, default=0)
+    nssf_employer_rate = Column(Float, nullable=False, default=0)
+    
+    notes = Column(Text)
+    
+    # System Information
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    brackets = relationship("TaxBracket", back_populates="rule_set", cascade="all, delete-orphan", order_by="TaxBracket.lower_bound")
+
+class TaxBracket(Base):
+    __tablename__ = "tax_brackets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    rule_set_id = Column(Integer, ForeignKey("tax_rule_sets.id"), nullable=False, index=True)
+    lower_bound = Column(Float, nullable=False, default=0)  # Monthly taxable income where the bracket starts
+    rate = Column(Float, nullable=False, default=0)  # Marginal PAYE rate above lower_bound (fraction)
+    
+    # Relationships
+    rule_set = relationship("TaxRuleSet", back_populates="brackets")
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Index
+from database import Base
+
+class SearchToken(Base):
+    __tablename__ = "search_tokens"
+    
+    id = Column(Integer, primary_key=True)
+    entity_type = Column(String(20), nullable=False)  # transaction, escrow, supplier
+    entity_id = Column(Integer, nullable=False)  # Primary key of the indexed row
+    token = Column(String(64), nullable=False)  # Lowercased word from one of the entity's searchable columns
+    
+    __table_args__ = (
+        # Token and prefix lookups: WHERE entity_type = ? AND token LIKE 'abc%'
+        Index("ix_search_tokens_lookup", "entity_type", "token", "entity_id"),
+        # Replacing an entity's tokens when it is written
+        Index("ix_search_tokens_entity", "entity_type", "entity_id"),
+    )
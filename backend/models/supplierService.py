@@ -1,8 +1,10 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from typing import List, Optional, Dict, Any
+from sqlalchemy import and_, func
+from typing import List, Optional, Dict, Any, Tuple
 from models.supplier import Supplier
 from models.supplierCategory import SupplierCategory
+from services.pagination import paginate
+from services import search_index
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +20,7 @@ class SupplierService:
             supplier = Supplier.from_dict(supplier_data)
             logger.info(f"Supplier object created: {supplier.name}")
             self.db.add(supplier)
+            search_index.index_entity(self.db, "supplier", supplier)
             logger.info("Supplier added to database session")
             self.db.commit()
             logger.info("Database commit successful")
@@ -49,6 +52,19 @@ class SupplierService:
         search: Optional[str] = None
     ) -> List[Supplier]:
         """Get suppliers with optional filtering"""
+        suppliers, _ = self.get_suppliers_page(skip=skip, limit=limit, country=country, category=category, search=search)
+        return suppliers
+    
+    def get_suppliers_page(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        country: Optional[str] = None,
+        category: Optional[str] = None,
+        search: Optional[str] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Supplier], Optional[str]]:
+        """Get a keyset-paginated page of suppliers and the cursor of the next page"""
         try:
             query = self.db.query(Supplier).filter(Supplier.is_active == True)
             
@@ -62,17 +78,9 @@ class SupplierService:
             
             # Search by name, city, region, or specialties
             if search:
-                search_term = f"%{search}%"
-                query = query.filter(
-                    or_(
-                        Supplier.name.ilike(search_term),
-                        Supplier.city.ilike(search_term),
-                        Supplier.region.ilike(search_term),
-                        Supplier.specialties.contains([search_term])
-                    )
-                )
-            
-            return query.offset(skip).limit(limit).all()
+                query = search_index.apply_search(query, "supplier", Supplier.id, search)
+            
+            return paginate(query, [(Supplier.id, False)], limit, cursor, skip)
         except Exception as e:
             logger.error(f"Error getting suppliers: {str(e)}")
             raise e
@@ -153,6 +161,7 @@ class SupplierService:
             supplier.status = supplier_data.get('status', supplier.status)
             supplier.verification_status = supplier_data.get('verificationStatus', supplier.verification_status)
             supplier.documents = supplier_data.get('documents', supplier.documents)
+            search_index.index_entity(self.db, "supplier", supplier)
             
             self.db.commit()
             self.db.refresh(supplier)
@@ -171,6 +180,7 @@ class SupplierService:
                 return False
             
             supplier.is_active = False
+            search_index.remove_entity(self.db, "supplier", supplier.id)
             self.db.commit()
             logger.info(f"Deleted supplier: {supplier.name}")
             return True
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, Enum, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -43,11 +43,23 @@ class Transaction(Base):
     reconciled_at = Column(DateTime, nullable=True)
     reconciled_by = Column(String(100), nullable=True)
     
+    # Statement lines from services.category_classifier, set whenever type or category is written
+    statement_bucket = Column(String(50), nullable=True)
+    cash_flow_line = Column(String(50), nullable=True)
+    cash_flow_activity = Column(String(20), nullable=True)
+    
     # Timestamps
     transaction_date = Column(DateTime, nullable=False, default=func.now())
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        # Sort key of the transaction list's keyset pagination
+        Index("ix_transactions_date_id", "transaction_date", "id"),
+        # Duplicate detection when importing bank and mobile-money feeds
+        Index("ix_transactions_reference_account", "reference", "account"),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -64,7 +76,73 @@ class Transaction(Base):
             "is_reconciled": self.is_reconciled,
             "reconciled_at": self.reconciled_at.isoformat() if self.reconciled_at else None,
             "reconciled_by": self.reconciled_by,
+            "statement_bucket": self.statement_bucket,
             "transaction_date": self.transaction_date.isoformat() if self.transaction_date else None,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+
+class LedgerRollup(Base):
+    """Monthly totals of transactions per (type, statement bucket, category), maintained on every transaction write"""
+    __tablename__ = "ledger_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String(7), nullable=False, index=True)  # YYYY-MM of transaction_date
+    type = Column(Enum(TransactionType), nullable=False)
+    bucket = Column(String(50), nullable=False)  # Statement line, e.g. current_assets, cost_of_goods_sold
+    category = Column(String(100), nullable=False, default="")  # Transaction category, "" when none
+    cash_flow_line = Column(String(50), nullable=True)  # Classification of the category, see services.category_classifier
+    cash_flow_activity = Column(String(20), nullable=True)
+    amount = Column(Float, nullable=False, default=0)  # Sum of transaction amounts
+    transaction_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("period", "type", "bucket", "category", name="uq_ledger_rollup_key"),
+    )
+
+    def to_dict(self):
+        return {
+            "period": self.period,
+            "type": self.type.value if self.type else None,
+            "bucket": self.bucket,
+            "category": self.category,
+            "amount": self.amount,
+            "transaction_count": self.transaction_count
+        }
+
+class LedgerPeriodClose(Base):
+    """
+    A closed month: transactions dated on or before the latest closed month can't be created, edited or deleted.
+    Every transaction write reads this table, so it is created at startup (services.schema_upgrade) and by
+    rebuild_ledger_rollup.py.
+    """
+    __tablename__ = "ledger_period_closes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String(7), nullable=False, unique=True)  # YYYY-MM
+    closed_by = Column(String(100), nullable=True)
+    closed_at = Column(DateTime, default=func.now())
+
+    def to_dict(self):
+        return {
+            "period": self.period,
+            "closed_by": self.closed_by,
+            "closed_at": self.closed_at.isoformat() if self.closed_at else None
+        }
+
+class LedgerSnapshot(Base):
+    """Cumulative balance per (type, statement bucket) at the end of a closed month"""
+    __tablename__ = "ledger_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String(7), nullable=False, index=True)
+    type = Column(Enum(TransactionType), nullable=False)
+    bucket = Column(String(50), nullable=False)
+    balance = Column(Float, nullable=False, default=0)  # Sum of all transaction amounts up to the end of the period
+    transaction_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("period", "type", "bucket", name="uq_ledger_snapshot_key"),
+    )
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Script to rebuild the monthly ledger rollup from the transactions table
+Run after bulk-loading transactions outside the API, or to repair the rollup.
+Also brings the transaction schema up to date (classification columns, and the
+rollup, period close and snapshot tables transaction writes depend on) when the
+API hasn't been started against this database yet.
+"""
+
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal, engine
+from models.transaction import Base
+from services.schema_upgrade import upgrade_schema
+from services.ledger_rollup import rebuild
+from services.period_close import rebuild_snapshots
+from services.category_classifier import category_classifier
+
+def rebuild_ledger_rollup():
+    """Upgrade the transaction schema if needed, refresh stored classifications and recompute the rollup"""
+    upgrade_schema(engine, Base.metadata)  # Idempotent; only adds missing tables, columns and indexes
+    db = SessionLocal()
+    try:
+        pairs = category_classifier.reclassify_transactions(db)
+        print(f"✅ Classified {pairs} transaction type/category pairs")
+        rows = rebuild(db)
+        print(f"✅ Ledger rollup rebuilt: {rows} rows")
+        snapshots = rebuild_snapshots(db)
+        print(f"✅ Period-close snapshots rebuilt: {snapshots}")
+    except Exception as e:
+        print(f"❌ Error rebuilding ledger rollup: {str(e)}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild_ledger_rollup()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Script to rebuild the search index from the transactions, escrows and suppliers tables
+Run after loading rows outside the API (e.g. insert_sample_suppliers_data.py), or to repair the index
+Usage: python rebuild_search_index.py [transaction|escrow|supplier]
+"""
+
+import sys
+import os
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import SessionLocal, engine
+from models.search_index import SearchToken
+from services.search_index import rebuild, SEARCH_FIELDS
+
+def rebuild_search_index(entity_type=None):
+    """Create the index table if needed and re-index one entity type, or all of them"""
+    if entity_type and entity_type not in SEARCH_FIELDS:
+        print(f"❌ Unknown entity type: {entity_type} (expected one of {', '.join(SEARCH_FIELDS)})")
+        return
+    SearchToken.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        for name, tokens in rebuild(db, entity_type).items():
+            print(f"✅ {name} search index rebuilt: {tokens} tokens")
+    except Exception as e:
+        print(f"❌ Error rebuilding search index: {str(e)}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild_search_index(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from database import get_db
 from models.card import Card, CardTransaction
 from pydantic import BaseModel
 from typing import Optional, List
 import uuid
-from routers.clickpesa import get_clickpesa_token
-import httpx
+from services.clickpesa_client import clickpesa_client
+from services.card_payments import process_payment_webhook
 
 router = APIRouter()
 
@@ -102,7 +103,6 @@ async def create_customer_payment(
     # Generate unique Customer BillPay Control Number for this business
     customer_billpay_control_number = None
     try:
-        token = get_clickpesa_token()
         payment_reference = f"PAY{card_id}{uuid.uuid4().hex[:12].upper()}"
         
         # Create Customer BillPay Control Number via ClickPesa API
@@ -119,17 +119,8 @@ async def create_customer_payment(
         if payment_data.customer_email:
             billpay_request["customerEmail"] = payment_data.customer_email
         
-        response = httpx.post(
-            "https://api.clickpesa.com/third-parties/billpay/create-customer-control-number",
-            headers={
-                'Authorization': token,
-                'Content-Type': 'application/json'
-            },
-            json=billpay_request,
-            timeout=10.0
-        )
-        response.raise_for_status()
-        billpay_response = response.json()
+        # Pooled connection and cached token: no token round trip or new TLS handshake per payment
+        billpay_response = await clickpesa_client.create_customer_control_number(billpay_request)
         customer_billpay_control_number = billpay_response.get('billPayNumber')
         
     except Exception as e:
@@ -171,38 +162,11 @@ async def payment_webhook(request: Request, db: Session = Depends(get_db)):
     """
     Webhook endpoint to receive payment notifications from ClickPesa
     When a payment is received, we match the customer_billpay_control_number
-    to find which business it belongs to and credit their account
+    to find which business it belongs to and credit their account once per
+    payment reference, however often the notification is delivered
     """
     data = await request.json()
-    
-    # Extract payment details from webhook
-    payment_reference = data.get('paymentReference') or data.get('reference')
-    billpay_number = data.get('billPayNumber') or data.get('controlNumber')
-    amount = data.get('amount', 0)
-    status = data.get('status', 'pending')
-    
-    # Find transaction by customer BillPay control number
-    transaction = db.query(CardTransaction).filter(
-        CardTransaction.customer_billpay_control_number == billpay_number
-    ).first()
-    
-    if not transaction:
-        print(f"Transaction not found for control number: {billpay_number}")
-        return {"status": "not_found"}
-    
-    # Update transaction status
-    transaction.status = status
-    transaction.payment_reference = payment_reference
-    transaction.clickpesa_response = str(data)
-    
-    if status == 'completed':
-        # Credit the business account
-        card = db.query(Card).filter(Card.id == transaction.card_id).first()
-        if card:
-            card.balance += amount
-            db.commit()
-    
-    return {"status": "success"}
+    return await run_in_threadpool(process_payment_webhook, db, data)
 
 @router.get("/{card_id}/transactions")
 async def get_card_transactions(
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session, joinedload
 from database import get_db
 from models.escrow import Escrow, EscrowMilestone, EscrowStatus, PaymentType
 from services.escrow_smart_contract import escrow_smart_contract
 from services.document_generator import document_generator
+from services.id_allocator import id_allocator
+from services.pagination import paginate, InvalidCursor, NEXT_CURSOR_HEADER
+from services import search_index
 from typing import List, Optional
 from datetime import datetime
 import json
@@ -14,20 +17,9 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # Helper function to generate escrow ID
-def generate_escrow_id(db: Session) -> str:
+def generate_escrow_id() -> str:
     """Generate a unique escrow ID in ESC-XXX format"""
-    last_escrow = db.query(Escrow).order_by(Escrow.id.desc()).first()
-    if last_escrow:
-        # Extract number from existing escrow_id and increment
-        try:
-            last_number = int(last_escrow.escrow_id.split('-')[1])
-            new_number = last_number + 1
-        except (IndexError, ValueError):
-            new_number = 1
-    else:
-        new_number = 1
-    
-    return f"ESC-{new_number:03d}"
+    return id_allocator.next_id("escrow")
 
 # Create Escrow
 @router.post("/", status_code=status.HTTP_201_CREATED)
@@ -38,7 +30,7 @@ async def create_escrow(
     """Create a new escrow account"""
     try:
         # Generate unique escrow ID
-        escrow_id = generate_escrow_id(db)
+        escrow_id = generate_escrow_id()
         
         # Validate required fields
         required_fields = ["title", "payerName", "payerEmail", "payerPhone", "payeeName", "payeeEmail", "payeePhone", "totalAmount"]
@@ -110,6 +102,7 @@ async def create_escrow(
         )
         
         db.add(escrow)
+        search_index.index_entity(db, "escrow", escrow)
         db.commit()
         db.refresh(escrow)
         
@@ -153,10 +146,12 @@ async def create_escrow(
 # Get All Escrows
 @router.get("/", response_model=List[dict])
 async def get_escrows(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
     status_filter: Optional[EscrowStatus] = Query(None),
-    search: Optional[str] = Query(None),
+    search: Optional[str] = Query(None, description='Words or word prefixes; "quoted" words match whole words only'),
     db: Session = Depends(get_db)
 ):
     """Get all escrow accounts with optional filtering"""
@@ -167,18 +162,14 @@ async def get_escrows(
         if status_filter:
             query = query.filter(Escrow.status == status_filter)
         
-        # Apply search filter
+        # Apply search filter on title, payer, payee and escrow ID words
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                Escrow.title.ilike(search_term) |
-                Escrow.payer_name.ilike(search_term) |
-                Escrow.payee_name.ilike(search_term) |
-                Escrow.escrow_id.ilike(search_term)
-            )
+            query = search_index.apply_search(query, "escrow", Escrow.id, search)
         
-        # Apply pagination
-        escrows = query.offset(skip).limit(limit).all()
+        # Apply keyset pagination, newest first
+        escrows, next_cursor = paginate(query, [(Escrow.created_at, True), (Escrow.id, True)], limit, cursor, skip)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
         
         # Convert to dictionaries and include milestones for milestone payments
         result = []
@@ -196,6 +187,8 @@ async def get_escrows(
         
         return result
         
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching escrows: {str(e)}")
         raise HTTPException(
@@ -343,6 +336,7 @@ async def update_escrow(
             escrow.additional_notes = escrow_data["additionalNotes"]
         
         escrow.updated_at = datetime.now()
+        search_index.index_entity(db, "escrow", escrow)
         
         db.commit()
         db.refresh(escrow)
@@ -381,7 +375,8 @@ async def delete_escrow(
         # Delete associated milestones first
         db.query(EscrowMilestone).filter(EscrowMilestone.escrow_id == escrow.id).delete()
         
-        # Delete escrow
+        # Delete escrow and its search tokens
+        search_index.remove_entity(db, "escrow", escrow.id)
         db.delete(escrow)
         db.commit()
         
@@ -1,13 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from database import get_db
-from models.payroll import Staff, Branch, Department, Role, PayrollRecord, PayrollCalculation, EmploymentStatus, EmploymentType, MaritalStatus, Gender
+from models.payroll import Staff, Branch, Department, Role, PayrollRecord, PayrollCalculation, PaymentBatchFile, TaxRuleSet, TaxBracket, EmploymentStatus, EmploymentType, MaritalStatus, Gender
+from services.payroll_jobs import run_payroll, run_payroll_incremental, payroll_jobs
+from services.tax_rules import tax_rules
+from services.payroll_simulation import simulate_payroll
+from services.payroll_export import detailed_records_query, stream_csv, stream_xlsx, XLSX_EXPORT_AVAILABLE
+from services.payroll_bank_files import generate_payment_files, current_payment_files, remove_payment_files, PAYROLL_FILES_DIR
+from services.payslip_generator import write_payslips_zip
+from services.payroll_store import scope_calculation, scope_records_query, scope_calculations_query, release_branch
+from services.org_directory import org_directory
+from services.org_tree import org_tree
+from services.id_allocator import id_allocator
+from services.pagination import paginate, InvalidCursor, NEXT_CURSOR_HEADER
+from services.staff_import import STAFF_JSON_NUMERIC_KEYS, normalize_staff_json, map_staff_fields, import_staff, parse_staff_csv
 from pydantic import BaseModel, validator
 from typing import List, Optional
 from datetime import datetime, date
 import logging
 import json
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -234,6 +249,41 @@ class StaffResponse(BaseModel):
 class PayrollProcessRequest(BaseModel):
     payroll_period: str  # Format: YYYY-MM
     branch_id: Optional[int] = None
+    incremental: Optional[bool] = False  # Only recompute staff changed since the period's last run
+
+class PayrollSimulationRequest(BaseModel):
+    payroll_period: Optional[str] = None  # Format: YYYY-MM, selects the tax rules
+    branch_id: Optional[int] = None
+    department_id: Optional[int] = None
+    role_id: Optional[int] = None
+    salary_increase_percent: float = 0
+    salary_increase_amount: float = 0
+    allowance_increase_percent: float = 0
+    allowance_increase_amount: float = 0
+
+class TaxBracketCreate(BaseModel):
+    lower_bound: float  # Monthly taxable income where the bracket starts
+    rate: float  # Marginal rate as a fraction, e.g. 0.08
+
+class TaxRuleSetCreate(BaseModel):
+    name: str
+    effective_from: date
+    sdl_rate: float
+    wcf_rate: float
+    nssf_employer_rate: float
+    brackets: List[TaxBracketCreate]
+    notes: Optional[str] = None
+
+    @validator('brackets')
+    def validate_brackets(cls, v):
+        if not v:
+            raise ValueError('At least one tax bracket is required')
+        bounds = [b.lower_bound for b in v]
+        if len(set(bounds)) != len(bounds):
+            raise ValueError('Tax bracket lower bounds must be unique')
+        if any(b.lower_bound < 0 or not 0 <= b.rate <= 1 for b in v):
+            raise ValueError('Tax bracket bounds must be non-negative and rates between 0 and 1')
+        return v
 
 class PayrollRecordResponse(BaseModel):
     id: int
@@ -273,47 +323,7 @@ async def get_branches(
     db: Session = Depends(get_db)
 ):
     """Get all branches with optional search"""
-    query = db.query(Branch).filter(Branch.is_active == True)
-    
-    if search:
-        query = query.filter(
-            or_(
-                Branch.name.ilike(f"%{search}%"),
-                Branch.city.ilike(f"%{search}%"),
-                Branch.state.ilike(f"%{search}%")
-            )
-        )
-    
-    branches = query.offset(skip).limit(limit).all()
-    
-    # Transform to match frontend expectations
-    result = []
-    for branch in branches:
-        # Count employees in this branch
-        employee_count = db.query(Staff).filter(Staff.branch_id == branch.id).count()
-        
-        result.append({
-            "id": str(branch.id),
-            "name": branch.name,
-            "address": branch.address or "",
-            "phone": branch.phone or "",
-            "email": branch.email or "",
-            "manager": branch.manager or "No Manager",
-            "employees": employee_count,
-            "status": "active" if branch.is_active else "inactive",
-            "establishedDate": branch.created_at.strftime("%Y-%m-%d") if branch.created_at else "",
-            "monthlyBudget": 0,  # TODO: Calculate from departments
-            "annualBudget": 0,  # TODO: Calculate from departments
-            "departments": [],  # TODO: Get actual departments
-            "staff": [],  # TODO: Get actual staff
-            "attendance": {
-                "available": employee_count,
-                "onLeave": 0,
-                "absent": 0
-            }
-        })
-    
-    return result
+    return org_directory.branches(db, skip=skip, limit=limit, search=search)
 
 @router.post("/branches")
 async def create_branch(branch_data: dict, db: Session = Depends(get_db)):
@@ -338,6 +348,8 @@ async def create_branch(branch_data: dict, db: Session = Depends(get_db)):
     db_branch = Branch(**valid_fields)
     db.add(db_branch)
     db.commit()
+    org_directory.invalidate()
+    org_tree.invalidate()
     db.refresh(db_branch)
     
     # Return in the format the frontend expects
@@ -380,46 +392,7 @@ async def get_departments(
     db: Session = Depends(get_db)
 ):
     """Get all departments with optional filtering"""
-    from sqlalchemy.orm import joinedload
-    
-    query = db.query(Department).filter(Department.is_active == True)
-    
-    if branch_id:
-        query = query.filter(Department.branch_id == branch_id)
-    
-    if search:
-        query = query.filter(Department.name.ilike(f"%{search}%"))
-    
-    departments = query.offset(skip).limit(limit).all()
-    
-    # Transform to match frontend expectations
-    result = []
-    for dept in departments:
-        # Get branch name
-        branch = db.query(Branch).filter(Branch.id == dept.branch_id).first()
-        branch_name = branch.name if branch else f"Branch {dept.branch_id}"
-        
-        # Get manager name
-        manager_name = dept.manager or "No Manager"
-        
-        result.append({
-            "id": str(dept.id),
-            "name": dept.name,
-            "description": dept.description or "",
-            "manager": manager_name,
-            "employees": 0,  # TODO: Count actual employees
-            "branch": branch_name,
-            "branch_id": dept.branch_id,  # Add branch_id for frontend filtering
-            "status": "active" if dept.is_active else "inactive",
-            "phone": dept.phone or "",
-            "email": dept.email or "",
-            "establishedDate": dept.created_at.strftime("%Y-%m-%d") if dept.created_at else "",
-            "budget": dept.budget,
-            "objectives": json.loads(dept.objectives) if dept.objectives else [],
-            "teamMembers": []  # TODO: Get actual team members
-        })
-    
-    return result
+    return org_directory.departments(db, skip=skip, limit=limit, branch_id=branch_id, search=search)
 
 @router.post("/departments")
 async def create_department(department_data: dict, db: Session = Depends(get_db)):
@@ -459,6 +432,8 @@ async def create_department(department_data: dict, db: Session = Depends(get_db)
     db_department = Department(**valid_fields)
     db.add(db_department)
     db.commit()
+    org_directory.invalidate()
+    org_tree.invalidate()
     db.refresh(db_department)
     
     # Return in the format the frontend expects
@@ -489,86 +464,9 @@ async def get_roles(
 ):
     """Get all roles with optional filtering"""
     try:
-        query = db.query(Role).filter(Role.is_active == True)
-        
-        if department_id:
-            query = query.filter(Role.department_id == department_id)
-        
-        if search:
-            query = query.filter(Role.name.ilike(f"%{search}%"))
-        
-        roles = query.offset(skip).limit(limit).all()
-        
-        # Transform to match frontend expectations
-        result = []
-        for role in roles:
-            try:
-                # Get department name
-                department = db.query(Department).filter(Department.id == role.department_id).first()
-                department_name = department.name if department else f"Department {role.department_id}"
-                
-                # Get branch name from department
-                branch_name = "Unknown Branch"
-                if department and department.branch_id:
-                    branch = db.query(Branch).filter(Branch.id == department.branch_id).first()
-                    branch_name = branch.name if branch else f"Branch {department.branch_id}"
-                
-                # Safely parse JSON fields
-                key_skills = []
-                responsibilities = []
-                requirements = []
-                
-                if role.key_skills:
-                    try:
-                        key_skills = json.loads(role.key_skills)
-                    except json.JSONDecodeError:
-                        print(f"Warning: Invalid JSON in key_skills for role {role.id}: {role.key_skills}")
-                        key_skills = []
-                
-                if role.responsibilities:
-                    try:
-                        responsibilities = json.loads(role.responsibilities)
-                    except json.JSONDecodeError:
-                        print(f"Warning: Invalid JSON in responsibilities for role {role.id}: {role.responsibilities}")
-                        responsibilities = []
-                
-                if role.requirements:
-                    try:
-                        requirements = json.loads(role.requirements)
-                    except json.JSONDecodeError:
-                        print(f"Warning: Invalid JSON in requirements for role {role.id}: {role.requirements}")
-                        requirements = []
-                
-                result.append({
-                    "id": str(role.id),
-                    "name": role.name,
-                    "description": role.description or "",
-                    "department": department_name,
-                    "department_id": role.department_id,  # Add department_id for frontend filtering
-                    "level": role.level or "Mid",
-                    "branch": branch_name,
-                    "branch_id": department.branch_id if department else None,  # Add branch_id for frontend
-                    "reports_to": role.reports_to or "",
-                    "status": role.status or "active",
-                    "experience_required": role.experience_required or "",
-                    "education_required": role.education_required or "",
-                    "key_skills": key_skills,
-                    "minSalary": role.min_salary or 0,
-                    "maxSalary": role.max_salary or 0,
-                    "responsibilities": responsibilities,
-                    "requirements": requirements,
-                    "createdDate": role.created_at.strftime("%Y-%m-%d") if role.created_at else "",
-                    "employees": 0  # TODO: Count actual employees
-                })
-            except Exception as e:
-                print(f"Error processing role {role.id}: {str(e)}")
-                # Skip this role and continue with others
-                continue
-        
-        return result
-    
+        return org_directory.roles(db, skip=skip, limit=limit, department_id=department_id, search=search)
     except Exception as e:
-        print(f"Error fetching roles: {str(e)}")
+        logger.error(f"Error fetching roles: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching roles: {str(e)}")
 
 @router.post("/roles")
@@ -614,6 +512,7 @@ async def create_role(role_data: dict, db: Session = Depends(get_db)):
     db_role = Role(**valid_fields)
     db.add(db_role)
     db.commit()
+    org_directory.invalidate()
     db.refresh(db_role)
     
     # Return in the format the frontend expects
@@ -634,7 +533,7 @@ async def create_role(role_data: dict, db: Session = Depends(get_db)):
         "responsibilities": json.loads(db_role.responsibilities) if db_role.responsibilities else [],
         "requirements": json.loads(db_role.requirements) if db_role.requirements else [],
         "createdDate": role_data.get('created_date') or (db_role.created_at.strftime("%Y-%m-%d") if db_role.created_at else ""),
-        "employees": 0  # TODO: Count actual employees
+        "employees": org_directory.role_employees(db, db_role.id)
     }
 
 @router.put("/roles/{role_id}")
@@ -707,6 +606,7 @@ async def update_role(role_id: int, role_data: dict, db: Session = Depends(get_d
                     setattr(role, field, value)
         
         db.commit()
+        org_directory.invalidate()
         db.refresh(role)
         
         # Get department and branch names for response
@@ -740,7 +640,7 @@ async def update_role(role_id: int, role_data: dict, db: Session = Depends(get_d
             "responsibilities": json.loads(role.responsibilities) if role.responsibilities else [],
             "requirements": json.loads(role.requirements) if role.requirements else [],
             "createdDate": role.created_at.strftime("%Y-%m-%d") if role.created_at else "",
-            "employees": 0
+            "employees": org_directory.role_employees(db, role.id)
         }
     
     except HTTPException:
@@ -771,14 +671,34 @@ async def delete_role(role_id: int, db: Session = Depends(get_db)):
     # Soft delete by setting is_active to False
     role.is_active = False
     db.commit()
+    org_directory.invalidate()
     
     return {"message": "Role deleted successfully"}
 
+def staff_with_names_query(db: Session):
+    """Staff query with department, role and branch names projected through outer joins"""
+    return (
+        db.query(Staff, Department.name, Role.name, Branch.name)
+        .outerjoin(Department, Department.id == Staff.department_id)
+        .outerjoin(Role, Role.id == Staff.role_id)
+        .outerjoin(Branch, Branch.id == Staff.branch_id)
+    )
+
+def attach_names(row) -> Staff:
+    """Copy the projected names of a staff_with_names_query row onto the Staff instance"""
+    member, department_name, role_name, branch_name = row
+    member.department_name = department_name
+    member.role_name = role_name
+    member.branch_name = branch_name
+    return member
+
 # Staff endpoints
 @router.get("/staff", response_model=List[StaffResponse])
 async def get_staff(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     branch_id: Optional[int] = None,
     department_id: Optional[int] = None,
     employment_status: Optional[EmploymentStatus] = None,
@@ -786,7 +706,7 @@ async def get_staff(
     db: Session = Depends(get_db)
 ):
     """Get all staff with optional filtering"""
-    query = db.query(Staff).filter(Staff.is_active == True)
+    query = staff_with_names_query(db).filter(Staff.is_active == True)
     
     if branch_id:
         query = query.filter(Staff.branch_id == branch_id)
@@ -807,73 +727,53 @@ async def get_staff(
             )
         )
     
-    staff = query.offset(skip).limit(limit).all()
+    # Names come from the joins; JSON columns are normalized when staff are written
+    try:
+        rows, next_cursor = paginate(query, [(Staff.id, False)], limit, cursor, skip)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [attach_names(row) for row in rows]
+
+@router.post("/staff/import")
+async def import_staff_members(request: Request, dry_run: bool = False, db: Session = Depends(get_db)):
+    """
+    Bulk-create staff from a CSV upload (multipart "file" field or text/csv body)
+    or a JSON array of staff objects. Invalid rows are skipped and reported.
+    """
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None:
+                raise HTTPException(status_code=400, detail="Upload a CSV file in the 'file' field")
+            rows = await run_in_threadpool(parse_staff_csv, await upload.read())
+        elif content_type.startswith("text/csv"):
+            rows = await run_in_threadpool(parse_staff_csv, await request.body())
+        else:
+            rows = await request.json()
+    except HTTPException:
+        raise
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse staff import: {str(e)}")
     
-    # Add names to each staff member
-    for member in staff:
-        # Get department name
-        if member.department_id:
-            dept = db.query(Department).filter(Department.id == member.department_id).first()
-            member.department_name = dept.name if dept else None
-        
-        # Get role name
-        if member.role_id:
-            role = db.query(Role).filter(Role.id == member.role_id).first()
-            member.role_name = role.name if role else None
-        
-        # Get branch name
-        if member.branch_id:
-            branch = db.query(Branch).filter(Branch.id == member.branch_id).first()
-            member.branch_name = branch.name if branch else None
-        
-        # Parse JSON fields and ensure amounts are floats
-        json_fields = ['allowances_detail', 'social_security', 'insurance', 'loans', 'documents']
-        for field in json_fields:
-            if hasattr(member, field) and getattr(member, field):
-                try:
-                    parsed_data = json.loads(getattr(member, field))
-                    if isinstance(parsed_data, list):
-                        # Convert amounts to floats for proper decimal handling
-                        if field == 'allowances_detail':
-                            for item in parsed_data:
-                                if isinstance(item, dict) and 'amount' in item:
-                                    try:
-                                        item['amount'] = float(item['amount'])
-                                    except (ValueError, TypeError):
-                                        pass
-                        elif field == 'social_security':
-                            for item in parsed_data:
-                                if isinstance(item, dict) and 'percentage' in item:
-                                    try:
-                                        item['percentage'] = float(item['percentage'])
-                                    except (ValueError, TypeError):
-                                        pass
-                        elif field == 'insurance':
-                            for item in parsed_data:
-                                if isinstance(item, dict) and 'annualAmount' in item:
-                                    try:
-                                        item['annualAmount'] = float(item['annualAmount'])
-                                    except (ValueError, TypeError):
-                                        pass
-                        elif field == 'loans':
-                            for item in parsed_data:
-                                if isinstance(item, dict):
-                                    if 'amount' in item:
-                                        try:
-                                            item['amount'] = float(item['amount'])
-                                        except (ValueError, TypeError):
-                                            pass
-                                    if 'monthlyDeduction' in item:
-                                        try:
-                                            item['monthlyDeduction'] = float(item['monthlyDeduction'])
-                                        except (ValueError, TypeError):
-                                            pass
-                        # Store the parsed data back as JSON string with float amounts
-                        setattr(member, field, json.dumps(parsed_data))
-                except (json.JSONDecodeError, TypeError):
-                    pass  # Keep original value if parsing fails
-    
-    return staff
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Staff import must be a JSON array or CSV file")
+    
+    try:
+        # Validation and the bulk insert block, so they run off the event loop
+        result = await run_in_threadpool(import_staff, db, rows, dry_run)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error importing staff: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error importing staff: {str(e)}")
+    
+    if result["imported"]:
+        org_directory.invalidate()
+        org_tree.invalidate()
+    return result
 
 @router.post("/staff", response_model=StaffResponse)
 async def create_staff(staff_data: dict, db: Session = Depends(get_db)):
@@ -881,59 +781,7 @@ async def create_staff(staff_data: dict, db: Session = Depends(get_db)):
     print(f"Received staff data: {staff_data}")
     
     # Map frontend field names to backend field names
-    field_mapping = {
-        'firstName': 'first_name',
-        'lastName': 'last_name',
-        'middleName': 'middle_name',
-        'dateOfBirth': 'date_of_birth',
-        'phone': 'phone',
-        'alternativePhone': 'alternative_phone',
-        'emergencyContactName1': 'emergency_contact_name',
-        'emergencyContactRelationship1': 'emergency_contact_relationship',
-        'emergencyContactPhone1': 'emergency_contact_phone',
-        'emergencyContactName2': 'emergency_contact2_name',
-        'emergencyContactRelationship2': 'emergency_contact2_relationship',
-        'emergencyContactPhone2': 'emergency_contact2_phone',
-        'linkedin': 'linkedin_url',
-        'twitter': 'twitter_url',
-        'instagram': 'instagram_url',
-        'addressCity': 'address_city',
-        'addressState': 'address_state',
-        'addressCountry': 'address_country',
-        'addressPostalCode': 'address_postal_code',
-        'hireDate': 'hire_date',
-        'probationEndDate': 'probation_end_date',
-        'contractEndDate': 'contract_end_date',
-        'basicSalary': 'basic_salary',
-        'allowances': 'allowances',
-        'employmentType': 'employment_type',
-        'maritalStatus': 'marital_status',
-        'reportingManager': 'reporting_manager_id',
-        'department': 'department_id',  # Form sends department as ID
-        'branch': 'branch_id',         # Form sends branch as ID
-        'position': 'role_id',         # Form sends position as role ID
-        'bankName': 'bank_name',
-        'bankAccount': 'bank_account',
-        'taxId': 'tax_id',
-        'workSchedule': 'work_schedule',
-        'holidayEntitlement': 'holiday_entitlement',
-        'leaveStatus': 'leave_status',
-        'leaveEndDate': 'leave_end_date',
-        'documents': 'documents'
-    }
-    
-    # Apply field mapping
-    mapped_data = {}
-    for frontend_field, backend_field in field_mapping.items():
-        if frontend_field in staff_data:
-            mapped_data[backend_field] = staff_data[frontend_field]
-    
-    # Add any remaining unmapped fields
-    for field, value in staff_data.items():
-        if field not in field_mapping:
-            mapped_data[field] = value
-    
-    staff_data = mapped_data
+    staff_data = map_staff_fields(staff_data)
     
     # Auto-generate employee_id and employee_number if not provided
     if 'employee_id' not in staff_data or not staff_data.get('employee_id'):
@@ -945,9 +793,7 @@ async def create_staff(staff_data: dict, db: Session = Depends(get_db)):
     
     if 'employee_number' not in staff_data or not staff_data.get('employee_number'):
         # Generate employee_number as sequential number
-        last_staff = db.query(Staff).order_by(Staff.id.desc()).first()
-        next_number = (last_staff.id + 1) if last_staff else 1
-        staff_data['employee_number'] = f"EMP{next_number:04d}"
+        staff_data['employee_number'] = id_allocator.next_id("staff")
     
     # Set default employment_status if not provided
     if 'employment_status' not in staff_data:
@@ -1044,46 +890,10 @@ async def create_staff(staff_data: dict, db: Session = Depends(get_db)):
         basic_salary = float(staff_data.get('basic_salary', 0)) if staff_data.get('basic_salary') else 0
         staff_data['total_package'] = basic_salary + allowances_total
     
-    # Process JSON fields and convert amounts to floats
-    json_fields = ['allowances_detail', 'social_security', 'insurance', 'loans', 'documents']
-    for field in json_fields:
+    # Normalize JSON fields once here so reads can return them as stored
+    for field in STAFF_JSON_NUMERIC_KEYS:
         if field in staff_data and staff_data[field]:
-            # Convert amounts to floats for proper decimal handling
-            if field == 'allowances_detail' and isinstance(staff_data[field], list):
-                for item in staff_data[field]:
-                    if isinstance(item, dict) and 'amount' in item:
-                        try:
-                            item['amount'] = float(item['amount'])
-                        except (ValueError, TypeError):
-                            pass
-            elif field == 'social_security' and isinstance(staff_data[field], list):
-                for item in staff_data[field]:
-                    if isinstance(item, dict) and 'percentage' in item:
-                        try:
-                            item['percentage'] = float(item['percentage'])
-                        except (ValueError, TypeError):
-                            pass
-            elif field == 'insurance' and isinstance(staff_data[field], list):
-                for item in staff_data[field]:
-                    if isinstance(item, dict) and 'annualAmount' in item:
-                        try:
-                            item['annualAmount'] = float(item['annualAmount'])
-                        except (ValueError, TypeError):
-                            pass
-            elif field == 'loans' and isinstance(staff_data[field], list):
-                for item in staff_data[field]:
-                    if isinstance(item, dict) and 'amount' in item:
-                        try:
-                            item['amount'] = float(item['amount'])
-                        except (ValueError, TypeError):
-                            pass
-                    if isinstance(item, dict) and 'monthlyDeduction' in item:
-                        try:
-                            item['monthlyDeduction'] = float(item['monthlyDeduction'])
-                        except (ValueError, TypeError):
-                            pass
-            
-            staff_data[field] = json.dumps(staff_data[field])
+            staff_data[field] = normalize_staff_json(field, staff_data[field])
     
     # Filter out fields that don't exist in the Staff model
     valid_fields = {}
@@ -1097,6 +907,8 @@ async def create_staff(staff_data: dict, db: Session = Depends(get_db)):
         db_staff = Staff(**valid_fields)
         db.add(db_staff)
         db.commit()
+        org_directory.invalidate()
+        org_tree.invalidate()
         db.refresh(db_staff)
         return db_staff
     except Exception as e:
@@ -1116,82 +928,14 @@ async def create_staff(staff_data: dict, db: Session = Depends(get_db)):
 async def get_staff_member(staff_id: int, db: Session = Depends(get_db)):
     """Get a specific staff member"""
     try:
-        staff = db.query(Staff).filter(Staff.id == staff_id).first()
-        if not staff:
+        row = staff_with_names_query(db).filter(Staff.id == staff_id).first()
+        if not row:
             raise HTTPException(status_code=404, detail="Staff member not found")
         
-        print(f"DEBUG: Staff {staff_id} data from DB:")
-        print(f"  - allowances_detail: {staff.allowances_detail}")
-        print(f"  - allowances: {staff.allowances}")
-        print(f"  - basic_salary: {staff.basic_salary}")
-        print(f"  - total_package: {staff.total_package}")
-        print(f"  - social_security: {staff.social_security}")
-        print(f"  - insurance: {staff.insurance}")
-        print(f"  - loans: {staff.loans}")
-        print(f"  - paye_eligible: {staff.paye_eligible}")
-        
-        
-        # Add names to the staff member
-        if staff.department_id:
-            dept = db.query(Department).filter(Department.id == staff.department_id).first()
-            staff.department_name = dept.name if dept else None
-        
-        if staff.role_id:
-            role = db.query(Role).filter(Role.id == staff.role_id).first()
-            staff.role_name = role.name if role else None
-        
-        if staff.branch_id:
-            branch = db.query(Branch).filter(Branch.id == staff.branch_id).first()
-            staff.branch_name = branch.name if branch else None
-        
-        # Parse JSON fields and ensure amounts are floats
-        json_fields = ['allowances_detail', 'social_security', 'insurance', 'loans', 'documents']
-        for field in json_fields:
-            if hasattr(staff, field) and getattr(staff, field):
-                try:
-                    parsed_data = json.loads(getattr(staff, field))
-                    if isinstance(parsed_data, list):
-                        # Convert amounts to floats for proper decimal handling
-                        if field == 'allowances_detail':
-                            for item in parsed_data:
-                                if isinstance(item, dict) and 'amount' in item:
-                                    try:
-                                        item['amount'] = float(item['amount'])
-                                    except (ValueError, TypeError):
-                                        pass
-                        elif field == 'social_security':
-                            for item in parsed_data:
-                                if isinstance(item, dict) and 'percentage' in item:
-                                    try:
-                                        item['percentage'] = float(item['percentage'])
-                                    except (ValueError, TypeError):
-                                        pass
-                        elif field == 'insurance':
-                            for item in parsed_data:
-                                if isinstance(item, dict) and 'annualAmount' in item:
-                                    try:
-                                        item['annualAmount'] = float(item['annualAmount'])
-                                    except (ValueError, TypeError):
-                                        pass
-                        elif field == 'loans':
-                            for item in parsed_data:
-                                if isinstance(item, dict):
-                                    if 'amount' in item:
-                                        try:
-                                            item['amount'] = float(item['amount'])
-                                        except (ValueError, TypeError):
-                                            pass
-                                    if 'monthlyDeduction' in item:
-                                        try:
-                                            item['monthlyDeduction'] = float(item['monthlyDeduction'])
-                                        except (ValueError, TypeError):
-                                            pass
-                        # Store the parsed data back as JSON string with float amounts
-                        setattr(staff, field, json.dumps(parsed_data))
-                except (json.JSONDecodeError, TypeError):
-                    pass  # Keep original value if parsing fails
-        
-        return staff
+        # JSON fields are normalized when staff are written
+        return attach_names(row)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in get_staff_member: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1275,50 +1019,15 @@ async def update_staff(staff_id: int, staff_data: dict, db: Session = Depends(ge
                 except (ValueError, TypeError):
                     updated_fields[backend_field] = 0.0
             elif backend_field == 'allowances_detail' and isinstance(value, list):
-                # Calculate total allowances and store detail
-                total_allowances = 0
-                for allowance in value:
-                    if isinstance(allowance, dict) and 'amount' in allowance:
-                        try:
-                            allowance['amount'] = float(allowance['amount'])  # Convert to float
-                            total_allowances += allowance['amount']
-                        except (ValueError, TypeError):
-                            pass
-                # Store the detail and calculate total
-                updated_fields['allowances_detail'] = json.dumps(value) if value else None
-                updated_fields['allowances'] = total_allowances
-            elif backend_field == 'social_security' and isinstance(value, list):
-                # Convert percentages to floats
-                for item in value:
-                    if isinstance(item, dict) and 'percentage' in item:
-                        try:
-                            item['percentage'] = float(item['percentage'])
-                        except (ValueError, TypeError):
-                            pass
-                updated_fields[backend_field] = json.dumps(value) if value else None
-            elif backend_field == 'insurance' and isinstance(value, list):
-                # Convert amounts to floats
-                for item in value:
-                    if isinstance(item, dict) and 'annualAmount' in item:
-                        try:
-                            item['annualAmount'] = float(item['annualAmount'])
-                        except (ValueError, TypeError):
-                            pass
-                updated_fields[backend_field] = json.dumps(value) if value else None
-            elif backend_field == 'loans' and isinstance(value, list):
-                # Convert amounts to floats
-                for item in value:
-                    if isinstance(item, dict) and 'amount' in item:
-                        try:
-                            item['amount'] = float(item['amount'])
-                        except (ValueError, TypeError):
-                            pass
-                    if isinstance(item, dict) and 'monthlyDeduction' in item:
-                        try:
-                            item['monthlyDeduction'] = float(item['monthlyDeduction'])
-                        except (ValueError, TypeError):
-                            pass
-                updated_fields[backend_field] = json.dumps(value) if value else None
+                # Store the normalized detail and calculate total allowances
+                updated_fields['allowances_detail'] = normalize_staff_json(backend_field, value) if value else None
+                updated_fields['allowances'] = sum(
+                    allowance['amount'] for allowance in value  # Amounts were coerced in place
+                    if isinstance(allowance, dict) and isinstance(allowance.get('amount'), float)
+                )
+            elif backend_field in ['social_security', 'insurance', 'loans'] and isinstance(value, list):
+                # Convert percentages and amounts to floats
+                updated_fields[backend_field] = normalize_staff_json(backend_field, value) if value else None
             elif backend_field in ['documents']:
                 # Store JSON data directly
                 updated_fields[backend_field] = json.dumps(value) if value else None
@@ -1373,25 +1082,11 @@ async def update_staff(staff_id: int, staff_data: dict, db: Session = Depends(ge
         staff.total_package = staff.basic_salary + staff.allowances
     
     db.commit()
-    db.refresh(staff)
-    
-    # Add related entity names for response
-    if staff.department_id:
-        department = db.query(Department).filter(Department.id == staff.department_id).first()
-        staff.department_name = department.name if department else None
+    org_directory.invalidate()
+    org_tree.invalidate()
     
-    if staff.role_id:
-        role = db.query(Role).filter(Role.id == staff.role_id).first()
-        staff.role_name = role.name if role else None
-    
-    if staff.branch_id:
-        branch = db.query(Branch).filter(Branch.id == staff.branch_id).first()
-        staff.branch_name = branch.name if branch else None
-    
-    # JSON fields are already stored as strings in the database
-    # No need to parse them here as they'll be returned as strings
-    
-    return staff
+    # Reload with related entity names for response
+    return attach_names(staff_with_names_query(db).filter(Staff.id == staff_id).first())
 
 @router.delete("/staff/{staff_id}")
 async def delete_staff(staff_id: int, db: Session = Depends(get_db)):
@@ -1414,153 +1109,52 @@ async def delete_staff(staff_id: int, db: Session = Depends(get_db)):
     # Soft delete by setting is_active to False
     staff.is_active = False
     db.commit()
+    org_directory.invalidate()
+    org_tree.invalidate()
     
     return {"message": "Staff member deleted successfully"}
 
-# Payroll calculation function without SDL (for initial calculation)
-def calculate_payroll_without_sdl(basic_salary: float, allowances: float = 0, paye_eligible: bool = True, loans: float = 0, insurance: float = 0):
-    """Calculate payroll deductions and net salary without SDL"""
-    # Total Package = Basic Salary + Allowances (without deductions)
-    total_package = basic_salary + allowances
-    # Gross Salary = Basic Salary + Allowances (no overtime/bonus)
-    gross_salary = basic_salary + allowances
-    
-    # Tax calculations (Tanzania PAYE rates) - ON GROSS TAXABLE INCOME (Basic Salary + Taxable Allowances)
-    paye_tax = 0
-    if paye_eligible:
-        # Gross Taxable Income = Basic Salary + Taxable Allowances
-        gross_taxable_income = basic_salary + allowances
-        
-        # Tanzania monthly tax brackets - using gross_taxable_income
-        if gross_taxable_income <= 270000:
-            paye_tax = 0
-        elif gross_taxable_income <= 520000:
-            paye_tax = (gross_taxable_income - 270000) * 0.08
-        elif gross_taxable_income <= 760000:
-            paye_tax = 20000 + (gross_taxable_income - 520000) * 0.20
-        elif gross_taxable_income <= 1000000:
-            paye_tax = 68000 + (gross_taxable_income - 760000) * 0.25
-        else:
-            paye_tax = 128000 + (gross_taxable_income - 1000000) * 0.30
-    
-    # NSSF (National Social Security Fund) - Tanzania: 10% employee contribution - ONLY ON BASIC SALARY
-    # NSSF is calculated only on basic salary, not on allowances
-    nssf = basic_salary * 0.10
-    
-    # NHIF - Not applicable in Tanzania (this is Kenya's system)
-    # Tanzania uses different health insurance schemes
-    nhif = 0
-    
-    total_deductions = paye_tax + nssf + nhif
-    # Net Salary = Basic Salary - Deductions + Allowances - Loans - Insurance
-    # Loans and Insurance are deducted from employee's net salary but don't affect tax calculations
-    net_salary = basic_salary - total_deductions + allowances - loans - insurance
-    
-    return {
-        "total_package": total_package,
-        "gross_salary": gross_salary,
-        "paye_tax": paye_tax,
-        "sdl_tax": 0,  # No SDL in this calculation
-        "nssf": nssf,
-        "nhif": nhif,
-        "loans": loans,
-        "insurance": insurance,
-        "total_deductions": total_deductions,
-        "net_salary": net_salary
-    }
+# Org hierarchy endpoints
+def org_tree_with(db: Session, staff_id: int):
+    tree = org_tree.get(db)
+    if staff_id not in tree:
+        raise HTTPException(status_code=404, detail="Staff member not found")
+    return tree
 
-# Payroll calculation function
-def calculate_payroll(basic_salary: float, allowances: float = 0, paye_eligible: bool = True, total_sdl: float = 0, total_employees: int = 1):
-    """Calculate payroll deductions and net salary"""
-    # Total Package = Basic Salary + Allowances (without deductions)
-    total_package = basic_salary + allowances
-    # Gross Salary = Basic Salary + Allowances (no overtime/bonus)
-    gross_salary = basic_salary + allowances
-    
-    # Tax calculations (Tanzania PAYE rates) - ON GROSS TAXABLE INCOME (Basic Salary + Taxable Allowances)
-    paye_tax = 0
-    if paye_eligible:
-        # Gross Taxable Income = Basic Salary + Taxable Allowances
-        gross_taxable_income = basic_salary + allowances
-        
-        # Tanzania monthly tax brackets - using gross_taxable_income
-        if gross_taxable_income <= 270000:
-            paye_tax = 0
-        elif gross_taxable_income <= 520000:
-            paye_tax = (gross_taxable_income - 270000) * 0.08
-        elif gross_taxable_income <= 760000:
-            paye_tax = 20000 + (gross_taxable_income - 520000) * 0.20
-        elif gross_taxable_income <= 1000000:
-            paye_tax = 68000 + (gross_taxable_income - 760000) * 0.25
-        else:
-            paye_tax = 128000 + (gross_taxable_income - 1000000) * 0.30
-    
-    # SDL Tax (3.5% of total basic salary) - distributed per employee
-    # SDL is calculated as 3.5% of total basic salary paid by employer
-    # We distribute this amount among employees based on their basic salary proportion
-    # Formula: (employee_basic_salary / total_basic_salary) * total_sdl
-    total_basic_salary_for_sdl = total_sdl / 0.035  # Reverse calculate total basic salary
-    sdl_tax = (basic_salary / total_basic_salary_for_sdl) * total_sdl if total_basic_salary_for_sdl > 0 else 0
-    
-    # NSSF (National Social Security Fund) - Tanzania: 10% employee contribution - ONLY ON BASIC SALARY
-    # NSSF is calculated only on basic salary, not on allowances
-    nssf = basic_salary * 0.10
-    
-    # NHIF - Not applicable in Tanzania (this is Kenya's system)
-    # Tanzania uses different health insurance schemes
-    nhif = 0
-    
-    total_deductions = paye_tax + sdl_tax + nssf + nhif
-    # Net Salary = Basic Salary - Deductions + Allowances
-    net_salary = basic_salary - total_deductions + allowances
-    
+@router.get("/staff/{staff_id}/reports")
+def get_staff_reports(
+    staff_id: int,
+    max_depth: Optional[int] = Query(None, ge=1),
+    include_inactive: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Get everyone reporting to a staff member, directly or indirectly"""
+    tree = org_tree_with(db, staff_id)
     return {
-        "total_package": total_package,
-        "gross_salary": gross_salary,
-        "paye_tax": paye_tax,
-        "sdl_tax": sdl_tax,
-        "nssf": nssf,
-        "nhif": nhif,
-        "total_deductions": total_deductions,
-        "net_salary": net_salary
+        **tree.headcount(staff_id),
+        "reports": tree.subtree(staff_id, max_depth=max_depth, include_inactive=include_inactive)
     }
 
-def calculate_employer_costs(gross_salary: float, basic_salary: float):
-    """Calculate employer costs (SDL, WCF, NSSF employer portion)"""
-    # SDL (Skills Development Levy) - 3.5% of gross salary, paid by employer
-    sdl_employer_cost = gross_salary * 0.035
-    
-    # WCF (Workers Compensation Fund) - 0.5% of gross salary, paid by employer
-    wcf_cost = gross_salary * 0.005
-    
-    # NSSF employer portion - 10% of BASIC SALARY ONLY, paid by employer
-    nssf_employer_cost = basic_salary * 0.10
-    
-    total_employer_costs = sdl_employer_cost + wcf_cost + nssf_employer_cost
-    
-    return {
-        "sdl_employer_cost": sdl_employer_cost,
-        "wcf_cost": wcf_cost,
-        "nssf_employer_cost": nssf_employer_cost,
-        "total_employer_costs": total_employer_costs
-    }
+@router.get("/staff/{staff_id}/reporting-chain")
+def get_staff_reporting_chain(staff_id: int, db: Session = Depends(get_db)):
+    """Get a staff member's managers, from the direct manager up to the top"""
+    return org_tree_with(db, staff_id).ancestors(staff_id)
+
+@router.get("/staff/{staff_id}/headcount")
+def get_staff_headcount(staff_id: int, db: Session = Depends(get_db)):
+    """Get direct, total and active report counts for a staff member"""
+    return org_tree_with(db, staff_id).headcount(staff_id)
 
 # Payroll processing endpoints
 @router.post("/payroll/process")
-async def process_payroll(request: PayrollProcessRequest, db: Session = Depends(get_db)):
-    """Process payroll for a specific period"""
+def process_payroll(request: PayrollProcessRequest, db: Session = Depends(get_db)):
+    """Process payroll for a specific period (runs in the threadpool, off the event loop)"""
     try:
-        # Allow reprocessing payroll for any period - no duplicate check
-        
-        # Get all active staff
-        query = db.query(Staff).filter(Staff.is_active == True, Staff.employment_status == EmploymentStatus.ACTIVE)
-        
-        if request.branch_id:
-            query = query.filter(Staff.branch_id == request.branch_id)
-        
-        staff_members = query.all()
+        # Reprocessing replaces the scope's unpaid records and calculation (full) or updates them in place (incremental)
+        run = run_payroll_incremental if request.incremental else run_payroll
+        summary = run(db, request.payroll_period, branch_id=request.branch_id)
         
-        if not staff_members:
+        if not summary["total_employees"]:
             return {
                 "message": "No active staff members found for payroll processing",
                 "payroll_period": request.payroll_period,
@@ -1572,234 +1166,20 @@ async def process_payroll(request: PayrollProcessRequest, db: Session = Depends(
                 "status": "no_staff"
             }
         
-        payroll_records = []
-        total_gross = 0
-        total_deductions = 0
-        total_net = 0
-        total_basic_salary = 0
-        detailed_records = []
-        
-        # First pass: Calculate individual payrolls without SDL to get net salaries
-        individual_calculations = []
-        for staff in staff_members:
-            # Extract loan amount from loans JSON field
-            loan_amount = 0
-            if staff.loans and isinstance(staff.loans, list):
-                # Sum up all active loan deductions
-                for loan in staff.loans:
-                    if isinstance(loan, dict) and loan.get('status') == 'active':
-                        loan_amount += loan.get('monthly_deduction', 0)
-            
-            # Extract insurance amount from insurance JSON field
-            insurance_amount = 0
-            if staff.insurance and isinstance(staff.insurance, list):
-                # Sum up all active insurance deductions
-                for insurance in staff.insurance:
-                    if isinstance(insurance, dict) and insurance.get('status') == 'active':
-                        insurance_amount += insurance.get('monthly_premium', 0)
-            
-            # Calculate payroll without SDL first
-            calculation = calculate_payroll_without_sdl(
-                staff.basic_salary, 
-                staff.allowances, 
-                paye_eligible=staff.paye_eligible,
-                loans=loan_amount,
-                insurance=insurance_amount
-            )
-            individual_calculations.append({
-                'staff': staff,
-                'calculation': calculation,
-                'loan_amount': loan_amount,
-                'insurance_amount': insurance_amount
-            })
-            total_net += calculation['net_salary']
-        
-        # Calculate SDL as 3.5% of total net salary paid to employees
-        total_sdl = total_net * 0.035
-        
-        # Second pass: Distribute SDL proportionally and create final payroll records
-        for item in individual_calculations:
-            staff = item['staff']
-            base_calculation = item['calculation']
-            loan_amount = item['loan_amount']
-            insurance_amount = item['insurance_amount']
-            
-            # Just fetch the exact values from staff data - NO CALCULATIONS AT ALL
-            # Use the values exactly as they are stored in the staff record
-            
-            # Calculate deductions from staff data (same logic as frontend staff details page)
-            total_deductions = 0
-            
-            # Social Security deductions (percentage-based on basic salary)
-            if staff.social_security:
-                try:
-                    social_security = json.loads(staff.social_security) if isinstance(staff.social_security, str) else staff.social_security
-                    if isinstance(social_security, list):
-                        for item_ss in social_security:
-                            if isinstance(item_ss, dict):
-                                if item_ss.get('percentage') and staff.basic_salary:
-                                    deduction = (staff.basic_salary * float(item_ss['percentage'])) / 100
-                                    total_deductions += deduction
-                except (json.JSONDecodeError, TypeError, ValueError):
-                    pass
-            
-            # Insurance deductions (annual amounts converted to monthly)
-            if staff.insurance:
-                try:
-                    insurance_data = json.loads(staff.insurance) if isinstance(staff.insurance, str) else staff.insurance
-                    if isinstance(insurance_data, list):
-                        for item_ins in insurance_data:
-                            if isinstance(item_ins, dict):
-                                if item_ins.get('annualAmount'):
-                                    deduction = float(item_ins['annualAmount']) / 12
-                                    total_deductions += deduction
-                                elif item_ins.get('amount'):
-                                    deduction = float(item_ins['amount'])
-                                    total_deductions += deduction
-                except (json.JSONDecodeError, TypeError, ValueError):
-                    pass
-            
-            # Loan deductions (monthly amounts)
-            if staff.loans:
-                try:
-                    loans_data = json.loads(staff.loans) if isinstance(staff.loans, str) else staff.loans
-                    if isinstance(loans_data, list):
-                        for item_loan in loans_data:
-                            if isinstance(item_loan, dict) and item_loan.get('amount'):
-                                deduction = float(item_loan['amount'])
-                                total_deductions += deduction
-                except (json.JSONDecodeError, TypeError, ValueError):
-                    pass
-            
-            # PAYE Tax calculation (if eligible) - calculated on gross taxable income (basic salary + allowances)
-            if staff.paye_eligible and staff.basic_salary:
-                basic_salary = staff.basic_salary
-                allowances_total = staff.allowances or 0
-                
-                gross_taxable_income = basic_salary + allowances_total
-                paye_tax = 0
-                
-                # Tanzania monthly tax brackets - using gross_taxable_income
-                if gross_taxable_income <= 270000:
-                    paye_tax = 0
-                elif gross_taxable_income <= 520000:
-                    paye_tax = (gross_taxable_income - 270000) * 0.08
-                elif gross_taxable_income <= 760000:
-                    paye_tax = 20000 + (gross_taxable_income - 520000) * 0.20
-                elif gross_taxable_income <= 1000000:
-                    paye_tax = 68000 + (gross_taxable_income - 760000) * 0.25
-                else:
-                    paye_tax = 128000 + (gross_taxable_income - 1000000) * 0.30
-                
-                total_deductions += paye_tax
-            
-            # Calculate net salary
-            net_salary = (staff.basic_salary or 0) + (staff.allowances or 0) - total_deductions
-            
-            # Create final calculation using the exact staff data values
-            calculation = {
-                'total_package': staff.total_package or 0,
-                'gross_salary': staff.total_package or 0,  # Total Package IS the gross salary
-                'paye_tax': 0,  # No calculations - will be calculated in frontend
-                'sdl_tax': 0,  # No calculations - will be calculated in frontend
-                'nssf': 0,  # No calculations - will be calculated in frontend
-                'nhif': 0,  # No calculations - will be calculated in frontend
-                'loans': 0,  # No calculations - will be calculated in frontend
-                'insurance': 0,  # No calculations - will be calculated in frontend
-                'total_deductions': total_deductions,  # Fetch calculated deductions
-                'net_salary': net_salary  # Fetch calculated net salary
-            }
-            
-            print(f"DEBUG: Payroll calculation for {staff.first_name} {staff.last_name}:")
-            print(f"  - Basic Salary: {staff.basic_salary}")
-            print(f"  - Allowances: {staff.allowances}")
-            print(f"  - Gross Salary: {calculation['gross_salary']}")
-            print(f"  - PAYE Tax: {calculation['paye_tax']}")
-            print(f"  - SDL Tax: {calculation['sdl_tax']}")
-            print(f"  - NSSF: {calculation['nssf']}")
-            print(f"  - Total Deductions: {calculation['total_deductions']}")
-            print(f"  - Net Salary: {calculation['net_salary']}")
-            
-            # Calculate employer costs
-            employer_costs = calculate_employer_costs(
-                calculation["gross_salary"],
-                staff.basic_salary
-            )
-            
-            # Create payroll record
-            payroll_record = PayrollRecord(
-                staff_id=staff.id,
-                payroll_period=request.payroll_period,
-                pay_date=datetime.now().date(),
-                basic_salary=staff.basic_salary,
-                allowances=staff.allowances,
-                gross_salary=calculation["gross_salary"],
-                paye_tax=calculation["paye_tax"],
-                sdl_tax=calculation["sdl_tax"],
-                nssf=calculation["nssf"],
-                nhif=calculation["nhif"],
-                other_deductions=loan_amount + insurance_amount,  # Store loans + insurance in other_deductions
-                total_deductions=calculation["total_deductions"],
-                net_salary=calculation["net_salary"],
-                status="calculated",
-                processed_at=datetime.utcnow()
-            )
-            
-            db.add(payroll_record)
-            payroll_records.append(payroll_record)
-            
-            # Add detailed record for frontend display
-            detailed_records.append({
-                "id": staff.id,
-                "name": f"{staff.first_name} {staff.last_name}",
-                "basic_salary": staff.basic_salary,
-                "allowances": staff.allowances,
-                "gross_salary": calculation["gross_salary"],
-                "paye_tax": calculation["paye_tax"],
-                "sdl_tax": calculation["sdl_tax"],
-                "nssf": calculation["nssf"],
-                "nhif": calculation["nhif"],
-                "loans": loan_amount,
-                "insurance": insurance_amount,
-                "deductions": calculation["total_deductions"],
-                "net_salary": calculation["net_salary"],
-                "department_name": staff.department_name if hasattr(staff, 'department_name') else None,
-                "branch_name": staff.branch_name if hasattr(staff, 'branch_name') else None
-            })
-            
-            total_gross += calculation["gross_salary"]
-            total_deductions += calculation["total_deductions"]
-            total_net += calculation["net_salary"]
-        
-        # Create payroll calculation summary
-        payroll_calculation = PayrollCalculation(
-            payroll_period=request.payroll_period,
-            branch_id=request.branch_id,
-            total_employees=len(staff_members),
-            total_gross_salary=total_gross,
-            total_deductions=total_deductions,
-            total_net_salary=total_net,
-            total_paye_tax=sum(r.paye_tax for r in payroll_records),
-            total_sdl_tax=sum(r.sdl_tax for r in payroll_records),
-            total_nssf=sum(r.nssf for r in payroll_records),
-            total_nhif=sum(r.nhif for r in payroll_records),
-            status="calculated",
-            calculated_at=datetime.utcnow()
-        )
-        
-        db.add(payroll_calculation)
-        db.commit()
-        
         return {
-            "message": f"Payroll processed successfully for {len(staff_members)} employees",
+            "message": f"Payroll processed successfully for {summary['total_employees']} employees",
             "payroll_period": request.payroll_period,
-            "total_employees": len(staff_members),
-            "total_gross_salary": total_gross,
-            "total_deductions": total_deductions,
-            "total_net_salary": total_net,
-            "total_sdl": total_sdl,
-            "payroll_records": len(payroll_records),
-            "detailed_records": detailed_records,
+            "total_employees": summary["total_employees"],
+            "total_gross_salary": summary["total_gross_salary"],
+            "total_deductions": summary["total_deductions"],
+            "total_net_salary": summary["total_net_salary"],
+            "total_sdl": summary["total_sdl"],
+            "total_wcf": summary["total_wcf"],
+            "total_employer_costs": summary["total_employer_costs"],
+            "payroll_records": summary["payroll_records"],
+            "detailed_records": summary["detailed_records"],
+            "mode": summary["mode"],
+            "changes": summary.get("changes"),
             "status": "success"
         }
         
@@ -1808,12 +1188,51 @@ async def process_payroll(request: PayrollProcessRequest, db: Session = Depends(
         logger.error(f"Error processing payroll: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing payroll: {str(e)}")
 
+@router.post("/payroll/jobs", status_code=202)
+def create_payroll_job(request: PayrollProcessRequest, db: Session = Depends(get_db)):
+    """Queue payroll processing for a period as a background job, one task per branch"""
+    try:
+        job = payroll_jobs.submit(db, request.payroll_period, branch_id=request.branch_id, incremental=bool(request.incremental))
+        return job.progress()
+    except Exception as e:
+        logger.error(f"Error queueing payroll job: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error queueing payroll job: {str(e)}")
+
+@router.get("/payroll/jobs/{job_id}")
+async def get_payroll_job(job_id: str):
+    """Get the progress of a payroll job (employees processed, ETA)"""
+    job = payroll_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Payroll job not found")
+    return job.progress()
+
+@router.get("/payroll/jobs/{job_id}/result")
+async def get_payroll_job_result(job_id: str):
+    """Get the totals and detailed records of a finished payroll job"""
+    job = payroll_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Payroll job not found")
+    if not job.finished:
+        raise HTTPException(status_code=409, detail=f"Payroll job is still {job.status}")
+    return job.result()
+
+@router.post("/payroll/simulate")
+def simulate_payroll_changes(request: PayrollSimulationRequest, db: Session = Depends(get_db)):
+    """What-if payroll: aggregate changes in PAYE, net pay and employer costs for salary/allowance adjustments (read-only)"""
+    try:
+        return simulate_payroll(db, **request.dict())
+    except Exception as e:
+        logger.error(f"Error simulating payroll: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error simulating payroll: {str(e)}")
+
 @router.get("/payroll/records", response_model=List[PayrollRecordResponse])
 async def get_payroll_records(
+    response: Response,
     payroll_period: Optional[str] = None,
     staff_id: Optional[int] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """Get payroll records with optional filtering"""
@@ -1825,7 +1244,12 @@ async def get_payroll_records(
     if staff_id:
         query = query.filter(PayrollRecord.staff_id == staff_id)
     
-    records = query.offset(skip).limit(limit).all()
+    try:
+        records, next_cursor = paginate(query, [(PayrollRecord.id, False)], limit, cursor, skip)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return records
 
 @router.get("/payroll/records/detailed")
@@ -1838,62 +1262,16 @@ async def get_detailed_payroll_records(
 ):
     """Get detailed payroll records with staff information"""
     try:
-        # Join PayrollRecord with Staff to get staff details
-        query = db.query(PayrollRecord, Staff).join(Staff, PayrollRecord.staff_id == Staff.id)
-        
-        if payroll_period:
-            query = query.filter(PayrollRecord.payroll_period == payroll_period)
-        
-        if branch_id:
-            query = query.filter(Staff.branch_id == branch_id)
-        
-        results = query.offset(skip).limit(limit).all()
+        # One joined query for records, staff, department and branch names
+        results = detailed_records_query(db, payroll_period, branch_id).offset(skip).limit(limit).all()
         
         detailed_records = []
-        for payroll_record, staff in results:
-            # Get department and branch names
-            department_name = None
-            branch_name = None
-            
-            if staff.department_id:
-                department = db.query(Department).filter(Department.id == staff.department_id).first()
-                department_name = department.name if department else None
-            
-            if staff.branch_id:
-                branch = db.query(Branch).filter(Branch.id == staff.branch_id).first()
-                branch_name = branch.name if branch else None
-            
-            detailed_records.append({
-                "id": payroll_record.id,
-                "staff_id": staff.id,
-                "name": f"{staff.first_name} {staff.last_name}",
-                "email": staff.email,
-                "employee_id": staff.employee_id,
-                "department_name": department_name,
-                "branch_name": branch_name,
-                "payroll_period": payroll_record.payroll_period,
-                "pay_date": payroll_record.pay_date,
-                "basic_salary": payroll_record.basic_salary,
-                "allowances": payroll_record.allowances,
-                "overtime_pay": payroll_record.overtime_pay,
-                "bonus": payroll_record.bonus,
-                "gross_salary": payroll_record.gross_salary,
-                "paye_tax": payroll_record.paye_tax,
-                "sdl_tax": payroll_record.sdl_tax,
-                "nssf": payroll_record.nssf,
-                "nhif": payroll_record.nhif,
-                "pension_contribution": payroll_record.pension_contribution,
-                "other_deductions": payroll_record.other_deductions,
-                "total_deductions": payroll_record.total_deductions,
-                "net_salary": payroll_record.net_salary,
-                "hours_worked": payroll_record.hours_worked,
-                "days_worked": payroll_record.days_worked,
-                "notes": payroll_record.notes,
-                "status": payroll_record.status,
-                "processed_at": payroll_record.processed_at,
-                "paid_at": payroll_record.paid_at,
-                "created_at": payroll_record.created_at
-            })
+        for row in results:
+            record = dict(row._mapping)
+            record["name"] = f"{record.pop('first_name')} {record.pop('last_name')}"
+            record.pop("bank_name")
+            record.pop("bank_account")
+            detailed_records.append(record)
         
         return detailed_records
         
@@ -1901,6 +1279,29 @@ async def get_detailed_payroll_records(
         logger.error(f"Error fetching detailed payroll records: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching detailed payroll records: {str(e)}")
 
+@router.get("/payroll/records/export")
+def export_payroll_records(
+    payroll_period: str,
+    branch_id: Optional[int] = None,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+):
+    """Stream every detailed payroll record of a period as a CSV or XLSX download"""
+    filename = f"payroll_{payroll_period}" + (f"_branch_{branch_id}" if branch_id else "")
+    if format == "xlsx":
+        if not XLSX_EXPORT_AVAILABLE:
+            raise HTTPException(status_code=501, detail="XLSX export is not available: openpyxl is not installed")
+        return StreamingResponse(
+            stream_xlsx(payroll_period, branch_id),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.xlsx"'}
+        )
+    
+    return StreamingResponse(
+        stream_csv(payroll_period, branch_id),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'}
+    )
+
 @router.get("/payroll/summary")
 async def get_payroll_summary(
     payroll_period: Optional[str] = None,
@@ -1952,38 +1353,28 @@ async def mark_payroll_paid(
 ):
     """Mark all payroll records for a period as paid"""
     try:
-        # Get all payroll records for the period
-        query = db.query(PayrollRecord).filter(PayrollRecord.payroll_period == payroll_period)
-        
-        if branch_id:
-            # Join with Staff to filter by branch
-            query = query.join(Staff, PayrollRecord.staff_id == Staff.id).filter(Staff.branch_id == branch_id)
-        
-        payroll_records = query.all()
+        records_query = scope_records_query(db, payroll_period, branch_id)
+        total_records = records_query.count()
         
-        if not payroll_records:
+        if not total_records:
             return {
                 "message": f"No payroll records found for period {payroll_period}",
                 "status": "not_found"
             }
         
-        # Update all records to paid status
-        paid_count = 0
-        for record in payroll_records:
-            if record.status != "paid":
-                record.status = "paid"
-                record.paid_at = datetime.utcnow()
-                paid_count += 1
+        now = datetime.utcnow()
         
-        # Update payroll calculation status
-        calculation_query = db.query(PayrollCalculation).filter(PayrollCalculation.payroll_period == payroll_period)
-        if branch_id:
-            calculation_query = calculation_query.filter(PayrollCalculation.branch_id == branch_id)
+        # Update all unpaid records in a single statement
+        paid_count = records_query.filter(PayrollRecord.status != "paid").update(
+            {PayrollRecord.status: "paid", PayrollRecord.paid_at: now, PayrollRecord.updated_at: now},
+            synchronize_session=False
+        )
         
-        calculation = calculation_query.first()
-        if calculation:
-            calculation.status = "processed"
-            calculation.processed_at = datetime.utcnow()
+        # Update payroll calculation status
+        processed_calculations = scope_calculations_query(db, payroll_period, branch_id).update(
+            {PayrollCalculation.status: "processed", PayrollCalculation.processed_at: now, PayrollCalculation.updated_at: now},
+            synchronize_session=False
+        )
         
         db.commit()
         
@@ -1991,7 +1382,8 @@ async def mark_payroll_paid(
             "message": f"Marked {paid_count} payroll records as paid for period {payroll_period}",
             "payroll_period": payroll_period,
             "paid_records": paid_count,
-            "total_records": len(payroll_records),
+            "total_records": total_records,
+            "processed_calculations": processed_calculations,
             "status": "success"
         }
         
@@ -2008,28 +1400,17 @@ async def delete_payroll_period(
 ):
     """Delete all payroll records for a specific period (for reprocessing)"""
     try:
-        # Get all payroll records for the period
-        query = db.query(PayrollRecord).filter(PayrollRecord.payroll_period == payroll_period)
-        
+        # A branch still counted by the all-branch calculation is taken out of it
         if branch_id:
-            # Join with Staff to filter by branch
-            query = query.join(Staff, PayrollRecord.staff_id == Staff.id).filter(Staff.branch_id == branch_id)
+            release_branch(db, payroll_period, branch_id)
         
-        payroll_records = query.all()
+        # Bank batch files reference the calculations, so they go first
+        calculation_ids = [calculation_id for (calculation_id,) in scope_calculations_query(db, payroll_period, branch_id).with_entities(PayrollCalculation.id)]
+        remove_payment_files(db, calculation_ids)
         
-        # Delete payroll records
-        deleted_count = len(payroll_records)
-        for record in payroll_records:
-            db.delete(record)
-        
-        # Delete payroll calculation
-        calculation_query = db.query(PayrollCalculation).filter(PayrollCalculation.payroll_period == payroll_period)
-        if branch_id:
-            calculation_query = calculation_query.filter(PayrollCalculation.branch_id == branch_id)
-        
-        calculation = calculation_query.first()
-        if calculation:
-            db.delete(calculation)
+        # Delete payroll records and calculations with one statement each
+        deleted_count = scope_records_query(db, payroll_period, branch_id).delete(synchronize_session=False)
+        deleted_calculations = scope_calculations_query(db, payroll_period, branch_id).delete(synchronize_session=False)
         
         db.commit()
         
@@ -2037,6 +1418,7 @@ async def delete_payroll_period(
             "message": f"Deleted {deleted_count} payroll records for period {payroll_period}",
             "payroll_period": payroll_period,
             "deleted_records": deleted_count,
+            "deleted_calculations": deleted_calculations,
             "status": "success"
         }
         
@@ -2044,3 +1426,166 @@ async def delete_payroll_period(
         db.rollback()
         logger.error(f"Error deleting payroll period: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error deleting payroll period: {str(e)}")
+
+# Bank payment file endpoints
+def payment_file_dict(batch_file: PaymentBatchFile) -> dict:
+    return {
+        "id": batch_file.id,
+        "calculation_id": batch_file.calculation_id,
+        "payroll_period": batch_file.payroll_period,
+        "bank_name": batch_file.bank_name,
+        "file_name": batch_file.file_name,
+        "file_size": batch_file.file_size,
+        "file_sha256": batch_file.file_sha256,
+        "line_count": batch_file.line_count,
+        "total_amount": batch_file.total_amount,
+        "account_hash_total": batch_file.account_hash_total,
+        "download_url": f"/api/v1/payroll/payroll/bank-files/{batch_file.id}/download",
+        "created_at": batch_file.created_at.isoformat() if batch_file.created_at else None
+    }
+
+@router.post("/payroll/bank-files")
+def create_bank_payment_files(
+    payroll_period: str,
+    branch_id: Optional[int] = None,
+    force: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Generate per-bank payment batch files for a calculated period, reusing current ones unless forced"""
+    calculation = scope_calculation(db, payroll_period, branch_id)
+    if not calculation:
+        raise HTTPException(status_code=404, detail=f"No payroll calculation found for period {payroll_period}")
+    
+    files = None if force else current_payment_files(db, calculation)
+    if files is not None:
+        return {
+            "calculation_id": calculation.id,
+            "files": [payment_file_dict(f) for f in files],
+            "missing_bank_details": None,
+            "status": "existing"
+        }
+    
+    try:
+        generated = generate_payment_files(db, calculation)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error generating bank payment files: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating bank payment files: {str(e)}")
+    
+    return {
+        "calculation_id": calculation.id,
+        "files": [payment_file_dict(f) for f in generated["files"]],
+        "missing_bank_details": generated["missing_bank_details"],
+        "status": "generated"
+    }
+
+@router.get("/payroll/bank-files")
+def get_bank_payment_files(payroll_period: str, branch_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """List the payment batch files registered for a period's latest calculation"""
+    calculation = scope_calculation(db, payroll_period, branch_id)
+    if not calculation:
+        return []
+    files = db.query(PaymentBatchFile).filter(
+        PaymentBatchFile.calculation_id == calculation.id
+    ).order_by(PaymentBatchFile.bank_name).all()
+    return [payment_file_dict(f) for f in files]
+
+@router.get("/payroll/bank-files/{file_id}/download")
+def download_bank_payment_file(file_id: int, db: Session = Depends(get_db)):
+    """Download a generated payment batch file"""
+    batch_file = db.query(PaymentBatchFile).filter(PaymentBatchFile.id == file_id).first()
+    if not batch_file or not os.path.exists(batch_file.file_path):
+        raise HTTPException(status_code=404, detail="Payment batch file not found")
+    return FileResponse(batch_file.file_path, media_type="text/csv", filename=batch_file.file_name)
+
+# Payslip endpoints
+@router.get("/payroll/payslips")
+def download_payslips(
+    payroll_period: str,
+    branch_id: Optional[int] = None,
+    regenerate: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Download a ZIP of payslip PDFs for a period, generating it if missing or out of date"""
+    calculation = scope_calculation(db, payroll_period, branch_id)
+    if not calculation:
+        raise HTTPException(status_code=404, detail=f"No payroll calculation found for period {payroll_period}")
+    
+    file_name = f"payslips_{payroll_period}" + (f"_branch_{branch_id}" if branch_id else "") + ".zip"
+    path = os.path.join(PAYROLL_FILES_DIR, payroll_period, file_name)
+    
+    stale = not os.path.exists(path) or (
+        calculation.calculated_at and datetime.utcfromtimestamp(os.path.getmtime(path)) < calculation.calculated_at
+    )
+    if regenerate or stale:
+        try:
+            write_payslips_zip(payroll_period, path, branch_id=branch_id)
+        except Exception as e:
+            logger.error(f"Error generating payslips: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error generating payslips: {str(e)}")
+    
+    return FileResponse(path, media_type="application/zip", filename=file_name)
+
+# Tax rule endpoints
+def tax_rule_set_dict(rule_set: TaxRuleSet) -> dict:
+    return {
+        "id": rule_set.id,
+        "name": rule_set.name,
+        "effective_from": rule_set.effective_from.isoformat(),
+        "sdl_rate": rule_set.sdl_rate,
+        "wcf_rate": rule_set.wcf_rate,
+        "nssf_employer_rate": rule_set.nssf_employer_rate,
+        "brackets": [{"lower_bound": b.lower_bound, "rate": b.rate} for b in rule_set.brackets],
+        "notes": rule_set.notes,
+        "updated_at": rule_set.updated_at.isoformat() if rule_set.updated_at else None
+    }
+
+@router.get("/tax-rules")
+def get_tax_rules(db: Session = Depends(get_db)):
+    """Get all tax rule sets, oldest effective date first"""
+    rule_sets = db.query(TaxRuleSet).order_by(TaxRuleSet.effective_from, TaxRuleSet.id).all()
+    return [tax_rule_set_dict(rule_set) for rule_set in rule_sets]
+
+@router.get("/tax-rules/effective")
+def get_effective_tax_rules(payroll_period: Optional[str] = None, db: Session = Depends(get_db)):
+    """Get the compiled rules in force for a payroll period (YYYY-MM, default current month)"""
+    return tax_rules.for_period(db, payroll_period).to_dict()
+
+@router.post("/tax-rules")
+def create_tax_rule_set(rule_set_data: TaxRuleSetCreate, db: Session = Depends(get_db)):
+    """Add a tax rule set, taking effect from its effective date"""
+    rule_set = TaxRuleSet(**rule_set_data.dict(exclude={"brackets"}))
+    rule_set.brackets = [TaxBracket(**b.dict()) for b in rule_set_data.brackets]
+    db.add(rule_set)
+    db.commit()
+    db.refresh(rule_set)
+    tax_rules.invalidate()
+    return tax_rule_set_dict(rule_set)
+
+@router.put("/tax-rules/{rule_set_id}")
+def update_tax_rule_set(rule_set_id: int, rule_set_data: TaxRuleSetCreate, db: Session = Depends(get_db)):
+    """Replace a tax rule set and its brackets"""
+    rule_set = db.query(TaxRuleSet).filter(TaxRuleSet.id == rule_set_id).first()
+    if not rule_set:
+        raise HTTPException(status_code=404, detail="Tax rule set not found")
+    
+    for field, value in rule_set_data.dict(exclude={"brackets"}).items():
+        setattr(rule_set, field, value)
+    rule_set.brackets = [TaxBracket(**b.dict()) for b in rule_set_data.brackets]
+    rule_set.updated_at = datetime.utcnow()  # Bump even when only brackets changed
+    db.commit()
+    db.refresh(rule_set)
+    tax_rules.invalidate()
+    return tax_rule_set_dict(rule_set)
+
+@router.delete("/tax-rules/{rule_set_id}")
+def delete_tax_rule_set(rule_set_id: int, db: Session = Depends(get_db)):
+    """Delete a tax rule set"""
+    rule_set = db.query(TaxRuleSet).filter(TaxRuleSet.id == rule_set_id).first()
+    if not rule_set:
+        raise HTTPException(status_code=404, detail="Tax rule set not found")
+    
+    db.delete(rule_set)
+    db.commit()
+    tax_rules.invalidate()
+    return {"message": "Tax rule set deleted successfully"}
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, desc, asc
 from typing import List, Optional
@@ -8,6 +8,7 @@ from datetime import datetime
 import json
 
 from database import get_db
+from services.pagination import paginate, InvalidCursor, NEXT_CURSOR_HEADER
 from models.user import User  # Import User first to ensure it's available for relationships
 from models.real_estate import (
     Property, PropertyImage, PropertyListing, InvestmentProject, 
@@ -62,10 +63,20 @@ async def get_properties_simple():
     return {"message": "Properties endpoint is working", "count": 5}
 
 @router.get("/properties", response_model=List[PropertyResponse])
-async def get_properties(db: Session = Depends(get_db)):
+async def get_properties(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
     """Get all properties with search and filter options"""
     query = db.query(Property)
-    properties = query.offset(0).limit(100).all()
+    try:
+        properties, next_cursor = paginate(query, [(Property.id, False)], limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return properties
 
 @router.get("/properties/{property_id}", response_model=PropertyResponse)
@@ -199,9 +210,11 @@ async def get_property_listings(property_id: int, db: Session = Depends(get_db))
 
 @router.get("/listings", response_model=List[PropertyListingResponse])
 async def get_active_listings(
+    response: Response,
     listing_type: Optional[str] = Query(None),
-    limit: int = Query(20),
-    offset: int = Query(0),
+    limit: int = Query(20, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
     """Get all active property listings"""
@@ -210,7 +223,12 @@ async def get_active_listings(
     if listing_type:
         query = query.filter(PropertyListing.listing_type == listing_type)
     
-    listings = query.offset(offset).limit(limit).all()
+    try:
+        listings, next_cursor = paginate(query, [(PropertyListing.id, False)], limit, cursor, offset)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return listings
 
 # ==================== INVESTMENT PROJECTS ====================
@@ -4,6 +4,7 @@ from database import get_db
 from models.supplier import Supplier
 from models.supplierService import SupplierService
 from models.supplierCategory import SupplierCategory
+from services.pagination import InvalidCursor
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,25 +34,30 @@ async def get_suppliers(
     country: str = Query(None),
     category: str = Query(None),
     search: str = Query(None),
+    cursor: str = Query(None),
     db: Session = Depends(get_db)
 ):
     """Get suppliers with optional filtering"""
     try:
         supplier_service = SupplierService(db)
         
-        suppliers = supplier_service.get_suppliers(
+        suppliers, next_cursor = supplier_service.get_suppliers_page(
             skip=skip,
             limit=limit,
             country=country,
             category=category,
-            search=search
+            search=search,
+            cursor=cursor
         )
         
         return {
             "success": True,
             "data": [supplier.to_dict() for supplier in suppliers],
-            "count": len(suppliers)
+            "count": len(suppliers),
+            "next_cursor": next_cursor
         }
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting suppliers: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,23 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, date, timedelta
+import codecs
+import csv
 import logging
-import uuid
+import tempfile
 
 from database import get_db
 from models.transaction import Transaction, TransactionType, PaymentMethod
+from services.id_allocator import id_allocator
+from services.pagination import paginate, InvalidCursor, NEXT_CURSOR_HEADER
+from services.transaction_stats import transaction_stats
+from services import ledger_rollup
+from services.ledger_rollup import EXPENSE_BUCKETS, rollup_rows, parse_month, period_of, shift_period
+from services.category_classifier import category_classifier
+from services.transaction_import import ingest_transactions, iter_csv_rows, iter_json_lines
+from services.bank_reconciliation import reconcile_statement, DATE_WINDOW_DAYS
+from services import period_close
+from services import search_index
+from services.period_close import PeriodClosedError
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-def generate_transaction_id(db: Session) -> str:
+def generate_transaction_id() -> str:
     """Generate unique transaction ID"""
-    while True:
-        transaction_id = f"TXN-{str(uuid.uuid4())[:8].upper()}"
-        existing = db.query(Transaction).filter(Transaction.transaction_id == transaction_id).first()
-        if not existing:
-            return transaction_id
+    return id_allocator.next_id("transaction")
+
+def parse_statement_month(month: str) -> str:
+    """Validate a YYYY-MM month parameter"""
+    try:
+        return parse_month(month)[0]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid month format, expected YYYY-MM"
+        )
 
 # Create Transaction
 @router.post("/", status_code=status.HTTP_201_CREATED)
@@ -56,8 +76,14 @@ async def create_transaction(
                     detail="Invalid transaction date format"
                 )
         
+        # Transactions can't be added to a closed period
+        try:
+            period_close.ensure_open(db, transaction_date)
+        except PeriodClosedError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        
         # Generate unique transaction ID
-        transaction_id = generate_transaction_id(db)
+        transaction_id = generate_transaction_id()
         
         # Create transaction record
         transaction = Transaction(
@@ -73,16 +99,22 @@ async def create_transaction(
             created_by=transaction_data.get("createdBy", "system"),
             transaction_date=transaction_date
         )
+        category_classifier.apply(transaction)
         
         db.add(transaction)
+        ledger_rollup.record(db, transaction)
+        search_index.index_entity(db, "transaction", transaction)
         db.commit()
         db.refresh(transaction)
+        transaction_stats.invalidate()
         
         return {
             "message": "Transaction created successfully",
             "transaction": transaction.to_dict()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating transaction: {str(e)}")
         db.rollback()
@@ -91,19 +123,113 @@ async def create_transaction(
             detail=f"Failed to create transaction: {str(e)}"
         )
 
+async def spool_feed(request: Request, spool) -> bool:
+    """
+    Copy a JSON lines or CSV feed (raw body or multipart "file" upload) into
+    spool so it can be parsed line by line off the event loop.
+    Returns whether the feed is CSV.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload a feed file in the 'file' field")
+        is_csv = (upload.filename or "").lower().endswith(".csv") or (upload.content_type or "").startswith("text/csv")
+        while chunk := await upload.read(1024 * 1024):
+            spool.write(chunk)
+    else:
+        is_csv = content_type.startswith("text/csv")
+        async for chunk in request.stream():
+            spool.write(chunk)
+    spool.seek(0)
+    return is_csv
+
+def feed_lines(spool, is_csv: bool):
+    lines = codecs.iterdecode(spool, "utf-8-sig")
+    return iter_csv_rows(lines) if is_csv else iter_json_lines(lines)
+
+# Bulk Import Transactions
+@router.post("/import")
+async def import_transactions(request: Request, dry_run: bool = False, db: Session = Depends(get_db)):
+    """
+    Bulk-create transactions from a bank or mobile-money feed: JSON lines
+    (one transaction object per line) or CSV with a header row, as the raw
+    body or a multipart "file" upload. Lines repeating the reference and
+    account of an earlier line or an existing transaction are skipped.
+    Returns a result per line.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        is_csv = await spool_feed(request, spool)
+        return await run_in_threadpool(ingest_transactions, db, feed_lines(spool, is_csv), dry_run)
+        
+    except HTTPException:
+        raise
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not parse transaction feed: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error importing transactions: {str(e)}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import transactions: {str(e)}"
+        )
+    finally:
+        spool.close()
+
+# Reconcile Bank Statement
+@router.post("/reconcile")
+async def reconcile_transactions(
+    request: Request,
+    account: Optional[str] = Query(None, description="Only match transactions of this account"),
+    window_days: int = Query(DATE_WINDOW_DAYS, ge=0, le=31),
+    reconciled_by: str = Query("system"),
+    dry_run: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Reconcile a bank or mobile-money statement (JSON lines or CSV with
+    amount, reference and date) against unreconciled transactions. Matches
+    are marked reconciled; unmatched lines come back with suggestions.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        is_csv = await spool_feed(request, spool)
+        return await run_in_threadpool(
+            reconcile_statement, db, feed_lines(spool, is_csv),
+            reconciled_by, account, window_days, dry_run
+        )
+        
+    except HTTPException:
+        raise
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not parse statement: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error reconciling statement: {str(e)}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to reconcile statement: {str(e)}"
+        )
+    finally:
+        spool.close()
+
 # Get All Transactions
 @router.get("/", response_model=List[dict])
 async def get_transactions(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
     type_filter: Optional[TransactionType] = Query(None),
     payment_method_filter: Optional[PaymentMethod] = Query(None),
-    search: Optional[str] = Query(None),
+    search: Optional[str] = Query(None, description='Words or word prefixes; "quoted" words match whole words only'),
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
-    """Get all transactions with optional filtering"""
+    """Get all transactions with optional filtering, newest first; the next page's cursor is in the X-Next-Cursor header"""
     try:
         query = db.query(Transaction)
         
@@ -115,12 +241,8 @@ async def get_transactions(
             query = query.filter(Transaction.payment_method == payment_method_filter)
         
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                Transaction.description.ilike(search_term) |
-                Transaction.reference.ilike(search_term) |
-                Transaction.category.ilike(search_term)
-            )
+            # Words of description, reference and category via the search index
+            query = search_index.apply_search(query, "transaction", Transaction.id, search)
         
         if start_date:
             try:
@@ -142,14 +264,17 @@ async def get_transactions(
                     detail="Invalid end_date format"
                 )
         
-        # Order by transaction date (newest first)
-        query = query.order_by(Transaction.transaction_date.desc())
-        
-        # Apply pagination
-        transactions = query.offset(skip).limit(limit).all()
+        # Newest first, keyset-paginated on (transaction_date, id)
+        transactions, next_cursor = paginate(
+            query, [(Transaction.transaction_date, True), (Transaction.id, True)], limit, cursor, skip
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
         
         return [transaction.to_dict() for transaction in transactions]
         
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching transactions: {str(e)}")
         raise HTTPException(
@@ -201,6 +326,11 @@ async def update_transaction(
                 detail="Transaction not found"
             )
         
+        # Rollup bucket and amount before the edit, to move the contribution afterwards
+        old_rollup_key = ledger_rollup.rollup_key(transaction)
+        old_transaction_date = transaction.transaction_date
+        old_amount = transaction.amount
+        
         # Update fields
         if "description" in transaction_data:
             transaction.description = transaction_data["description"]
@@ -241,10 +371,21 @@ async def update_transaction(
                     detail="Invalid transaction date format"
                 )
         
+        # Neither the original nor the new date may fall in a closed period
+        try:
+            period_close.ensure_open(db, old_transaction_date, transaction.transaction_date)
+        except PeriodClosedError as e:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        
         transaction.updated_at = datetime.now()
+        category_classifier.apply(transaction)
+        ledger_rollup.move(db, old_rollup_key, old_amount, transaction)
+        search_index.index_entity(db, "transaction", transaction)
         
         db.commit()
         db.refresh(transaction)
+        transaction_stats.invalidate()
         
         return {
             "message": "Transaction updated successfully",
@@ -277,8 +418,16 @@ async def delete_transaction(
                 detail="Transaction not found"
             )
         
+        try:
+            period_close.ensure_open(db, transaction.transaction_date)
+        except PeriodClosedError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        
+        ledger_rollup.record(db, transaction, sign=-1)
+        search_index.remove_entity(db, "transaction", transaction.id)
         db.delete(transaction)
         db.commit()
+        transaction_stats.invalidate()
         
         return {"message": "Transaction deleted successfully"}
         
@@ -294,20 +443,19 @@ async def delete_transaction(
 
 # Get Transaction Statistics
 @router.get("/stats/summary")
-async def get_transaction_stats(
+def get_transaction_stats(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
     """Get transaction statistics"""
     try:
-        query = db.query(Transaction)
+        start_dt = end_dt = None
         
-        # Apply date filters
+        # Parse date filters
         if start_date:
             try:
                 start_dt = datetime.fromisoformat(start_date)
-                query = query.filter(Transaction.transaction_date >= start_dt)
             except ValueError:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -317,36 +465,25 @@ async def get_transaction_stats(
         if end_date:
             try:
                 end_dt = datetime.fromisoformat(end_date)
-                query = query.filter(Transaction.transaction_date <= end_dt)
             except ValueError:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Invalid end_date format"
                 )
         
-        transactions = query.all()
-        
-        # Calculate statistics
-        total_revenue = sum(t.amount for t in transactions if t.type == TransactionType.REVENUE)
-        total_expenses = sum(t.amount for t in transactions if t.type == TransactionType.EXPENSE)
-        total_assets = sum(t.amount for t in transactions if t.type == TransactionType.ASSET)
-        total_liabilities = sum(t.amount for t in transactions if t.type == TransactionType.LIABILITY)
-        
-        net_income = total_revenue - total_expenses
+        # Counts and sums per type from one GROUP BY, cached until the ledger changes
+        stats = transaction_stats.summary(db, start_dt, end_dt)
         
         return {
-            "total_transactions": len(transactions),
-            "total_revenue": total_revenue,
-            "total_expenses": total_expenses,
-            "total_assets": total_assets,
-            "total_liabilities": total_liabilities,
-            "net_income": net_income,
+            **stats,
             "period": {
                 "start_date": start_date,
                 "end_date": end_date
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching transaction stats: {str(e)}")
         raise HTTPException(
@@ -356,49 +493,83 @@ async def get_transaction_stats(
 
 # Financial Statements Endpoints
 
+@router.post("/statements/rollup/rebuild")
+def rebuild_ledger_rollup(reclassify: bool = False, db: Session = Depends(get_db)):
+    """Recompute the monthly ledger rollup that statements and analytics read from"""
+    try:
+        if reclassify:
+            # Refresh the classification stored on each transaction first, e.g. after a rules change
+            category_classifier.reclassify_transactions(db)
+        rows = ledger_rollup.rebuild(db)
+        snapshots = period_close.rebuild_snapshots(db)
+        return {"message": "Ledger rollup rebuilt", "rows": rows, "snapshots": snapshots}
+    except Exception as e:
+        logger.error(f"Error rebuilding ledger rollup: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to rebuild ledger rollup: {str(e)}"
+        )
+
+@router.get("/statements/periods")
+def get_closed_periods(db: Session = Depends(get_db)):
+    """List closed ledger periods; the ledger is locked through the latest one"""
+    closes = period_close.closed_periods(db)
+    return {
+        "locked_through": closes[-1].period if closes else None,
+        "periods": [close.to_dict() for close in closes]
+    }
+
+@router.post("/statements/periods/{month}/close")
+def close_ledger_period(month: str, closed_by: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    """Close the ledger through month and snapshot its closing balances"""
+    period = parse_statement_month(month)
+    try:
+        close = period_close.close_period(db, period, closed_by)
+    except PeriodClosedError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error closing period {period}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to close period: {str(e)}"
+        )
+    return {"message": f"Ledger closed through {period}", "period": close.to_dict()}
+
+@router.post("/statements/periods/{month}/reopen")
+def reopen_ledger_period(month: str, db: Session = Depends(get_db)):
+    """Reopen month and every later closed month so their transactions can be changed"""
+    period = parse_statement_month(month)
+    try:
+        reopened = period_close.reopen_period(db, period)
+    except Exception as e:
+        logger.error(f"Error reopening period {period}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to reopen period: {str(e)}"
+        )
+    return {"message": f"Reopened {reopened} period(s) from {period}", "reopened": reopened}
+
 @router.get("/statements/income")
-async def get_income_statement(
+def get_income_statement(
     month: str = Query(..., description="Month in YYYY-MM format"),
     db: Session = Depends(get_db)
 ):
     """Get Income Statement for a specific month"""
     try:
-        # Parse month and get date range
-        year, month_num = month.split('-')
-        start_date = datetime(int(year), int(month_num), 1)
+        period = parse_statement_month(month)
         
-        # Get last day of month
-        if int(month_num) == 12:
-            end_date = datetime(int(year) + 1, 1, 1) - timedelta(days=1)
-        else:
-            end_date = datetime(int(year), int(month_num) + 1, 1) - timedelta(days=1)
-        
-        # Get transactions for the month
-        transactions = db.query(Transaction).filter(
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date
-        ).all()
-        
-        # Calculate income statement components
-        revenue = sum(t.amount for t in transactions if t.type == TransactionType.REVENUE)
-        
-        # Categorize expenses
-        cost_of_goods_sold = 0
-        operating_expenses = 0
-        interest_expense = 0
-        income_tax = 0
-        
-        for t in transactions:
-            if t.type == TransactionType.EXPENSE:
-                category = (t.category or '').lower()
-                if any(keyword in category for keyword in ['cost', 'goods', 'inventory', 'materials']):
-                    cost_of_goods_sold += t.amount
-                elif any(keyword in category for keyword in ['interest']):
-                    interest_expense += t.amount
-                elif any(keyword in category for keyword in ['tax']):
-                    income_tax += t.amount
-                else:
-                    operating_expenses += t.amount
+        # Monthly totals per statement bucket from the ledger rollup
+        totals = {}
+        for row in rollup_rows(db, period, period, [TransactionType.REVENUE, TransactionType.EXPENSE]):
+            totals[row.bucket] = totals.get(row.bucket, 0) + row.amount
+        
+        revenue = totals.get("revenue", 0)
+        cost_of_goods_sold = totals.get("cost_of_goods_sold", 0)
+        operating_expenses = totals.get("operating_expenses", 0)
+        interest_expense = totals.get("interest_expense", 0)
+        income_tax = totals.get("income_tax", 0)
         
         gross_profit = revenue - cost_of_goods_sold
         operating_income = gross_profit - operating_expenses
@@ -417,6 +588,8 @@ async def get_income_statement(
             "generated_at": datetime.now().isoformat()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating income statement: {str(e)}")
         raise HTTPException(
@@ -425,70 +598,56 @@ async def get_income_statement(
         )
 
 @router.get("/statements/balance-sheet")
-async def get_balance_sheet(
-    month: str = Query(..., description="Month in YYYY-MM format"),
+def get_balance_sheet(
+    month: Optional[str] = Query(None, description="Month in YYYY-MM format"),
+    as_of: Optional[str] = Query(None, description="Any date or datetime in ISO format, instead of a month end"),
     db: Session = Depends(get_db)
 ):
-    """Get Balance Sheet as of end of specific month"""
+    """Get Balance Sheet as of end of specific month, or as of any date"""
     try:
-        # Parse month and get date range (all transactions up to end of month)
-        year, month_num = month.split('-')
-        
-        # Get last day of month
-        if int(month_num) == 12:
-            end_date = datetime(int(year) + 1, 1, 1) - timedelta(days=1)
+        # Cumulative totals per statement bucket: the latest period-close
+        # snapshot plus the rollup months (and, for a date, the transactions) since
+        if as_of:
+            try:
+                end_date = datetime.fromisoformat(as_of)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid as_of format"
+                )
+            if len(as_of) <= 10:
+                end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)  # End of that day
+            bucket_totals = period_close.balance_totals_as_of(db, end_date)
+        elif month:
+            period = parse_statement_month(month)
+            _, _, next_month = parse_month(period)
+            end_date = next_month - timedelta(days=1)
+            bucket_totals = period_close.balance_totals(db, period)
         else:
-            end_date = datetime(int(year), int(month_num) + 1, 1) - timedelta(days=1)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Provide month or as_of"
+            )
         
-        # Get all transactions up to end of month
-        transactions = db.query(Transaction).filter(
-            Transaction.transaction_date <= end_date
-        ).all()
+        totals = {}
+        for (_, bucket), (amount, _) in bucket_totals.items():
+            totals[bucket] = totals.get(bucket, 0) + amount
         
         # Calculate assets
-        current_assets = 0
-        fixed_assets = 0
-        
-        for t in transactions:
-            if t.type == TransactionType.ASSET:
-                category = (t.category or '').lower()
-                if any(keyword in category for keyword in ['cash', 'bank', 'receivable', 'inventory', 'prepaid']):
-                    current_assets += t.amount
-                else:
-                    fixed_assets += t.amount
-        
+        current_assets = totals.get("current_assets", 0)
+        fixed_assets = totals.get("fixed_assets", 0)
         total_assets = current_assets + fixed_assets
         
         # Calculate liabilities
-        current_liabilities = 0
-        long_term_liabilities = 0
-        
-        for t in transactions:
-            if t.type == TransactionType.LIABILITY:
-                category = (t.category or '').lower()
-                if any(keyword in category for keyword in ['payable', 'short', 'accrued']):
-                    current_liabilities += t.amount
-                else:
-                    long_term_liabilities += t.amount
-        
+        current_liabilities = totals.get("current_liabilities", 0)
+        long_term_liabilities = totals.get("long_term_liabilities", 0)
         total_liabilities = current_liabilities + long_term_liabilities
         
-        # Calculate equity
-        owner_equity = 0
-        retained_earnings = 0
-        
-        for t in transactions:
-            if t.type == TransactionType.EQUITY:
-                category = (t.category or '').lower()
-                if any(keyword in category for keyword in ['capital', 'owner']):
-                    owner_equity += t.amount
-                else:
-                    retained_earnings += t.amount
-            elif t.type == TransactionType.REVENUE:
-                retained_earnings += t.amount
-            elif t.type == TransactionType.EXPENSE:
-                retained_earnings -= t.amount
-        
+        # Calculate equity; revenue and expenses accumulate into retained earnings
+        owner_equity = totals.get("owner_equity", 0)
+        retained_earnings = totals.get("retained_earnings", 0) + totals.get("revenue", 0) - sum(
+            totals.get(bucket, 0) for bucket in EXPENSE_BUCKETS
+        )
         total_equity = owner_equity + retained_earnings
         
         return {
@@ -512,6 +671,8 @@ async def get_balance_sheet(
             "generated_at": datetime.now().isoformat()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating balance sheet: {str(e)}")
         raise HTTPException(
@@ -520,27 +681,13 @@ async def get_balance_sheet(
         )
 
 @router.get("/statements/cash-flow")
-async def get_cash_flow_statement(
+def get_cash_flow_statement(
     month: str = Query(..., description="Month in YYYY-MM format"),
     db: Session = Depends(get_db)
 ):
     """Get Cash Flow Statement for a specific month"""
     try:
-        # Parse month and get date range
-        year, month_num = month.split('-')
-        start_date = datetime(int(year), int(month_num), 1)
-        
-        # Get last day of month
-        if int(month_num) == 12:
-            end_date = datetime(int(year) + 1, 1, 1) - timedelta(days=1)
-        else:
-            end_date = datetime(int(year), int(month_num) + 1, 1) - timedelta(days=1)
-        
-        # Get transactions for the month
-        transactions = db.query(Transaction).filter(
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date
-        ).all()
+        period = parse_statement_month(month)
         
         # Operating Activities
         net_income = 0
@@ -558,30 +705,23 @@ async def get_cash_flow_statement(
         loan_payments = 0
         owner_withdrawals = 0
         
-        for t in transactions:
-            category = (t.category or '').lower()
-            
+        # One rollup row per (type, bucket, category) of the month, already classified
+        lines = {}
+        for t in rollup_rows(db, period, period):
             if t.type == TransactionType.REVENUE:
                 net_income += t.amount
             elif t.type == TransactionType.EXPENSE:
                 net_income -= t.amount
-                if 'depreciation' in category:
-                    depreciation += t.amount
-            elif t.type == TransactionType.ASSET:
-                if 'receivable' in category:
-                    accounts_receivable += t.amount
-                elif 'inventory' in category:
-                    inventory += t.amount
-                elif any(keyword in category for keyword in ['equipment', 'machinery']):
-                    equipment_purchases += t.amount
-            elif t.type == TransactionType.LIABILITY:
-                if 'payable' in category:
-                    accounts_payable += t.amount
-                elif 'loan' in category:
-                    loan_proceeds += t.amount
-            elif t.type == TransactionType.EQUITY:
-                if any(keyword in category for keyword in ['withdrawal', 'drawing']):
-                    owner_withdrawals += t.amount
+            if t.cash_flow_line:
+                lines[t.cash_flow_line] = lines.get(t.cash_flow_line, 0) + t.amount
+        
+        depreciation = lines.get("depreciation", 0)
+        accounts_receivable = lines.get("accounts_receivable", 0)
+        inventory = lines.get("inventory", 0)
+        accounts_payable = lines.get("accounts_payable", 0)
+        equipment_purchases = lines.get("equipment_purchases", 0)
+        loan_proceeds = lines.get("loan_proceeds", 0)
+        owner_withdrawals = lines.get("owner_withdrawals", 0)
         
         # Calculate cash flows
         net_operating_cash = net_income + depreciation - accounts_receivable - inventory + accounts_payable
@@ -614,6 +754,8 @@ async def get_cash_flow_statement(
             "generated_at": datetime.now().isoformat()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating cash flow statement: {str(e)}")
         raise HTTPException(
@@ -623,26 +765,21 @@ async def get_cash_flow_statement(
 
 # Cash Flow Analytics Endpoint
 @router.get("/analytics/cash-flow")
-async def get_cash_flow_analytics(
+def get_cash_flow_analytics(
     months: int = Query(6, ge=1, le=12, description="Number of months to analyze"),
     db: Session = Depends(get_db)
 ):
     """Get cash flow analytics for multiple months"""
     try:
-        # Get data for the last N months
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=months * 30)  # Approximate months
-        
-        transactions = db.query(Transaction).filter(
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date
-        ).all()
+        # Rollup rows of the last N calendar months, including the current one
+        end_period = period_of(datetime.now())
+        start_period = shift_period(end_period, -(months - 1))
         
         # Group by month and calculate cash flows
         monthly_data = {}
         
-        for t in transactions:
-            month_key = t.transaction_date.strftime('%Y-%m')
+        for t in rollup_rows(db, start_period, end_period):
+            month_key = t.period
             if month_key not in monthly_data:
                 monthly_data[month_key] = {
                     'operating': 0,
@@ -651,22 +788,18 @@ async def get_cash_flow_analytics(
                     'net': 0
                 }
             
-            category = (t.category or '').lower()
-            
             if t.type == TransactionType.REVENUE:
                 monthly_data[month_key]['operating'] += t.amount
             elif t.type == TransactionType.EXPENSE:
-                monthly_data[month_key]['operating'] -= t.amount
-                if 'depreciation' in category:
-                    monthly_data[month_key]['operating'] += t.amount  # Add back depreciation
-            elif t.type == TransactionType.ASSET:
-                if any(keyword in category for keyword in ['equipment', 'machinery', 'building', 'vehicle']):
-                    monthly_data[month_key]['investing'] -= t.amount
-            elif t.type == TransactionType.LIABILITY:
-                if 'loan' in category:
+                if t.cash_flow_activity != "non_cash":  # Depreciation is added back
+                    monthly_data[month_key]['operating'] -= t.amount
+            elif t.cash_flow_activity == "investing":
+                monthly_data[month_key]['investing'] -= t.amount
+            elif t.cash_flow_activity == "financing":
+                # Loans bring cash in, owner withdrawals take it out
+                if t.type == TransactionType.LIABILITY:
                     monthly_data[month_key]['financing'] += t.amount
-            elif t.type == TransactionType.EQUITY:
-                if any(keyword in category for keyword in ['withdrawal', 'drawing']):
+                else:
                     monthly_data[month_key]['financing'] -= t.amount
         
         # Calculate net cash flow for each month
@@ -736,27 +869,23 @@ async def get_cash_flow_analytics(
 
 # Revenue Analytics Endpoint
 @router.get("/analytics/revenue")
-async def get_revenue_analytics(
+def get_revenue_analytics(
     months: int = Query(6, ge=1, le=12, description="Number of months to analyze"),
     db: Session = Depends(get_db)
 ):
     """Get revenue analytics for multiple months"""
     try:
-        # Get data for the last N months
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=months * 30)  # Approximate months
-        
-        transactions = db.query(Transaction).filter(
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date
-        ).all()
+        # Rollup rows of the last N calendar months, including the current one
+        end_period = period_of(datetime.now())
+        start_period = shift_period(end_period, -(months - 1))
+        rows = rollup_rows(db, start_period, end_period, [TransactionType.REVENUE, TransactionType.EXPENSE])
         
         # Group by month and calculate revenue/expenses
         monthly_data = {}
         revenue_sources = {}
         
-        for t in transactions:
-            month_key = t.transaction_date.strftime('%Y-%m')
+        for t in rows:
+            month_key = t.period
             if month_key not in monthly_data:
                 monthly_data[month_key] = {
                     'revenue': 0,
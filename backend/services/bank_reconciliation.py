@@ -0,0 +1,244 @@
+"""
+Bank Reconciliation Service
+Matches bank and mobile-money statement lines to unreconciled ledger transactions
+"""
+
+import bisect
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from models.transaction import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Days either side of a statement line's date searched when the reference doesn't match
+DATE_WINDOW_DAYS = 3
+
+# Transactions marked reconciled per UPDATE ... WHERE id IN (...)
+MARK_BATCH_SIZE = 1000
+
+# Rows fetched per round trip while loading candidates
+CANDIDATE_FETCH_SIZE = 5000
+
+MAX_SUGGESTIONS = 3
+
+STATEMENT_DATE_FIELDS = ("date", "transactionDate", "transaction_date", "value_date", "valueDate")
+
+
+def _cents(amount) -> int:
+    # Statements show debits as negatives; ledger amounts are stored unsigned
+    return abs(round(float(amount) * 100))
+
+
+def _reference(value) -> str:
+    return str(value or "").strip().upper()
+
+
+def parse_statement_line(raw: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    try:
+        amount = _cents(raw.get("amount"))
+    except (ValueError, TypeError):
+        return None, "Invalid amount format"
+    date_value = next((raw[field] for field in STATEMENT_DATE_FIELDS if raw.get(field)), None)
+    if not date_value:
+        return None, "Missing date"
+    try:
+        line_date = datetime.fromisoformat(str(date_value).strip())
+    except ValueError:
+        return None, "Invalid date format"
+    return {
+        "amount": amount,
+        "reference": _reference(raw.get("reference")),
+        "date": line_date,
+        "description": raw.get("description") or "",
+    }, None
+
+
+class _Candidates:
+    """
+    Unreconciled transactions indexed for the two match passes: a hash
+    index on (amount, reference), and per amount a date-sorted list for the
+    window search. Matched transactions are marked used rather than removed.
+    """
+
+    def __init__(self, rows):
+        self.rows: Dict[int, tuple] = {}
+        self.by_amount_reference: Dict[tuple, List[int]] = defaultdict(list)
+        self.by_reference: Dict[str, List[int]] = defaultdict(list)
+        by_amount: Dict[int, List[tuple]] = defaultdict(list)
+        for row in rows:
+            transaction_pk, transaction_id, amount, reference, transaction_date = row
+            self.rows[transaction_pk] = row
+            cents, reference = _cents(amount), _reference(reference)
+            if reference:
+                self.by_amount_reference[(cents, reference)].append(transaction_pk)
+                self.by_reference[reference].append(transaction_pk)
+            by_amount[cents].append((transaction_date, transaction_pk))
+        self.by_amount = {cents: sorted(entries) for cents, entries in by_amount.items()}
+        self.used = set()
+
+    def match_reference(self, line: Dict) -> Optional[int]:
+        if not line["reference"]:
+            return None
+        for transaction_pk in self.by_amount_reference.get((line["amount"], line["reference"]), ()):
+            if transaction_pk not in self.used:
+                return transaction_pk
+        return None
+
+    def _around(self, cents: int, start: datetime, end: datetime) -> List[tuple]:
+        entries = self.by_amount.get(cents, [])
+        low = bisect.bisect_left(entries, (start, -1))
+        high = bisect.bisect_right(entries, (end, float("inf")))
+        return [entry for entry in entries[low:high] if entry[1] not in self.used]
+
+    def match_date(self, line: Dict, window: timedelta) -> Optional[int]:
+        """Same amount within the window; only taken when the closest date is unambiguous"""
+        nearby = self._around(line["amount"], line["date"] - window, line["date"] + window)
+        if not nearby:
+            return None
+        nearby.sort(key=lambda entry: abs(entry[0] - line["date"]))
+        if len(nearby) > 1 and abs(nearby[1][0] - line["date"]) == abs(nearby[0][0] - line["date"]):
+            return None
+        return nearby[0][1]
+
+    def suggestions(self, line: Dict, window: timedelta) -> List[Dict]:
+        found: Dict[int, str] = {}
+        # Same reference, different amount
+        for transaction_pk in self.by_reference.get(line["reference"], ()) if line["reference"] else ():
+            if transaction_pk not in self.used:
+                found.setdefault(transaction_pk, "reference")
+        # Same amount on nearby dates, including ties the date pass left alone
+        for _, transaction_pk in sorted(
+            self._around(line["amount"], line["date"] - window * 10, line["date"] + window * 10),
+            key=lambda entry: abs(entry[0] - line["date"])
+        ):
+            found.setdefault(transaction_pk, "amount")
+        result = []
+        for transaction_pk, reason in list(found.items())[:MAX_SUGGESTIONS]:
+            _, transaction_id, amount, reference, transaction_date = self.rows[transaction_pk]
+            result.append({
+                "transaction_id": transaction_id,
+                "amount": amount,
+                "reference": reference,
+                "transaction_date": transaction_date.isoformat() if transaction_date else None,
+                "reason": reason,
+            })
+        return result
+
+
+def reconcile_statement(db: Session, lines: Iterable[Tuple[int, Union[Dict, str]]], reconciled_by: str = "system",
+                        account: Optional[str] = None, window_days: int = DATE_WINDOW_DAYS,
+                        dry_run: bool = False) -> Dict:
+    """
+    Reconcile parsed statement lines (line number, fields) against
+    unreconciled transactions.
+
+    Candidates in the statement's date range (widened by the suggestion
+    window) are loaded in one streamed query and indexed in memory. Lines are
+    matched first on exact (amount, reference), then on amount with the
+    nearest date inside window_days. Matches are marked reconciled with a few
+    UPDATE ... WHERE id IN (...) statements and one commit.
+    """
+    window = timedelta(days=window_days)
+    statement, errors = [], []
+    for line_number, raw in lines:
+        if isinstance(raw, str):
+            errors.append({"line": line_number, "error": raw})
+            continue
+        line, error = parse_statement_line(raw)
+        if error:
+            errors.append({"line": line_number, "error": error})
+        else:
+            line["line"] = line_number
+            statement.append(line)
+
+    result = {
+        "statement_lines": len(statement) + len(errors),
+        "matched": 0,
+        "matched_by_reference": 0,
+        "matched_by_date": 0,
+        "unmatched": 0,
+        "invalid": len(errors),
+        "dry_run": dry_run,
+        "matches": [],
+        "unmatched_lines": [],
+        "errors": errors,
+    }
+    if not statement:
+        return result
+
+    first = min(line["date"] for line in statement) - window * 10
+    last = max(line["date"] for line in statement) + window * 10
+    query = db.query(
+        Transaction.id, Transaction.transaction_id, Transaction.amount, Transaction.reference, Transaction.transaction_date
+    ).filter(
+        Transaction.is_reconciled.isnot(True),
+        Transaction.transaction_date >= first,
+        Transaction.transaction_date <= last,
+    )
+    if account:
+        query = query.filter(Transaction.account == account)
+    candidates = _Candidates(query.execution_options(stream_results=True, yield_per=CANDIDATE_FETCH_SIZE))
+
+    matched: Dict[int, tuple] = {}  # statement line -> (transaction pk, method)
+    for line in statement:
+        transaction_pk = candidates.match_reference(line)
+        if transaction_pk is not None:
+            candidates.used.add(transaction_pk)
+            matched[line["line"]] = (transaction_pk, "reference")
+    for line in statement:
+        if line["line"] in matched:
+            continue
+        transaction_pk = candidates.match_date(line, window)
+        if transaction_pk is not None:
+            candidates.used.add(transaction_pk)
+            matched[line["line"]] = (transaction_pk, "date_window")
+
+    for line in statement:
+        if line["line"] in matched:
+            transaction_pk, method = matched[line["line"]]
+            result["matches"].append({
+                "line": line["line"],
+                "transaction_id": candidates.rows[transaction_pk][1],
+                "method": method,
+            })
+        else:
+            result["unmatched_lines"].append({
+                "line": line["line"],
+                "amount": line["amount"] / 100,
+                "reference": line["reference"] or None,
+                "date": line["date"].isoformat(),
+                "description": line["description"],
+                "suggestions": candidates.suggestions(line, window),
+            })
+    result["matched"] = len(matched)
+    result["matched_by_reference"] = sum(1 for _, method in matched.values() if method == "reference")
+    result["matched_by_date"] = result["matched"] - result["matched_by_reference"]
+    result["unmatched"] = len(result["unmatched_lines"])
+
+    if matched and not dry_run:
+        ids = [transaction_pk for transaction_pk, _ in matched.values()]
+        now = datetime.now()
+        try:
+            for start in range(0, len(ids), MARK_BATCH_SIZE):
+                db.execute(
+                    update(Transaction)
+                    .where(Transaction.id.in_(ids[start:start + MARK_BATCH_SIZE]))
+                    .values(is_reconciled=True, reconciled_at=now, reconciled_by=reconciled_by),
+                    execution_options={"synchronize_session": False},
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    logger.info(
+        f"Reconciled statement: {result['matched']} matched "
+        f"({result['matched_by_reference']} by reference), {result['unmatched']} unmatched"
+    )
+    return result
@@ -0,0 +1,126 @@
+"""
+Card Payments Service
+Idempotent processing of ClickPesa payment webhooks that credit card balances
+"""
+
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.card import Card, CardTransaction, CardPaymentCredit
+
+logger = logging.getLogger(__name__)
+
+COMPLETED = "completed"
+
+
+def _find_transaction(db: Session, billpay_number: Optional[str], payment_reference: Optional[str]):
+    """(id, card_id, payment_reference) of the payment, by its indexed control number or reference"""
+    columns = db.query(CardTransaction.id, CardTransaction.card_id, CardTransaction.payment_reference)
+    if billpay_number:
+        return columns.filter(CardTransaction.customer_billpay_control_number == billpay_number).first()
+    if payment_reference:
+        return columns.filter(CardTransaction.payment_reference == payment_reference).first()
+    return None
+
+
+def _already_credited(db: Session, payment_reference: str) -> bool:
+    return db.query(CardPaymentCredit.id).filter(CardPaymentCredit.payment_reference == payment_reference).first() is not None
+
+
+def process_payment_webhook(db: Session, data: Dict) -> Dict:
+    """
+    Apply one ClickPesa payment notification.
+
+    A completed payment is credited at most once per payment reference: the
+    card balance is incremented in the database (UPDATE ... SET balance =
+    balance + amount, so concurrent credits can't overwrite each other) and a
+    CardPaymentCredit entry, unique on the reference, is inserted in the same
+    transaction. A retried or concurrent duplicate hits that unique key and
+    rolls back its increment. Other statuses only update the payment, and
+    never move a completed payment back.
+    """
+    payment_reference = data.get('paymentReference') or data.get('reference')
+    billpay_number = data.get('billPayNumber') or data.get('controlNumber')
+    status = data.get('status', 'pending')
+
+    transaction = _find_transaction(db, billpay_number, payment_reference)
+    if not transaction:
+        logger.warning(f"Payment webhook: no transaction for control number {billpay_number} / reference {payment_reference}")
+        return {"status": "not_found"}
+    transaction_pk, card_id, bill_reference = transaction
+    # Partial payments of one bill arrive with their own references
+    reference = payment_reference or bill_reference
+
+    payment_values = {
+        "status": status,
+        "clickpesa_transaction_id": reference,
+        "clickpesa_response": str(data),
+        "updated_at": func.now(),
+    }
+
+    if status != COMPLETED:
+        try:
+            db.execute(
+                update(CardTransaction)
+                .where(CardTransaction.id == transaction_pk, CardTransaction.status != COMPLETED)
+                .values(**payment_values),
+                execution_options={"synchronize_session": False},
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return {"status": "success"}
+
+    try:
+        amount = float(data.get('amount', 0))
+    except (ValueError, TypeError):
+        amount = 0
+    if amount <= 0:
+        logger.warning(f"Payment webhook: invalid amount {data.get('amount')} for {reference}")
+        return {"status": "invalid_amount"}
+
+    # Retries are answered without taking any lock
+    if _already_credited(db, reference):
+        return {"status": "duplicate"}
+
+    try:
+        credited = db.execute(
+            update(Card)
+            .where(Card.id == card_id)
+            .values(balance=func.coalesce(Card.balance, 0) + amount, updated_at=func.now()),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        if not credited:
+            db.rollback()
+            logger.warning(f"Payment webhook: card {card_id} not found for {reference}")
+            return {"status": "not_found"}
+        # The card row stays locked by the increment until commit, so this is the balance it produced
+        balance_after = db.query(Card.balance).filter(Card.id == card_id).scalar()
+        db.execute(insert(CardPaymentCredit).values(
+            card_id=card_id,
+            card_transaction_id=transaction_pk,
+            payment_reference=reference,
+            amount=amount,
+            balance_after=balance_after,
+            entry_type="customer_payment",
+        ))
+        db.execute(
+            update(CardTransaction).where(CardTransaction.id == transaction_pk).values(**payment_values),
+            execution_options={"synchronize_session": False},
+        )
+        db.commit()
+    except IntegrityError:
+        # Credited concurrently by another delivery of the same notification
+        db.rollback()
+        return {"status": "duplicate"}
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Credited {amount} to card {card_id} for payment {reference}")
+    return {"status": "success"}
@@ -0,0 +1,151 @@
+"""
+Category Classifier Service
+Maps a transaction's type and category text to its financial statement lines
+"""
+
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.transaction import Transaction, TransactionType
+
+logger = logging.getLogger(__name__)
+
+# Distinct (type, category) pairs whose classification is kept in memory
+CLASSIFIER_CACHE_SIZE = int(os.getenv("CLASSIFIER_CACHE_SIZE", "4096"))
+
+T = TransactionType
+
+# Per dimension and transaction type: ordered (line, keywords) rules, first
+# match wins, and the line used when none match
+CLASSIFICATION_RULES: Dict[str, Dict[TransactionType, Tuple[List[Tuple[str, List[str]]], Optional[str]]]] = {
+    # Income statement line for revenue and expenses, balance sheet line otherwise
+    "statement_bucket": {
+        T.REVENUE: ([], "revenue"),
+        T.EXPENSE: ([
+            ("cost_of_goods_sold", ['cost', 'goods', 'inventory', 'materials']),
+            ("interest_expense", ['interest']),
+            ("income_tax", ['tax']),
+        ], "operating_expenses"),
+        T.ASSET: ([("current_assets", ['cash', 'bank', 'receivable', 'inventory', 'prepaid'])], "fixed_assets"),
+        T.LIABILITY: ([("current_liabilities", ['payable', 'short', 'accrued'])], "long_term_liabilities"),
+        T.EQUITY: ([("owner_equity", ['capital', 'owner'])], "retained_earnings"),
+    },
+    # Adjustment line on the monthly cash flow statement
+    "cash_flow_line": {
+        T.EXPENSE: ([("depreciation", ['depreciation'])], None),
+        T.ASSET: ([
+            ("accounts_receivable", ['receivable']),
+            ("inventory", ['inventory']),
+            ("equipment_purchases", ['equipment', 'machinery']),
+        ], None),
+        T.LIABILITY: ([("accounts_payable", ['payable']), ("loan_proceeds", ['loan'])], None),
+        T.EQUITY: ([("owner_withdrawals", ['withdrawal', 'drawing'])], None),
+    },
+    # Activity in the cash flow analytics beyond revenue and expenses
+    "cash_flow_activity": {
+        T.EXPENSE: ([("non_cash", ['depreciation'])], None),
+        T.ASSET: ([("investing", ['equipment', 'machinery', 'building', 'vehicle'])], None),
+        T.LIABILITY: ([("financing", ['loan'])], None),
+        T.EQUITY: ([("financing", ['withdrawal', 'drawing'])], None),
+    },
+}
+
+DEFAULT_STATEMENT_BUCKET = "other"
+
+
+class Classification(NamedTuple):
+    statement_bucket: str
+    cash_flow_line: Optional[str]
+    cash_flow_activity: Optional[str]
+
+
+def _compile(rules: List[Tuple[str, List[str]]]):
+    """
+    One regex for an ordered rule list. Each rule is a lookahead branch with an
+    empty named group, tried in order from the start of the text, so the first
+    rule with any keyword anywhere in the text wins exactly as the keyword lists
+    did, in a single match call
+    """
+    if not rules:
+        return None
+    branches = [
+        f"(?=.*?(?:{'|'.join(re.escape(keyword) for keyword in keywords)}))(?P<r{index}>)"
+        for index, (_, keywords) in enumerate(rules)
+    ]
+    return re.compile(f"^(?:{'|'.join(branches)})", re.DOTALL)
+
+
+class CategoryClassifier:
+    """
+    Compiled CLASSIFICATION_RULES with the result per distinct (type,
+    category) pair memoized in a bounded LRU. Transactions store their
+    classification when written, so statements never look at category text.
+    """
+
+    def __init__(self, rules=CLASSIFICATION_RULES, cache_size: int = CLASSIFIER_CACHE_SIZE):
+        self._matchers = {}
+        for dimension, by_type in rules.items():
+            for transaction_type, (type_rules, default) in by_type.items():
+                lines = [line for line, _ in type_rules]
+                self._matchers[(dimension, transaction_type)] = (_compile(type_rules), lines, default)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _line(self, dimension: str, transaction_type: TransactionType, text: str) -> Optional[str]:
+        matcher = self._matchers.get((dimension, transaction_type))
+        if matcher is None:
+            return None
+        pattern, lines, default = matcher
+        match = pattern.match(text) if pattern else None
+        if match is None:
+            return default
+        return lines[int(match.lastgroup[1:])]
+
+    def _classify(self, transaction_type: TransactionType, category: Optional[str]) -> Classification:
+        text = (category or '').lower()
+        return Classification(
+            statement_bucket=self._line("statement_bucket", transaction_type, text) or DEFAULT_STATEMENT_BUCKET,
+            cash_flow_line=self._line("cash_flow_line", transaction_type, text),
+            cash_flow_activity=self._line("cash_flow_activity", transaction_type, text),
+        )
+
+    def apply(self, transaction: Transaction) -> Classification:
+        """Store the classification of a transaction's current type and category on it"""
+        classification = self.classify(transaction.type, transaction.category)
+        transaction.statement_bucket = classification.statement_bucket
+        transaction.cash_flow_line = classification.cash_flow_line
+        transaction.cash_flow_activity = classification.cash_flow_activity
+        return classification
+
+    def reclassify_transactions(self, db: Session) -> int:
+        """
+        Rewrite the stored classification of every transaction, one UPDATE per
+        distinct (type, category) pair. Run after changing the rules.
+
+        Returns:
+            Number of distinct pairs classified
+        """
+        pairs = db.query(Transaction.type, Transaction.category).distinct().all()
+        try:
+            for transaction_type, category in pairs:
+                classification = self.classify(transaction_type, category)
+                query = db.query(Transaction).filter(Transaction.type == transaction_type)
+                if category is None:
+                    query = query.filter(Transaction.category.is_(None))
+                else:
+                    query = query.filter(Transaction.category == category)
+                query.update(classification._asdict(), synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        logger.info(f"Reclassified transactions for {len(pairs)} type/category pairs")
+        return len(pairs)
+
+
+# Create singleton instance
+category_classifier = CategoryClassifier()
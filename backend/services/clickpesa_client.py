@@ -0,0 +1,196 @@
+"""
+ClickPesa Client Service
+Pooled async HTTP client for the ClickPesa API with a cached, single-flight access token
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CLICKPESA_BASE_URL = os.getenv("CLICKPESA_BASE_URL", "https://api.clickpesa.com")
+
+# Seconds to wait for a connection and for a whole request
+CLICKPESA_CONNECT_TIMEOUT = float(os.getenv("CLICKPESA_CONNECT_TIMEOUT", "5"))
+CLICKPESA_TIMEOUT = float(os.getenv("CLICKPESA_TIMEOUT", "10"))
+
+# Extra attempts after a connection error or a 429/5xx gateway response, for
+# token requests and GETs only: a failed POST may still have been processed
+CLICKPESA_MAX_RETRIES = int(os.getenv("CLICKPESA_MAX_RETRIES", "2"))
+CLICKPESA_RETRY_BACKOFF = float(os.getenv("CLICKPESA_RETRY_BACKOFF", "0.5"))
+
+# Kept-alive connections shared by all requests
+CLICKPESA_MAX_CONNECTIONS = int(os.getenv("CLICKPESA_MAX_CONNECTIONS", "20"))
+CLICKPESA_KEEPALIVE_CONNECTIONS = int(os.getenv("CLICKPESA_KEEPALIVE_CONNECTIONS", "10"))
+
+# ClickPesa tokens are valid for an hour; they are replaced this many seconds early
+CLICKPESA_TOKEN_TTL = float(os.getenv("CLICKPESA_TOKEN_TTL", "3600"))
+CLICKPESA_TOKEN_REFRESH_MARGIN = float(os.getenv("CLICKPESA_TOKEN_REFRESH_MARGIN", "300"))
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+class ClickPesaError(Exception):
+    """ClickPesa could not be reached or rejected a request"""
+
+
+class ClickPesaClient:
+    """
+    One httpx.AsyncClient per event loop, so every call reuses kept-alive TLS
+    connections, and one access token shared by all calls. The token is
+    replaced shortly before it expires; concurrent callers that find it stale
+    wait on a lock while a single /generate-token request runs.
+    """
+
+    def __init__(
+        self,
+        base_url: str = CLICKPESA_BASE_URL,
+        api_key: Optional[str] = None,
+        client_id: Optional[str] = None,
+        timeout: float = CLICKPESA_TIMEOUT,
+        connect_timeout: float = CLICKPESA_CONNECT_TIMEOUT,
+        max_retries: int = CLICKPESA_MAX_RETRIES,
+        retry_backoff: float = CLICKPESA_RETRY_BACKOFF,
+        token_ttl: float = CLICKPESA_TOKEN_TTL,
+        refresh_margin: float = CLICKPESA_TOKEN_REFRESH_MARGIN,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.client_id = client_id
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.token_ttl = token_ttl
+        self.refresh_margin = refresh_margin
+        self.transport = transport  # e.g. httpx.ASGITransport(app=clickpesa_mock_server.app) in tests
+
+        self._http: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock: Optional[asyncio.Lock] = None
+
+    def _credentials(self) -> Dict[str, str]:
+        # Read at call time so credentials loaded after import are picked up
+        return {
+            "api-key": self.api_key or os.getenv("CLICKPESA_API_KEY") or "",
+            "client-id": self.client_id or os.getenv("CLICKPESA_CLIENT_ID") or "",
+        }
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            # Connections and locks belong to the loop that created them
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=CLICKPESA_MAX_CONNECTIONS,
+                    max_keepalive_connections=CLICKPESA_KEEPALIVE_CONNECTIONS,
+                ),
+                transport=self.transport,
+            )
+            self._loop = loop
+            self._token_lock = asyncio.Lock()
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self._loop = None
+
+    async def _send(self, method: str, path: str, retry: bool = False, **kwargs) -> httpx.Response:
+        """
+        Send a request. With retry, connection errors and retryable statuses
+        are retried with exponential backoff; only pass it for requests that
+        are safe to repeat.
+        """
+        http = self._client()
+        attempts = self.max_retries + 1 if retry else 1
+        for attempt in range(attempts):
+            try:
+                response = await http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == attempts - 1:
+                    raise ClickPesaError(f"ClickPesa request {path} failed: {str(e)}") from e
+                logger.warning(f"ClickPesa request {path} failed ({str(e)}), retrying")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == attempts - 1:
+                    return response
+                logger.warning(f"ClickPesa request {path} returned {response.status_code}, retrying")
+            await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+    async def _generate_token(self) -> str:
+        # Issuing a token has no side effects, so it is retried like a GET
+        response = await self._send("POST", "/third-parties/generate-token", retry=True, headers=self._credentials())
+        if response.status_code >= 400:
+            raise ClickPesaError(f"ClickPesa token request returned {response.status_code}: {response.text}")
+        data = response.json()
+        if not data.get("success") or "token" not in data:
+            raise ClickPesaError("Failed to get ClickPesa token")
+        return data["token"]
+
+    def _token_fresh(self) -> bool:
+        return self._token is not None and time.monotonic() < self._token_expires_at - self.refresh_margin
+
+    async def get_token(self) -> str:
+        """Cached access token, fetched by a single caller when missing or about to expire"""
+        if self._token_fresh():
+            return self._token
+        self._client()
+        async with self._token_lock:
+            if not self._token_fresh():
+                self._token = await self._generate_token()
+                self._token_expires_at = time.monotonic() + self.token_ttl
+                logger.info("Refreshed ClickPesa access token")
+            return self._token
+
+    def invalidate_token(self) -> None:
+        self._token = None
+        self._token_expires_at = 0.0
+
+    async def request(self, method: str, path: str, **kwargs) -> Dict:
+        """
+        Authorized API call returning the JSON body. A 401 means the token was
+        revoked or expired early and the call was rejected unprocessed: the
+        token is replaced once and the call repeated. Connection errors and
+        5xx responses are only retried for GETs.
+        """
+        headers = kwargs.pop("headers", {})
+        for attempt in range(2):
+            token = await self.get_token()
+            response = await self._send(
+                method, path, retry=method.upper() == "GET", headers={**headers, "Authorization": token}, **kwargs
+            )
+            if response.status_code == 401 and attempt == 0:
+                if self._token == token:
+                    self.invalidate_token()
+                continue
+            if response.status_code >= 400:
+                raise ClickPesaError(f"ClickPesa request {path} returned {response.status_code}: {response.text}")
+            return response.json()
+
+    async def create_customer_control_number(self, billpay_request: Dict) -> Dict:
+        """
+        Create a Customer BillPay Control Number. Not retried after a
+        connection error or 5xx, since ClickPesa may already have created it;
+        callers retry with the same billReference, so the bill stays tied to
+        one payment reference.
+        """
+        return await self.request(
+            "POST", "/third-parties/billpay/create-customer-control-number", json=billpay_request
+        )
+
+
+# Create singleton instance
+clickpesa_client = ClickPesaClient()
@@ -0,0 +1,125 @@
+"""
+ID Allocator Service
+Sequential business identifiers (ESC-, EMP-, TXN-) from blocks reserved in a sequence table
+"""
+
+import logging
+import os
+import re
+import threading
+from typing import Callable, Dict
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.id_sequence import IdSequence
+from models.escrow import Escrow
+from models.payroll import Staff
+
+logger = logging.getLogger(__name__)
+
+# Values each process reserves per round trip to the sequence table
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", "20"))
+
+
+def _max_suffix(db: Session, column, prefix: str) -> int:
+    """Highest number after prefix among existing identifiers, scanned once when a sequence is created"""
+    pattern = re.compile(rf"^{re.escape(prefix)}(\d+)$")
+    highest = 0
+    for (value,) in db.query(column).filter(column.like(f"{prefix}%")):
+        match = pattern.match(value or "")
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
+
+
+def _seed_staff(db: Session) -> int:
+    # create_staff used to number from the highest staff id, so stay above both
+    return max(db.query(func.max(Staff.id)).scalar() or 0, _max_suffix(db, Staff.employee_number, "EMP"))
+
+
+# Sequence name: (identifier format, seed returning the last number already in use)
+SEQUENCES: Dict[str, tuple] = {
+    "escrow": ("ESC-{:03d}", lambda db: _max_suffix(db, Escrow.escrow_id, "ESC-")),
+    "staff": ("EMP{:04d}", _seed_staff),
+    # Nine digits never clash with the eight-character random ids issued before
+    "transaction": ("TXN-{:09d}", lambda db: 0),
+}
+
+
+class IdAllocator:
+    """
+    Hands out sequence numbers from blocks reserved per process. Reserving a
+    block is one UPDATE ... SET next_value = next_value + n of the sequence
+    row in its own short transaction, so requests never read the business
+    tables to find the next id and concurrent processes can't be handed the
+    same number. Numbers left in a block when a process exits are skipped,
+    not reused.
+    """
+
+    def __init__(self, block_size: int = ID_BLOCK_SIZE, session_factory: Callable[[], Session] = SessionLocal):
+        self.block_size = block_size
+        self.session_factory = session_factory
+        self._blocks: Dict[str, list] = {}  # name -> [next, end)
+        self._locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in SEQUENCES}
+
+    def _reserve(self, name: str, count: int) -> int:
+        """Reserve count consecutive numbers in the sequence table; returns the first"""
+        db = self.session_factory()
+        try:
+            for _ in range(2):
+                # Increment in place: the UPDATE holds the row lock until commit,
+                # so concurrent reservations serialize instead of reading stale values
+                updated = db.query(IdSequence).filter(IdSequence.name == name).update(
+                    {IdSequence.next_value: IdSequence.next_value + count}, synchronize_session=False
+                )
+                if not updated:
+                    # First use: start after the highest identifier already issued
+                    db.add(IdSequence(name=name, next_value=SEQUENCES[name][1](db) + 1 + count))
+                    try:
+                        db.flush()
+                    except IntegrityError:
+                        db.rollback()  # Another process created it first; increment theirs
+                        continue
+                end = db.query(IdSequence.next_value).filter(IdSequence.name == name).scalar()
+                db.commit()
+                return end - count
+            raise RuntimeError(f"Could not reserve ids for sequence {name}")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def next_value(self, name: str) -> int:
+        """Next number of a sequence, from this process's reserved block"""
+        with self._locks[name]:
+            block = self._blocks.get(name)
+            if block is None or block[0] >= block[1]:
+                first = self._reserve(name, self.block_size)
+                block = self._blocks[name] = [first, first + self.block_size]
+            value = block[0]
+            block[0] += 1
+            return value
+
+    def reserve_block(self, name: str, count: int) -> range:
+        """count contiguous numbers reserved directly from the table, for bulk inserts"""
+        if count <= 0:
+            return range(0)
+        with self._locks[name]:
+            first = self._reserve(name, count)
+        return range(first, first + count)
+
+    @staticmethod
+    def format(name: str, value: int) -> str:
+        return SEQUENCES[name][0].format(value)
+
+    def next_id(self, name: str) -> str:
+        """Next formatted identifier of a sequence, e.g. ESC-042"""
+        return self.format(name, self.next_value(name))
+
+
+# Create singleton instance
+id_allocator = IdAllocator()
@@ -0,0 +1,175 @@
+"""
+Ledger Rollup Service
+Monthly transaction totals per (type, statement bucket, category) for statements and analytics
+"""
+
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import extract, func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.transaction import Transaction, TransactionType, LedgerRollup
+from services.category_classifier import category_classifier
+
+logger = logging.getLogger(__name__)
+
+# Rollup rows written per INSERT round trip during a rebuild
+REBUILD_BATCH_SIZE = 1000
+
+# Income statement lines of expense transactions
+EXPENSE_BUCKETS = ("cost_of_goods_sold", "interest_expense", "income_tax", "operating_expenses")
+
+
+def period_of(value: datetime) -> str:
+    return value.strftime('%Y-%m')
+
+
+def parse_month(month: str) -> Tuple[str, datetime, datetime]:
+    """YYYY-MM to (period, first day, first day of the next month); raises ValueError"""
+    start = datetime.strptime(month, '%Y-%m')
+    end = datetime(start.year + 1, 1, 1) if start.month == 12 else datetime(start.year, start.month + 1, 1)
+    return period_of(start), start, end
+
+
+def shift_period(period: str, months: int) -> str:
+    """The period months later (or earlier, when negative)"""
+    year, month = map(int, period.split('-'))
+    index = year * 12 + month - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def rollup_key(transaction: Transaction) -> tuple:
+    """(period, type, bucket, category) of a transaction, classified before it was passed in"""
+    return (
+        period_of(transaction.transaction_date),
+        transaction.type,
+        transaction.statement_bucket or category_classifier.classify(transaction.type, transaction.category).statement_bucket,
+        transaction.category or "",
+    )
+
+
+def _key_filter(query, key: tuple):
+    period, transaction_type, bucket, category = key
+    return query.filter(
+        LedgerRollup.period == period,
+        LedgerRollup.type == transaction_type,
+        LedgerRollup.bucket == bucket,
+        LedgerRollup.category == category,
+    )
+
+
+def apply_delta(db: Session, key: tuple, amount: float, count: int) -> None:
+    """
+    Add amount and count to a rollup row in the caller's transaction, so the
+    rollup commits or rolls back together with the ledger write
+    """
+    for _ in range(2):
+        updated = _key_filter(db.query(LedgerRollup), key).update(
+            {
+                LedgerRollup.amount: LedgerRollup.amount + amount,
+                LedgerRollup.transaction_count: LedgerRollup.transaction_count + count,
+            },
+            synchronize_session=False,
+        )
+        if updated:
+            if count < 0:
+                # Drop buckets that no longer hold any transaction
+                _key_filter(db.query(LedgerRollup), key).filter(
+                    LedgerRollup.transaction_count <= 0
+                ).delete(synchronize_session=False)
+            return
+        period, transaction_type, bucket, category = key
+        classification = category_classifier.classify(transaction_type, category or None)
+        try:
+            with db.begin_nested():
+                db.add(LedgerRollup(
+                    period=period, type=transaction_type, bucket=bucket, category=category,
+                    cash_flow_line=classification.cash_flow_line,
+                    cash_flow_activity=classification.cash_flow_activity,
+                    amount=amount, transaction_count=count,
+                ))
+            return
+        except IntegrityError:
+            continue  # Created concurrently; add to that row instead
+    raise RuntimeError(f"Could not update ledger rollup {key}")
+
+
+def record(db: Session, transaction: Transaction, sign: int = 1) -> None:
+    """Add (sign=1) or remove (sign=-1) a transaction's contribution to its monthly bucket"""
+    apply_delta(db, rollup_key(transaction), sign * (transaction.amount or 0), sign)
+
+
+def move(db: Session, old_key: tuple, old_amount: float, transaction: Transaction) -> None:
+    """Move an edited transaction's contribution from its previous bucket and amount to its current ones"""
+    new_key = rollup_key(transaction)
+    if new_key == old_key:
+        if transaction.amount != old_amount:
+            apply_delta(db, new_key, (transaction.amount or 0) - (old_amount or 0), 0)
+        return
+    apply_delta(db, old_key, -(old_amount or 0), -1)
+    record(db, transaction)
+
+
+def rebuild(db: Session) -> int:
+    """
+    Recompute the whole rollup from the ledger with one grouped aggregate.
+    Replaces the existing rows in a single transaction.
+
+    Returns:
+        Number of rollup rows written
+    """
+    year = extract('year', Transaction.transaction_date)
+    month = extract('month', Transaction.transaction_date)
+    grouped = db.query(
+        year, month, Transaction.type, Transaction.category,
+        func.sum(Transaction.amount), func.count(Transaction.id)
+    ).group_by(year, month, Transaction.type, Transaction.category)
+
+    totals = {}
+    for year_value, month_value, transaction_type, category, amount, count in grouped:
+        key = (
+            f"{int(year_value):04d}-{int(month_value):02d}",
+            transaction_type,
+            category_classifier.classify(transaction_type, category).statement_bucket,
+            category or "",
+        )
+        # NULL and "" categories share a rollup row
+        previous_amount, previous_count = totals.get(key, (0, 0))
+        totals[key] = (previous_amount + (amount or 0), previous_count + count)
+
+    rows = []
+    for (period, transaction_type, bucket, category), (amount, count) in totals.items():
+        classification = category_classifier.classify(transaction_type, category or None)
+        rows.append({
+            "period": period, "type": transaction_type, "bucket": bucket, "category": category,
+            "cash_flow_line": classification.cash_flow_line,
+            "cash_flow_activity": classification.cash_flow_activity,
+            "amount": amount, "transaction_count": count,
+        })
+    try:
+        db.query(LedgerRollup).delete(synchronize_session=False)
+        for start in range(0, len(rows), REBUILD_BATCH_SIZE):
+            db.execute(insert(LedgerRollup), rows[start:start + REBUILD_BATCH_SIZE])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Rebuilt ledger rollup: {len(rows)} rows")
+    return len(rows)
+
+
+def rollup_rows(db: Session, start_period: Optional[str] = None, end_period: Optional[str] = None,
+                types: Optional[List[TransactionType]] = None) -> List[LedgerRollup]:
+    """Rollup rows for periods in [start_period, end_period], both optional and inclusive"""
+    query = db.query(LedgerRollup)
+    if start_period:
+        query = query.filter(LedgerRollup.period >= start_period)
+    if end_period:
+        query = query.filter(LedgerRollup.period <= end_period)
+    if types:
+        query = query.filter(LedgerRollup.type.in_(types))
+    return query.order_by(LedgerRollup.period).all()
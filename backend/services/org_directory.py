@@ -0,0 +1,240 @@
+"""
+Org Directory Service
+Cached branch, department and role listings with employee counts
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from itertools import islice
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models.payroll import Staff, Branch, Department, Role
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_TABLES = (Branch, Department, Role, Staff)
+
+# Seconds between checks of the watermark for changes made by other processes
+WATERMARK_CHECK_SECONDS = 30
+
+
+def _json_field(value, label: str) -> list:
+    """Parse an org JSON text column, treating bad JSON as empty"""
+    if not value:
+        return []
+    try:
+        return json.loads(value)
+    except (json.JSONDecodeError, TypeError):
+        logger.warning(f"Invalid JSON in {label}: {value}")
+        return []
+
+
+def _search_text(*fields) -> str:
+    """Lowercased fields an entry is searched by, joined once when the cache is built"""
+    return "\n".join(field.lower() for field in fields if field)
+
+
+class OrgDirectory:
+    """
+    Active branches, departments and roles in the shape the HR frontend
+    expects, with employee counts from a single GROUP BY over staff.
+
+    Built in five queries and cached until invalidate(), which every write
+    path calls after committing, or until the watermark (row count and latest
+    updated_at of the org and staff tables, read in one statement) moves.
+    The watermark only catches writes made by other processes, so it is read
+    at most every WATERMARK_CHECK_SECONDS rather than on each request.
+    Departments and roles are also grouped by their parent id, so filtered
+    listings don't scan the whole cache.
+    """
+
+    def __init__(self, check_interval: float = WATERMARK_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._watermark = None
+        self._checked_at: Optional[float] = None
+        self._branches: List[Dict] = []
+        self._departments: List[Dict] = []
+        self._roles: List[Dict] = []
+        self._departments_by_branch: Dict[int, List[Dict]] = {}
+        self._roles_by_department: Dict[int, List[Dict]] = {}
+        self._role_counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._checked_at = None
+            self._watermark = None
+
+    def _current_watermark(self, db: Session) -> tuple:
+        columns = []
+        for model in WATERMARK_TABLES:
+            columns.append(select(func.count(model.id)).scalar_subquery())
+            columns.append(select(func.max(model.updated_at)).scalar_subquery())
+        return tuple(db.execute(select(*columns)).one())
+
+    def _refresh(self, db: Session) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+
+        watermark = self._current_watermark(db)
+        with self._lock:
+            if watermark == self._watermark:
+                self._checked_at = now
+                return
+
+        # Employee counts per branch, department and role in one grouped query
+        branch_counts, department_counts, role_counts = Counter(), Counter(), Counter()
+        grouped = db.query(Staff.branch_id, Staff.department_id, Staff.role_id, func.count(Staff.id)).group_by(
+            Staff.branch_id, Staff.department_id, Staff.role_id
+        )
+        for branch_id, department_id, role_id, count in grouped:
+            branch_counts[branch_id] += count
+            department_counts[department_id] += count
+            role_counts[role_id] += count
+
+        branches = []
+        for branch in db.query(Branch).filter(Branch.is_active == True).order_by(Branch.id):
+            employee_count = branch_counts[branch.id]
+            branches.append({
+                "id": str(branch.id),
+                "name": branch.name,
+                "address": branch.address or "",
+                "phone": branch.phone or "",
+                "email": branch.email or "",
+                "manager": branch.manager or "No Manager",
+                "employees": employee_count,
+                "status": "active" if branch.is_active else "inactive",
+                "establishedDate": branch.created_at.strftime("%Y-%m-%d") if branch.created_at else "",
+                "monthlyBudget": 0,  # TODO: Calculate from departments
+                "annualBudget": 0,  # TODO: Calculate from departments
+                "departments": [],  # TODO: Get actual departments
+                "staff": [],  # TODO: Get actual staff
+                "attendance": {
+                    "available": employee_count,
+                    "onLeave": 0,
+                    "absent": 0
+                },
+                "_search": _search_text(branch.name, branch.city, branch.state)
+            })
+
+        departments = []
+        department_rows = (
+            db.query(Department, Branch.name)
+            .outerjoin(Branch, Branch.id == Department.branch_id)
+            .filter(Department.is_active == True)
+            .order_by(Department.id)
+        )
+        for dept, branch_name in department_rows:
+            departments.append({
+                "id": str(dept.id),
+                "name": dept.name,
+                "description": dept.description or "",
+                "manager": dept.manager or "No Manager",
+                "employees": department_counts[dept.id],
+                "branch": branch_name or f"Branch {dept.branch_id}",
+                "branch_id": dept.branch_id,  # Add branch_id for frontend filtering
+                "status": "active" if dept.is_active else "inactive",
+                "phone": dept.phone or "",
+                "email": dept.email or "",
+                "establishedDate": dept.created_at.strftime("%Y-%m-%d") if dept.created_at else "",
+                "budget": dept.budget,
+                "objectives": _json_field(dept.objectives, f"objectives for department {dept.id}"),
+                "teamMembers": [],  # TODO: Get actual team members
+                "_search": _search_text(dept.name)
+            })
+
+        roles = []
+        role_rows = (
+            db.query(Role, Department.name, Department.branch_id, Branch.name)
+            .outerjoin(Department, Department.id == Role.department_id)
+            .outerjoin(Branch, Branch.id == Department.branch_id)
+            .filter(Role.is_active == True)
+            .order_by(Role.id)
+        )
+        for role, department_name, branch_id, branch_name in role_rows:
+            if branch_id is None:
+                branch_label = "Unknown Branch"
+            else:
+                branch_label = branch_name or f"Branch {branch_id}"
+            roles.append({
+                "id": str(role.id),
+                "name": role.name,
+                "description": role.description or "",
+                "department": department_name or f"Department {role.department_id}",
+                "department_id": role.department_id,  # Add department_id for frontend filtering
+                "level": role.level or "Mid",
+                "branch": branch_label,
+                "branch_id": branch_id,  # Add branch_id for frontend
+                "reports_to": role.reports_to or "",
+                "status": role.status or "active",
+                "experience_required": role.experience_required or "",
+                "education_required": role.education_required or "",
+                "key_skills": _json_field(role.key_skills, f"key_skills for role {role.id}"),
+                "minSalary": role.min_salary or 0,
+                "maxSalary": role.max_salary or 0,
+                "responsibilities": _json_field(role.responsibilities, f"responsibilities for role {role.id}"),
+                "requirements": _json_field(role.requirements, f"requirements for role {role.id}"),
+                "createdDate": role.created_at.strftime("%Y-%m-%d") if role.created_at else "",
+                "employees": role_counts[role.id],
+                "_search": _search_text(role.name)
+            })
+
+        departments_by_branch, roles_by_department = defaultdict(list), defaultdict(list)
+        for dept in departments:
+            departments_by_branch[dept["branch_id"]].append(dept)
+        for role in roles:
+            roles_by_department[role["department_id"]].append(role)
+
+        with self._lock:
+            self._branches, self._departments, self._roles = branches, departments, roles
+            self._departments_by_branch = dict(departments_by_branch)
+            self._roles_by_department = dict(roles_by_department)
+            self._role_counts = role_counts
+            self._watermark = watermark
+            self._checked_at = now
+
+    @staticmethod
+    def _page(entries: List[Dict], skip: int, limit: int, search: Optional[str] = None) -> List[Dict]:
+        """
+        One page of the entries whose fields contain search, case-insensitively
+        like ILIKE '%search%'. Matching stops once the page is full.
+        """
+        needle = search.lower() if search else None
+        matching = (entry for entry in entries if not needle or needle in entry["_search"])
+        return [
+            {key: value for key, value in entry.items() if key != "_search"}
+            for entry in islice(matching, skip, skip + limit)
+        ]
+
+    def branches(self, db: Session, skip: int = 0, limit: int = 100, search: Optional[str] = None) -> List[Dict]:
+        self._refresh(db)
+        return self._page(self._branches, skip, limit, search)
+
+    def departments(self, db: Session, skip: int = 0, limit: int = 100,
+                    branch_id: Optional[int] = None, search: Optional[str] = None) -> List[Dict]:
+        self._refresh(db)
+        candidates = self._departments_by_branch.get(branch_id, []) if branch_id else self._departments
+        return self._page(candidates, skip, limit, search)
+
+    def roles(self, db: Session, skip: int = 0, limit: int = 100,
+              department_id: Optional[int] = None, search: Optional[str] = None) -> List[Dict]:
+        self._refresh(db)
+        candidates = self._roles_by_department.get(department_id, []) if department_id else self._roles
+        return self._page(candidates, skip, limit, search)
+
+    def role_employees(self, db: Session, role_id: int) -> int:
+        """Number of staff holding a role"""
+        self._refresh(db)
+        return self._role_counts[role_id]
+
+
+# Create singleton instance
+org_directory = OrgDirectory()
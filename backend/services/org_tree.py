@@ -0,0 +1,183 @@
+"""
+Org Tree Service
+In-memory reporting hierarchy with ancestor, subtree and headcount lookups
+"""
+
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.payroll import Staff, Branch, Department
+
+logger = logging.getLogger(__name__)
+
+
+class OrgTree:
+    """
+    Reporting tree built from one scan of staff.reporting_manager_id.
+
+    Staff are laid out in depth-first order, so everyone under a manager sits
+    in one contiguous slice: descendant checks and headcounts are O(1) and a
+    subtree is a slice. Reporting cycles, which the schema doesn't prevent, are
+    broken by treating one member of the cycle as a root.
+    """
+
+    def __init__(self, rows, branch_managers: Dict[int, List[int]], department_managers: Dict[int, List[int]]):
+        self.nodes: Dict[int, Dict] = {}
+        self.parent: Dict[int, Optional[int]] = {}
+        self.children: Dict[int, List[int]] = {}
+        for staff_id, first_name, last_name, manager_id, branch_id, department_id, role_id, is_active in rows:
+            self.nodes[staff_id] = {
+                "id": staff_id,
+                "name": f"{first_name} {last_name}",
+                "reporting_manager_id": manager_id,
+                "branch_id": branch_id,
+                "department_id": department_id,
+                "role_id": role_id,
+                "is_active": bool(is_active),
+            }
+            self.parent[staff_id] = manager_id
+            self.children.setdefault(staff_id, [])
+
+        roots = []
+        for staff_id, manager_id in self.parent.items():
+            if manager_id is None or manager_id not in self.nodes or manager_id == staff_id:
+                self.parent[staff_id] = None
+                roots.append(staff_id)
+            else:
+                self.children[manager_id].append(staff_id)
+
+        self.order: List[int] = []
+        self.enter: Dict[int, int] = {}
+        self.exit: Dict[int, int] = {}
+        self.depth: Dict[int, int] = {}
+        for root in roots:
+            self._walk(root)
+
+        # Whatever is left hangs off a reporting cycle: follow managers up until
+        # one repeats, which is on the cycle, and make that member a root
+        for staff_id in sorted(self.nodes):
+            if staff_id in self.enter:
+                continue
+            seen = set()
+            while staff_id not in seen:
+                seen.add(staff_id)
+                staff_id = self.parent[staff_id]
+            self.children[self.parent[staff_id]].remove(staff_id)
+            self.parent[staff_id] = None
+            self._walk(staff_id)
+
+        # Prefix sums of active staff over the depth-first order
+        self._active_prefix = [0]
+        for staff_id in self.order:
+            self._active_prefix.append(self._active_prefix[-1] + self.nodes[staff_id]["is_active"])
+
+        self.branch_managers = branch_managers
+        self.department_managers = department_managers
+
+    def _walk(self, root: int) -> None:
+        """Iterative depth-first numbering of root's subtree"""
+        self.depth[root] = 0
+        stack = [(root, False)]
+        while stack:
+            staff_id, done = stack.pop()
+            if done:
+                self.exit[staff_id] = len(self.order)
+                continue
+            self.enter[staff_id] = len(self.order)
+            self.order.append(staff_id)
+            stack.append((staff_id, True))
+            for child in reversed(self.children[staff_id]):
+                if child not in self.enter:
+                    self.depth[child] = self.depth[staff_id] + 1
+                    stack.append((child, False))
+
+    def __contains__(self, staff_id: int) -> bool:
+        return staff_id in self.nodes
+
+    def is_ancestor(self, manager_id: int, staff_id: int) -> bool:
+        """Whether staff_id reports to manager_id, directly or indirectly"""
+        if manager_id not in self.nodes or staff_id not in self.nodes or manager_id == staff_id:
+            return False
+        return self.enter[manager_id] < self.enter[staff_id] < self.exit[manager_id]
+
+    def ancestors(self, staff_id: int) -> List[Dict]:
+        """Reporting chain from the direct manager up to the top"""
+        chain = []
+        manager_id = self.parent.get(staff_id)
+        while manager_id is not None:
+            chain.append(self.nodes[manager_id])
+            manager_id = self.parent[manager_id]
+        return chain
+
+    def subtree(self, staff_id: int, max_depth: Optional[int] = None, include_inactive: bool = False) -> List[Dict]:
+        """Everyone under staff_id in depth-first order, with their depth below staff_id"""
+        base = self.depth[staff_id]
+        result = []
+        for descendant in self.order[self.enter[staff_id] + 1:self.exit[staff_id]]:
+            level = self.depth[descendant] - base
+            if max_depth is not None and level > max_depth:
+                continue
+            node = self.nodes[descendant]
+            if include_inactive or node["is_active"]:
+                result.append({**node, "level": level})
+        return result
+
+    def headcount(self, staff_id: int) -> Dict:
+        start, end = self.enter[staff_id], self.exit[staff_id]
+        return {
+            "staff_id": staff_id,
+            "direct_reports": len(self.children[staff_id]),
+            "total_reports": end - start - 1,
+            "active_reports": self._active_prefix[end] - self._active_prefix[start + 1],
+            "depth": self.depth[staff_id],
+            "manages_branches": self.branch_managers.get(staff_id, []),
+            "manages_departments": self.department_managers.get(staff_id, []),
+        }
+
+
+class OrgTreeIndex:
+    """
+    Holds the current OrgTree, rebuilt on the next lookup after invalidate()
+    (called on staff writes) or when the staff table's watermark moves
+    """
+
+    def __init__(self):
+        self._tree: Optional[OrgTree] = None
+        self._watermark = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._tree = None
+
+    def get(self, db: Session) -> OrgTree:
+        watermark = tuple(db.query(func.count(Staff.id), func.max(Staff.updated_at)).one())
+        with self._lock:
+            if self._tree is not None and watermark == self._watermark:
+                return self._tree
+
+        rows = db.query(
+            Staff.id, Staff.first_name, Staff.last_name, Staff.reporting_manager_id,
+            Staff.branch_id, Staff.department_id, Staff.role_id, Staff.is_active
+        ).all()
+        branch_managers: Dict[int, List[int]] = {}
+        for branch_id, manager_id in db.query(Branch.id, Branch.manager_id).filter(Branch.manager_id.isnot(None)):
+            branch_managers.setdefault(manager_id, []).append(branch_id)
+        department_managers: Dict[int, List[int]] = {}
+        for department_id, manager_id in db.query(Department.id, Department.manager_id).filter(Department.manager_id.isnot(None)):
+            department_managers.setdefault(manager_id, []).append(department_id)
+
+        tree = OrgTree(rows, branch_managers, department_managers)
+        with self._lock:
+            self._tree = tree
+            self._watermark = watermark
+        logger.info(f"Built org tree of {len(tree.nodes)} staff")
+        return tree
+
+
+# Create singleton instance
+org_tree = OrgTreeIndex()
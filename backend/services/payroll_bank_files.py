@@ -0,0 +1,185 @@
+"""
+Payroll Bank Files Service
+Writes per-bank payment batch files for a payroll period
+"""
+
+import csv
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from models.payroll import Staff, PayrollRecord, PayrollCalculation, PaymentBatchFile
+
+logger = logging.getLogger(__name__)
+
+# Batch files are payroll data, so they are kept out of the public uploads directory
+PAYROLL_FILES_DIR = os.getenv("PAYROLL_FILES_DIR", "payroll_files")
+
+# Rows fetched per round trip from the server-side cursor
+BATCH_FETCH_SIZE = 1000
+
+# Account number hash totals are kept to this many digits
+HASH_TOTAL_MODULUS = 10 ** 12
+
+PAYMENT_LINE_COLUMNS = (
+    PayrollRecord.id, Staff.id, Staff.employee_id, Staff.first_name, Staff.last_name,
+    Staff.account_name, Staff.bank_name, Staff.bank_account, PayrollRecord.net_salary,
+)
+
+
+class _HashingWriter:
+    """Text file wrapper that keeps a SHA-256 and byte count of everything written"""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.sha256.update(data)
+        self.size += len(data)
+        self.f.write(data)
+
+
+class _BankFile:
+    """One bank's batch file while it is being written"""
+
+    def __init__(self, directory: str, sequence: int, payroll_period: str, bank_name: str, created_at: datetime):
+        self.bank_name = bank_name
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", bank_name).strip("_").upper() or "BANK"
+        self.file_name = f"payroll_{payroll_period}_{sequence:02d}_{slug}.csv"
+        self.file_path = os.path.join(directory, self.file_name)
+        self._file = open(self.file_path, "wb")
+        self._out = _HashingWriter(self._file)
+        self._writer = csv.writer(self._out)
+        self.line_count = 0
+        self.total_cents = 0
+        self.hash_total = 0
+        self._writer.writerow(["H", payroll_period, bank_name, created_at.strftime("%Y-%m-%d %H:%M:%S")])
+
+    def add(self, row) -> None:
+        _, staff_id, employee_id, first_name, last_name, account_name, _, bank_account, net_salary = row
+        cents = int(round((net_salary or 0) * 100))  # Integer cents keep the control total exact
+        digits = re.sub(r"\D", "", bank_account)
+        self.line_count += 1
+        self.total_cents += cents
+        self.hash_total = (self.hash_total + int(digits or 0)) % HASH_TOTAL_MODULUS
+        self._writer.writerow([
+            "D", self.line_count, bank_account, account_name or f"{first_name} {last_name}",
+            f"{cents // 100}.{cents % 100:02d}", employee_id or staff_id,
+        ])
+
+    def close(self) -> Dict:
+        total = f"{self.total_cents // 100}.{self.total_cents % 100:02d}"
+        self._writer.writerow(["T", self.line_count, total, f"{self.hash_total:012d}"])
+        self._file.close()
+        return {
+            "bank_name": self.bank_name,
+            "file_name": self.file_name,
+            "file_path": self.file_path,
+            "file_size": self._out.size,
+            "file_sha256": self._out.sha256.hexdigest(),
+            "line_count": self.line_count,
+            "total_amount": self.total_cents / 100,
+            "account_hash_total": f"{self.hash_total:012d}",
+        }
+
+
+def remove_payment_files(db: Session, calculation_ids: List[int]) -> int:
+    """Delete the batch files registered against calculations, on disk and in the table"""
+    if not calculation_ids:
+        return 0
+    files = db.query(PaymentBatchFile).filter(PaymentBatchFile.calculation_id.in_(calculation_ids)).all()
+    for batch_file in files:
+        try:
+            os.remove(batch_file.file_path)
+        except FileNotFoundError:
+            pass
+        db.delete(batch_file)
+    return len(files)
+
+
+def payment_lines_query(db: Session, payroll_period: str, branch_id: Optional[int] = None):
+    """Net pay of every record in a period with the staff's bank details, ordered by bank"""
+    query = db.query(*PAYMENT_LINE_COLUMNS).join(Staff, PayrollRecord.staff_id == Staff.id).filter(
+        PayrollRecord.payroll_period == payroll_period
+    )
+    if branch_id:
+        query = query.filter(PayrollRecord.branch_id == branch_id)
+    return query.order_by(Staff.bank_name, PayrollRecord.id)
+
+
+def generate_payment_files(db: Session, calculation: PayrollCalculation) -> Dict:
+    """
+    Write one payment batch file per bank for a calculated payroll period and
+    register them against its PayrollCalculation, replacing any earlier set.
+
+    Lines are read from a server-side cursor ordered by bank, so only one file
+    is open and one batch of rows is in memory at a time. Each file has a
+    header, one line per employee and a trailer with the line count, total
+    amount and account number hash total. Staff without bank details are
+    reported rather than paid. Commits.
+
+    Returns:
+        Dict with the registered files and the staff skipped for missing bank details
+    """
+    created_at = datetime.utcnow()
+    directory = os.path.join(PAYROLL_FILES_DIR, calculation.payroll_period, str(calculation.id))
+    os.makedirs(directory, exist_ok=True)
+    remove_payment_files(db, [calculation.id])
+
+    lines = payment_lines_query(db, calculation.payroll_period, calculation.branch_id).execution_options(
+        stream_results=True, yield_per=BATCH_FETCH_SIZE
+    )
+
+    written: List[Dict] = []
+    missing_bank_details: List[int] = []
+    current: Optional[_BankFile] = None
+    for row in lines:
+        bank_name, bank_account = row[6], row[7]
+        if not bank_name or not bank_account:
+            missing_bank_details.append(row[1])
+            continue
+        if current is None or current.bank_name != bank_name:
+            if current:
+                written.append(current.close())
+            current = _BankFile(directory, len(written) + 1, calculation.payroll_period, bank_name, created_at)
+        current.add(row)
+    if current:
+        written.append(current.close())
+
+    files = [
+        PaymentBatchFile(calculation_id=calculation.id, payroll_period=calculation.payroll_period, created_at=created_at, **info)
+        for info in written
+    ]
+    db.add_all(files)
+    db.commit()
+    logger.info(f"Generated {len(files)} payment batch files for payroll calculation {calculation.id}")
+
+    return {
+        "files": files,
+        "missing_bank_details": missing_bank_details,
+    }
+
+
+def current_payment_files(db: Session, calculation: PayrollCalculation) -> Optional[List[PaymentBatchFile]]:
+    """
+    Registered batch files of a calculation, or None when there are none or
+    the calculation has been recomputed since they were written
+    """
+    files = db.query(PaymentBatchFile).filter(
+        PaymentBatchFile.calculation_id == calculation.id
+    ).order_by(PaymentBatchFile.bank_name).all()
+    if not files:
+        return None
+    if calculation.calculated_at and files[0].created_at < calculation.calculated_at:
+        return None
+    if not all(os.path.exists(f.file_path) for f in files):
+        return None
+    return files
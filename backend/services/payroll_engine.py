@@ -0,0 +1,229 @@
+"""
+Payroll Engine Service
+Computes payroll for a whole batch of staff in one columnar pass
+"""
+
+import hashlib
+import json
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from models.payroll import Staff, Branch, Department, EmploymentStatus
+from services.tax_rules import CompiledTaxRules, DEFAULT_TAX_RULES
+
+# Columns produced by compute_payroll, summed into the batch totals
+RESULT_COLUMNS = (
+    "gross_salary", "paye_tax", "nssf", "nhif", "insurance", "loans",
+    "other_deductions", "total_deductions", "net_salary",
+    "sdl_tax", "wcf", "nssf_employer", "total_employer_costs",
+)
+
+
+def _json_list(value) -> list:
+    """Return a staff JSON column as a list, whether stored as text or JSON"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return []
+    return value if isinstance(value, list) else []
+
+
+def _sum_field(items: list, field: str) -> float:
+    """Sum a numeric field across JSON items, skipping anything unparsable"""
+    total = 0.0
+    for item in items:
+        if isinstance(item, dict) and item.get(field):
+            try:
+                total += float(item[field])
+            except (ValueError, TypeError):
+                pass
+    return total
+
+
+def monthly_insurance(items: list) -> float:
+    """Monthly insurance deduction: annualAmount / 12, falling back to a flat amount"""
+    total = 0.0
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            if item.get('annualAmount'):
+                total += float(item['annualAmount']) / 12
+            elif item.get('amount'):
+                total += float(item['amount'])
+        except (ValueError, TypeError):
+            pass
+    return total
+
+
+class StaffColumns:
+    """Columnar snapshot of the staff taking part in a payroll run"""
+
+    def __init__(self):
+        self.staff_id: List[int] = []
+        self.name: List[str] = []
+        self.branch_id: List[Optional[int]] = []
+        self.department_id: List[Optional[int]] = []
+        self.role_id: List[Optional[int]] = []
+        self.department_name: List[Optional[str]] = []
+        self.branch_name: List[Optional[str]] = []
+        self.basic_salary: List[float] = []
+        self.allowances: List[float] = []
+        self.total_package: List[float] = []
+        self.paye_eligible: List[bool] = []
+        # JSON details reduced to one number per employee at load time
+        self.social_security_pct: List[float] = []
+        self.insurance: List[float] = []
+        self.loans: List[float] = []
+
+    def __len__(self):
+        return len(self.staff_id)
+
+    def append(self, row) -> None:
+        """Append one staff row (see STAFF_COLUMNS for the expected order)"""
+        (staff_id, first_name, last_name, branch_id, department_id, role_id,
+         basic_salary, allowances, total_package, paye_eligible,
+         social_security, insurance, loans, department_name, branch_name) = row
+
+        self.staff_id.append(staff_id)
+        self.name.append(f"{first_name} {last_name}")
+        self.branch_id.append(branch_id)
+        self.department_id.append(department_id)
+        self.role_id.append(role_id)
+        self.department_name.append(department_name)
+        self.branch_name.append(branch_name)
+        self.basic_salary.append(float(basic_salary or 0))
+        self.allowances.append(float(allowances or 0))
+        self.total_package.append(float(total_package or 0))
+        self.paye_eligible.append(bool(paye_eligible))
+        self.social_security_pct.append(_sum_field(_json_list(social_security), 'percentage'))
+        self.insurance.append(monthly_insurance(_json_list(insurance)))
+        self.loans.append(_sum_field(_json_list(loans), 'amount'))
+
+    def subset(self, indexes: List[int]) -> "StaffColumns":
+        """New StaffColumns holding only the employees at the given positions"""
+        subset = StaffColumns()
+        for name, values in vars(self).items():
+            setattr(subset, name, [values[i] for i in indexes])
+        return subset
+
+    def fingerprint(self, i: int, rules_version: str = "") -> str:
+        """Hash of every input that affects employee i's payroll, to detect changes between runs"""
+        inputs = (
+            self.basic_salary[i], self.allowances[i], self.total_package[i], self.paye_eligible[i],
+            self.social_security_pct[i], self.insurance[i], self.loans[i], rules_version,
+        )
+        return hashlib.sha1(repr(inputs).encode()).hexdigest()
+
+
+# Column projection used by load_staff_columns, in StaffColumns.append order
+STAFF_COLUMNS = (
+    Staff.id, Staff.first_name, Staff.last_name,
+    Staff.branch_id, Staff.department_id, Staff.role_id,
+    Staff.basic_salary, Staff.allowances, Staff.total_package, Staff.paye_eligible,
+    Staff.social_security, Staff.insurance, Staff.loans,
+    Department.name, Branch.name,
+)
+
+
+def active_staff_query(db: Session, branch_id: Optional[int] = None):
+    """Projection of the active staff eligible for payroll, with org names joined in"""
+    query = (
+        db.query(*STAFF_COLUMNS)
+        .outerjoin(Department, Department.id == Staff.department_id)
+        .outerjoin(Branch, Branch.id == Staff.branch_id)
+        .filter(Staff.is_active == True, Staff.employment_status == EmploymentStatus.ACTIVE)
+    )
+    if branch_id:
+        query = query.filter(Staff.branch_id == branch_id)
+    return query
+
+
+def load_staff_columns(db: Session, branch_id: Optional[int] = None, where=None) -> StaffColumns:
+    """Load the active staff for a payroll run into columns with a single query, optionally narrowed by `where`"""
+    query = active_staff_query(db, branch_id)
+    if where is not None:
+        query = query.filter(where)
+    columns = StaffColumns()
+    for row in query.order_by(Staff.id):
+        columns.append(row)
+    return columns
+
+
+class PayrollResult:
+    """Per-employee payroll columns for a batch plus their totals"""
+
+    def __init__(self, columns: StaffColumns, values: Dict[str, List[float]], rules: CompiledTaxRules = DEFAULT_TAX_RULES):
+        self.columns = columns
+        self.values = values
+        self.rules = rules
+        self._totals = None
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __getitem__(self, name: str) -> List[float]:
+        return self.values[name]
+
+    def fingerprint(self, i: int) -> str:
+        """Fingerprint of employee i's inputs under the tax rules of this run"""
+        return self.columns.fingerprint(i, self.rules.version)
+
+    @property
+    def totals(self) -> Dict[str, float]:
+        """Batch totals of every result column, summed on first access"""
+        if self._totals is None:
+            self._totals = {name: sum(self.values[name]) for name in RESULT_COLUMNS}
+        return self._totals
+
+
+def compute_payroll(columns: StaffColumns, rules: CompiledTaxRules = DEFAULT_TAX_RULES) -> PayrollResult:
+    """
+    Compute PAYE, social security, deductions, net pay and employer costs
+    for every employee in the batch in one pass over the columns, using the
+    brackets and levy rates of the given compiled tax rules.
+
+    Employee deductions are PAYE (on basic + allowances), the staff member's
+    social security percentages of basic salary, monthly insurance and loan
+    repayments. SDL, WCF and the NSSF employer portion are employer costs and
+    are not deducted from net pay.
+    """
+    basic = columns.basic_salary
+    allowances = columns.allowances
+    gross = columns.total_package  # Total Package IS the gross salary
+
+    taxable = [b + a for b, a in zip(basic, allowances)]
+    paye_tax = rules.paye
+    paye = [
+        paye_tax(t) if eligible and b else 0.0
+        for t, b, eligible in zip(taxable, basic, columns.paye_eligible)
+    ]
+    nssf = [b * pct / 100 for b, pct in zip(basic, columns.social_security_pct)]
+    other = [i + l for i, l in zip(columns.insurance, columns.loans)]
+    total_deductions = [p + n + o for p, n, o in zip(paye, nssf, other)]
+    net = [t - d for t, d in zip(taxable, total_deductions)]
+
+    sdl = [g * rules.sdl_rate for g in gross]
+    wcf = [g * rules.wcf_rate for g in gross]
+    nssf_employer = [b * rules.nssf_employer_rate for b in basic]
+    employer_costs = [s + w + n for s, w, n in zip(sdl, wcf, nssf_employer)]
+
+    return PayrollResult(columns, {
+        "gross_salary": list(gross),
+        "paye_tax": paye,
+        "nssf": nssf,
+        "nhif": [0.0] * len(columns),  # NHIF is Kenya's scheme - not applicable in Tanzania
+        "insurance": list(columns.insurance),
+        "loans": list(columns.loans),
+        "other_deductions": other,
+        "total_deductions": total_deductions,
+        "net_salary": net,
+        "sdl_tax": sdl,
+        "wcf": wcf,
+        "nssf_employer": nssf_employer,
+        "total_employer_costs": employer_costs,
+    }, rules)
@@ -0,0 +1,143 @@
+"""
+Payroll Export Service
+Streams detailed payroll records as CSV or XLSX in constant memory
+"""
+
+import csv
+import io
+import os
+import tempfile
+from typing import Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.payroll import Staff, Branch, Department, PayrollRecord
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # XLSX export is optional
+    Workbook = None
+
+XLSX_EXPORT_AVAILABLE = Workbook is not None
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+# Bytes per chunk when streaming a finished XLSX file
+FILE_CHUNK_SIZE = 64 * 1024
+
+# Export columns in order: (key, column expression)
+DETAILED_RECORD_COLUMNS = (
+    ("id", PayrollRecord.id),
+    ("staff_id", Staff.id),
+    ("first_name", Staff.first_name),
+    ("last_name", Staff.last_name),
+    ("email", Staff.email),
+    ("employee_id", Staff.employee_id),
+    ("department_name", Department.name),
+    ("branch_name", Branch.name),
+    ("bank_name", Staff.bank_name),
+    ("bank_account", Staff.bank_account),
+    ("payroll_period", PayrollRecord.payroll_period),
+    ("pay_date", PayrollRecord.pay_date),
+    ("basic_salary", PayrollRecord.basic_salary),
+    ("allowances", PayrollRecord.allowances),
+    ("overtime_pay", PayrollRecord.overtime_pay),
+    ("bonus", PayrollRecord.bonus),
+    ("gross_salary", PayrollRecord.gross_salary),
+    ("paye_tax", PayrollRecord.paye_tax),
+    ("sdl_tax", PayrollRecord.sdl_tax),
+    ("nssf", PayrollRecord.nssf),
+    ("nhif", PayrollRecord.nhif),
+    ("pension_contribution", PayrollRecord.pension_contribution),
+    ("other_deductions", PayrollRecord.other_deductions),
+    ("total_deductions", PayrollRecord.total_deductions),
+    ("net_salary", PayrollRecord.net_salary),
+    ("hours_worked", PayrollRecord.hours_worked),
+    ("days_worked", PayrollRecord.days_worked),
+    ("notes", PayrollRecord.notes),
+    ("status", PayrollRecord.status),
+    ("processed_at", PayrollRecord.processed_at),
+    ("paid_at", PayrollRecord.paid_at),
+    ("created_at", PayrollRecord.created_at),
+)
+EXPORT_HEADERS = [key for key, _ in DETAILED_RECORD_COLUMNS]
+
+
+def detailed_records_query(db: Session, payroll_period: Optional[str] = None, branch_id: Optional[int] = None):
+    """Payroll records projected with their staff, department and branch fields in one joined query"""
+    query = (
+        db.query(*[column.label(key) for key, column in DETAILED_RECORD_COLUMNS])
+        .join(Staff, PayrollRecord.staff_id == Staff.id)
+        .outerjoin(Department, Department.id == Staff.department_id)
+        .outerjoin(Branch, Branch.id == Staff.branch_id)
+    )
+    if payroll_period:
+        query = query.filter(PayrollRecord.payroll_period == payroll_period)
+    if branch_id:
+        query = query.filter(PayrollRecord.branch_id == branch_id)
+    return query.order_by(PayrollRecord.id)
+
+
+def _stream_rows(payroll_period: Optional[str], branch_id: Optional[int]) -> Iterator[tuple]:
+    """
+    Yield export rows from a server-side cursor. Uses its own session because
+    the generator outlives the request's session.
+    """
+    db = SessionLocal()
+    try:
+        query = detailed_records_query(db, payroll_period, branch_id).execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        )
+        for row in query:
+            yield tuple(row)
+    finally:
+        db.close()
+
+
+def stream_csv(payroll_period: Optional[str] = None, branch_id: Optional[int] = None) -> Iterator[bytes]:
+    """CSV export, flushed to the client every EXPORT_BATCH_SIZE rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+
+    pending = 0
+    for row in _stream_rows(payroll_period, branch_id):
+        writer.writerow(row)
+        pending += 1
+        if pending >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    yield buffer.getvalue().encode("utf-8")
+
+
+def stream_xlsx(payroll_period: Optional[str] = None, branch_id: Optional[int] = None) -> Iterator[bytes]:
+    """
+    XLSX export. A write-only workbook spools rows to a temporary file, which
+    is then streamed back and removed.
+    """
+    if Workbook is None:
+        raise RuntimeError("XLSX export requires openpyxl to be installed")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=payroll_period or "Payroll")
+    sheet.append(EXPORT_HEADERS)
+    for row in _stream_rows(payroll_period, branch_id):
+        sheet.append(row)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
@@ -0,0 +1,468 @@
+"""
+Payroll Jobs Service
+Runs payroll processing as background jobs with progress polling
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.payroll import Staff, PayrollRecord, EmploymentStatus
+from services.payroll_engine import load_staff_columns, compute_payroll
+from services.tax_rules import tax_rules
+from services.payroll_store import (
+    insert_payroll_run, create_calculation, scope_calculation, period_records_for_staff,
+    apply_payroll_changes, scope_records_query, paid_scope_totals, clear_scope,
+)
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept in memory for polling before the oldest are dropped
+MAX_RETAINED_JOBS = 50
+
+
+def run_payroll(
+    db: Session,
+    payroll_period: str,
+    branch_id: Optional[int] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> Dict:
+    """
+    Load, compute and persist one payroll run, then commit. The run replaces
+    the scope's earlier records and calculations; records already marked paid
+    are kept, their staff skipped and their totals carried into the new
+    calculation.
+
+    Returns:
+        Dict with the run totals and a detailed record per employee
+    """
+    carried = paid_scope_totals(db, payroll_period, branch_id)
+    paid_staff = select(PayrollRecord.staff_id).where(
+        PayrollRecord.payroll_period == payroll_period, PayrollRecord.status == "paid"
+    )
+    columns = load_staff_columns(db, branch_id=branch_id, where=Staff.id.notin_(paid_staff) if carried["employees"] else None)
+    clear_scope(db, payroll_period, branch_id)
+    if not len(columns) and not carried["employees"]:
+        db.commit()
+        return {
+            "mode": "full",
+            "payroll_period": payroll_period,
+            "branch_id": branch_id,
+            "calculation_id": None,
+            "total_employees": 0,
+            "total_gross_salary": 0,
+            "total_deductions": 0,
+            "total_net_salary": 0,
+            "total_sdl": 0,
+            "total_wcf": 0,
+            "total_employer_costs": 0,
+            "payroll_records": 0,
+            "detailed_records": [],
+        }
+
+    result = compute_payroll(columns, tax_rules.for_period(db, payroll_period))
+
+    # Write all records and the period summary with multi-row INSERTs
+    stored = insert_payroll_run(db, payroll_period, result, branch_id=branch_id, on_progress=on_progress, carried=carried)
+    db.commit()
+
+    totals = stored["totals"]
+
+    return {
+        "mode": "full",
+        "payroll_period": payroll_period,
+        "branch_id": branch_id,
+        "calculation_id": stored["calculation_id"],
+        "total_employees": len(columns),
+        "total_gross_salary": totals["gross_salary"],
+        "total_deductions": totals["total_deductions"],
+        "total_net_salary": totals["net_salary"],
+        "total_sdl": totals["sdl_tax"],
+        "total_wcf": result.totals["wcf"],
+        "total_employer_costs": result.totals["total_employer_costs"],
+        "payroll_records": stored["payroll_records"],
+        "detailed_records": detailed_records(result),
+    }
+
+
+def start_payroll_run(db: Session, payroll_period: str, branch_id: Optional[int] = None) -> int:
+    """
+    First step of a full run split into parts (see run_payroll_part): clear
+    the scope as run_payroll does and commit one PayrollCalculation for it,
+    holding only the totals carried from paid records.
+
+    Returns:
+        Id of the scope's new PayrollCalculation
+    """
+    carried = paid_scope_totals(db, payroll_period, branch_id)
+    clear_scope(db, payroll_period, branch_id)
+    calculation_id = create_calculation(db, payroll_period, branch_id, totals=carried)
+    db.commit()
+    return calculation_id
+
+
+def run_payroll_part(
+    db: Session,
+    payroll_period: str,
+    calculation_id: int,
+    staff_branch_id: Optional[int],
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> Dict:
+    """
+    Compute and insert the records of the unpaid staff of one branch, or of
+    staff without a branch when staff_branch_id is None, and add their totals
+    to the run's calculation, then commit.
+
+    Returns:
+        Dict with the part's totals and a detailed record per employee
+    """
+    paid_staff = select(PayrollRecord.staff_id).where(
+        PayrollRecord.payroll_period == payroll_period, PayrollRecord.status == "paid"
+    )
+    branch_filter = Staff.branch_id == staff_branch_id if staff_branch_id else Staff.branch_id.is_(None)
+    columns = load_staff_columns(db, where=and_(branch_filter, Staff.id.notin_(paid_staff)))
+    result = compute_payroll(columns, tax_rules.for_period(db, payroll_period))
+
+    stored = insert_payroll_run(db, payroll_period, result, on_progress=on_progress, calculation_id=calculation_id)
+    db.commit()
+
+    totals = stored["totals"]
+
+    return {
+        "mode": "full",
+        "payroll_period": payroll_period,
+        "branch_id": staff_branch_id,
+        "calculation_id": calculation_id,
+        "total_employees": len(columns),
+        "total_gross_salary": totals["gross_salary"],
+        "total_deductions": totals["total_deductions"],
+        "total_net_salary": totals["net_salary"],
+        "total_sdl": totals["sdl_tax"],
+        "total_wcf": result.totals["wcf"],
+        "total_employer_costs": result.totals["total_employer_costs"],
+        "payroll_records": stored["payroll_records"],
+        "detailed_records": detailed_records(result),
+    }
+
+
+def run_payroll_incremental(
+    db: Session,
+    payroll_period: str,
+    branch_id: Optional[int] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> Dict:
+    """
+    Reprocess a period, recomputing only employees whose staff row changed
+    since the period's last run (or who have no record yet), then commit.
+
+    Staff.updated_at against the scope's PayrollCalculation.calculated_at picks
+    the candidates; the per-record input fingerprint confirms which of them
+    actually changed. Falls back to a full run when the scope was never run.
+    """
+    calculation = scope_calculation(db, payroll_period, branch_id)
+    if calculation is None:
+        return run_payroll(db, payroll_period, branch_id=branch_id, on_progress=on_progress)
+
+    started_at = datetime.utcnow()
+    since = calculation.calculated_at
+    rules = tax_rules.for_period(db, payroll_period)
+    if since and rules.updated_at and rules.updated_at > since:
+        since = None  # Rules changed since the last run: every employee is a candidate
+    processed_staff = select(PayrollRecord.staff_id).where(PayrollRecord.payroll_period == payroll_period)
+    if branch_id:
+        processed_staff = processed_staff.where(PayrollRecord.branch_id == branch_id)
+
+    # Active staff that changed or are new to the period
+    candidates = Staff.id.notin_(processed_staff)
+    if since:
+        candidates = or_(Staff.updated_at > since, candidates)
+    else:
+        candidates = None
+    columns = load_staff_columns(db, branch_id=branch_id, where=candidates)
+
+    # Staff with a record in the period who are no longer eligible
+    removed = db.query(Staff.id).filter(
+        Staff.id.in_(processed_staff),
+        or_(Staff.is_active == False, Staff.employment_status != EmploymentStatus.ACTIVE)
+    )
+    if since:
+        removed = removed.filter(Staff.updated_at > since)
+    removed_ids = [staff_id for (staff_id,) in removed]
+
+    result = compute_payroll(columns, rules)
+    existing = period_records_for_staff(db, payroll_period, columns.staff_id + removed_ids)
+    changes = apply_payroll_changes(
+        db, payroll_period, result, existing, removed_ids, calculation.id,
+        now=started_at, on_progress=on_progress
+    )
+    written = changes.pop("written")
+    db.commit()
+    db.refresh(calculation)
+
+    # Employer costs aren't stored on the summary; derive them for the whole scope
+    basic_total = scope_records_query(db, payroll_period, branch_id).with_entities(
+        func.coalesce(func.sum(PayrollRecord.basic_salary), 0)
+    )
+    gross_total = calculation.total_gross_salary or 0
+    total_wcf = gross_total * rules.wcf_rate
+    total_employer_costs = gross_total * rules.sdl_rate + total_wcf + float(basic_total.scalar()) * rules.nssf_employer_rate
+
+    records = detailed_records(result)
+
+    return {
+        "mode": "incremental",
+        "payroll_period": payroll_period,
+        "branch_id": branch_id,
+        "calculation_id": calculation.id,
+        "total_employees": calculation.total_employees,
+        "total_gross_salary": gross_total,
+        "total_deductions": calculation.total_deductions,
+        "total_net_salary": calculation.total_net_salary,
+        "total_sdl": calculation.total_sdl_tax,
+        "total_wcf": total_wcf,
+        "total_employer_costs": total_employer_costs,
+        "payroll_records": changes["inserted"] + changes["updated"],
+        "changes": changes,
+        "detailed_records": [records[i] for i in written],  # Only the employees that changed
+    }
+
+
+def detailed_records(result) -> List[Dict]:
+    """Per-employee breakdown of a computed run for frontend display"""
+    columns = result.columns
+    return [
+        {
+            "id": columns.staff_id[i],
+            "name": columns.name[i],
+            "basic_salary": columns.basic_salary[i],
+            "allowances": columns.allowances[i],
+            "gross_salary": result["gross_salary"][i],
+            "paye_tax": result["paye_tax"][i],
+            "sdl_tax": result["sdl_tax"][i],
+            "nssf": result["nssf"][i],
+            "nhif": result["nhif"][i],
+            "loans": result["loans"][i],
+            "insurance": result["insurance"][i],
+            "deductions": result["total_deductions"][i],
+            "net_salary": result["net_salary"][i],
+            "department_name": columns.department_name[i],
+            "branch_name": columns.branch_name[i]
+        }
+        for i in range(len(columns))
+    ]
+
+
+def active_staff_counts(db: Session, branch_id: Optional[int] = None) -> Dict[Optional[int], int]:
+    """Number of payroll-eligible staff per branch; staff without a branch count under None"""
+    query = db.query(Staff.branch_id, func.count(Staff.id)).filter(
+        Staff.is_active == True,
+        Staff.employment_status == EmploymentStatus.ACTIVE
+    )
+    if branch_id:
+        query = query.filter(Staff.branch_id == branch_id)
+    return dict(query.group_by(Staff.branch_id).all())
+
+
+class LocalJobQueue:
+    """In-process stand-in for an external job queue, backed by a thread pool"""
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="payroll-job")
+
+    def submit(self, fn: Callable, *args) -> None:
+        self._executor.submit(fn, *args)
+
+
+class PayrollJob:
+    """
+    State of one background payroll run. A full run of every branch is split
+    into one task per branch (plus one for staff without a branch), all
+    adding to a single PayrollCalculation; other runs are a single task.
+    """
+
+    # Totals summed across the branch runs of a job
+    SUMMED_FIELDS = (
+        "total_employees", "total_gross_salary", "total_deductions", "total_net_salary",
+        "total_sdl", "total_wcf", "total_employer_costs", "payroll_records",
+    )
+
+    def __init__(self, payroll_period: str, branch_id: Optional[int], branch_counts: Dict[Optional[int], int], incremental: bool = False):
+        self.id = uuid.uuid4().hex
+        self.payroll_period = payroll_period
+        self.branch_id = branch_id
+        self.incremental = incremental
+        self.total_employees = sum(branch_counts.values())
+        self.processed_employees = 0
+        self.pending_branches = len(branch_counts)
+        self.status = "queued" if branch_counts else "completed"
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None if branch_counts else self.created_at
+        self.errors: List[Dict] = []
+        self.branch_results: Dict[Optional[int], Dict] = {}
+        self.calculation_id: Optional[int] = None  # Shared by the branch tasks of a split run
+        self._started_clock: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def mark_started(self) -> None:
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = datetime.utcnow()
+                self._started_clock = time.monotonic()
+                self.status = "running"
+
+    def advance(self, employees: int) -> None:
+        """Progress callback: record that more employees have been written"""
+        with self._lock:
+            self.processed_employees += employees
+
+    def branch_finished(self, branch_id: Optional[int], summary: Optional[Dict] = None, error: Optional[str] = None, tasks: int = 1) -> None:
+        """Record the outcome of a task; a failed start ends all tasks at once"""
+        with self._lock:
+            if error:
+                self.errors.append({"branch_id": branch_id, "error": error})
+            else:
+                self.branch_results[branch_id] = summary
+            self.pending_branches -= tasks
+            if self.pending_branches == 0:
+                self.finished_at = datetime.utcnow()
+                self.status = "failed" if self.errors else "completed"
+
+    def progress(self) -> Dict:
+        """Snapshot of the job's progress with an ETA based on the rate so far"""
+        with self._lock:
+            elapsed = time.monotonic() - self._started_clock if self._started_clock else 0
+            eta = None
+            if self.finished:
+                eta = 0
+            elif self.processed_employees and elapsed:
+                rate = self.processed_employees / elapsed
+                eta = round((self.total_employees - self.processed_employees) / rate, 1)
+
+            return {
+                "job_id": self.id,
+                "payroll_period": self.payroll_period,
+                "branch_id": self.branch_id,
+                "incremental": self.incremental,
+                "status": self.status,
+                "total_employees": self.total_employees,
+                "processed_employees": self.processed_employees,
+                "percent_complete": round(self.processed_employees / self.total_employees * 100, 1) if self.total_employees else 100.0,
+                "elapsed_seconds": round(elapsed, 1),
+                "eta_seconds": eta,
+                "errors": list(self.errors),
+                "created_at": self.created_at.isoformat(),
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None
+            }
+
+    def result(self) -> Dict:
+        """Combined totals and detailed records of all completed branch runs"""
+        with self._lock:
+            summaries = [self.branch_results[b] for b in sorted(self.branch_results, key=lambda b: b or 0)]
+            result = {field: sum(s[field] for s in summaries) for field in self.SUMMED_FIELDS}
+            result.update({
+                "job_id": self.id,
+                "payroll_period": self.payroll_period,
+                "branch_id": self.branch_id,
+                "status": self.status,
+                "calculation_ids": list(dict.fromkeys(s["calculation_id"] for s in summaries if s["calculation_id"])),
+                "detailed_records": [r for s in summaries for r in s["detailed_records"]],
+                "errors": list(self.errors)
+            })
+            return result
+
+
+class PayrollJobRunner:
+    """Queues payroll runs per branch and tracks their jobs for polling"""
+
+    def __init__(self, queue: LocalJobQueue):
+        self.queue = queue
+        self.jobs: "OrderedDict[str, PayrollJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, db: Session, payroll_period: str, branch_id: Optional[int] = None, incremental: bool = False) -> PayrollJob:
+        """
+        Create a job for a payroll period. A full run of every branch first
+        replaces the period's calculation with one all-branch calculation,
+        then queues one task per branch so branches are processed in
+        parallel, each adding to that calculation. A single-branch run, or an
+        incremental run updating the scope's calculation in place, is one task.
+        """
+        branch_counts = active_staff_counts(db, branch_id)
+        split = not branch_id and not incremental and branch_counts
+        if not split and branch_counts:
+            branch_counts = {branch_id: sum(branch_counts.values())}
+        job = PayrollJob(payroll_period, branch_id, branch_counts, incremental=incremental)
+
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+
+        if split:
+            self.queue.submit(self._start_split_run, job, list(branch_counts))
+        elif branch_counts:
+            self.queue.submit(self._run_branch, job, branch_id)
+
+        return job
+
+    def get(self, job_id: str) -> Optional[PayrollJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _prune(self) -> None:
+        """Drop the oldest finished jobs beyond MAX_RETAINED_JOBS"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_RETAINED_JOBS)]:
+            del self.jobs[job_id]
+
+    def _start_split_run(self, job: PayrollJob, branch_ids: List[Optional[int]]) -> None:
+        job.mark_started()
+        db = SessionLocal()
+        try:
+            job.calculation_id = start_payroll_run(db, job.payroll_period, job.branch_id)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error starting payroll job {job.id}: {str(e)}")
+            job.branch_finished(job.branch_id, error=str(e), tasks=len(branch_ids))
+            return
+        finally:
+            db.close()
+
+        for branch_id in branch_ids:
+            self.queue.submit(self._run_branch, job, branch_id)
+
+    def _run_branch(self, job: PayrollJob, branch_id: Optional[int]) -> None:
+        job.mark_started()
+        db = SessionLocal()
+        try:
+            if job.calculation_id:
+                summary = run_payroll_part(db, job.payroll_period, job.calculation_id, branch_id, on_progress=job.advance)
+            else:
+                run = run_payroll_incremental if job.incremental else run_payroll
+                summary = run(db, job.payroll_period, branch_id, on_progress=job.advance)
+            job.branch_finished(branch_id, summary)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error processing payroll job {job.id} for branch {branch_id}: {str(e)}")
+            job.branch_finished(branch_id, error=str(e))
+        finally:
+            db.close()
+
+
+# Create singleton instance
+payroll_jobs = PayrollJobRunner(LocalJobQueue(max_workers=int(os.getenv("PAYROLL_JOB_WORKERS", "4"))))
@@ -0,0 +1,117 @@
+"""
+Payroll Simulation Service
+Read-only what-if payroll runs over an in-memory snapshot of the workforce
+"""
+
+import copy
+import logging
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.payroll import Staff
+from services.payroll_engine import StaffColumns, load_staff_columns, compute_payroll
+from services.tax_rules import tax_rules
+
+logger = logging.getLogger(__name__)
+
+# Result totals reported for the baseline, the scenario and their difference
+SIMULATED_TOTALS = (
+    "gross_salary", "paye_tax", "nssf", "total_deductions", "net_salary",
+    "sdl_tax", "wcf", "nssf_employer", "total_employer_costs",
+)
+
+
+class StaffSnapshotCache:
+    """
+    Columns of all payroll-eligible staff, loaded once and reused until the
+    staff table's watermark (row count and latest updated_at) moves. Saves
+    re-reading and re-parsing the JSON details of every employee per request.
+    """
+
+    def __init__(self):
+        self._columns: Optional[StaffColumns] = None
+        self._watermark = None
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> StaffColumns:
+        watermark = tuple(db.query(func.count(Staff.id), func.max(Staff.updated_at)).one())
+        with self._lock:
+            if self._columns is not None and watermark == self._watermark:
+                return self._columns
+
+        columns = load_staff_columns(db)
+        with self._lock:
+            self._columns = columns
+            self._watermark = watermark
+        logger.info(f"Loaded payroll simulation snapshot of {len(columns)} staff")
+        return columns
+
+
+def _adjusted(columns: StaffColumns, salary_percent: float, salary_amount: float,
+              allowance_percent: float, allowance_amount: float) -> StaffColumns:
+    """Copy of columns with basic salary and allowances raised; total package moves by the same amount"""
+    scenario = copy.copy(columns)
+    scenario.basic_salary = [b * (1 + salary_percent / 100) + salary_amount for b in columns.basic_salary]
+    scenario.allowances = [a * (1 + allowance_percent / 100) + allowance_amount for a in columns.allowances]
+    scenario.total_package = [
+        p + (nb - b) + (na - a)
+        for p, b, nb, a, na in zip(
+            columns.total_package, columns.basic_salary, scenario.basic_salary,
+            columns.allowances, scenario.allowances
+        )
+    ]
+    return scenario
+
+
+def simulate_payroll(
+    db: Session,
+    payroll_period: Optional[str] = None,
+    branch_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    role_id: Optional[int] = None,
+    salary_increase_percent: float = 0,
+    salary_increase_amount: float = 0,
+    allowance_increase_percent: float = 0,
+    allowance_increase_amount: float = 0,
+) -> Dict:
+    """
+    Compute payroll for the matching staff before and after the adjustments
+    with the same engine and tax rules as a real run. Nothing is written.
+
+    Staff outside the filters are unaffected, so the deltas are also the
+    change to the whole payroll.
+
+    Returns:
+        Dict with the number of employees affected and baseline, scenario and
+        delta totals
+    """
+    snapshot = staff_snapshot.get(db)
+    indexes = [
+        i for i in range(len(snapshot))
+        if (not branch_id or snapshot.branch_id[i] == branch_id)
+        and (not department_id or snapshot.department_id[i] == department_id)
+        and (not role_id or snapshot.role_id[i] == role_id)
+    ]
+    columns = snapshot if len(indexes) == len(snapshot) else snapshot.subset(indexes)
+    rules = tax_rules.for_period(db, payroll_period)
+
+    baseline = compute_payroll(columns, rules).totals
+    scenario = compute_payroll(_adjusted(
+        columns, salary_increase_percent, salary_increase_amount,
+        allowance_increase_percent, allowance_increase_amount
+    ), rules).totals
+
+    return {
+        "employees": len(columns),
+        "tax_rules_version": rules.version,
+        "baseline": {field: baseline[field] for field in SIMULATED_TOTALS},
+        "scenario": {field: scenario[field] for field in SIMULATED_TOTALS},
+        "delta": {field: scenario[field] - baseline[field] for field in SIMULATED_TOTALS},
+    }
+
+
+# Create singleton instance
+staff_snapshot = StaffSnapshotCache()
@@ -0,0 +1,380 @@
+"""
+Payroll Store Service
+Bulk persistence for payroll runs
+"""
+
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, insert, update, delete
+from sqlalchemy.orm import Session
+
+from models.payroll import PayrollRecord, PayrollCalculation
+from services.payroll_engine import PayrollResult
+from services.payroll_bank_files import remove_payment_files
+
+# Rows per executemany round trip
+INSERT_BATCH_SIZE = 1000
+
+# PayrollRecord amount columns and the PayrollCalculation totals they roll up into
+CALCULATION_TOTALS = {
+    "gross_salary": "total_gross_salary",
+    "total_deductions": "total_deductions",
+    "net_salary": "total_net_salary",
+    "paye_tax": "total_paye_tax",
+    "sdl_tax": "total_sdl_tax",
+    "nssf": "total_nssf",
+    "nhif": "total_nhif",
+}
+TOTALLED_FIELDS = tuple(CALCULATION_TOTALS)
+
+
+def _record_row(result: PayrollResult, i: int, payroll_period: str, pay_date, status: str, now: datetime) -> Dict:
+    """Column values of the PayrollRecord for employee i of a computed run"""
+    columns = result.columns
+    row = {
+        "staff_id": columns.staff_id[i],
+        "branch_id": columns.branch_id[i],
+        "payroll_period": payroll_period,
+        "pay_date": pay_date,
+        "basic_salary": columns.basic_salary[i],
+        "allowances": columns.allowances[i],
+        "other_deductions": result["other_deductions"][i],  # Loans + insurance
+        "status": status,
+        "processed_at": now,
+        "input_fingerprint": result.fingerprint(i),
+        "updated_at": now,
+    }
+    for field in TOTALLED_FIELDS:
+        row[field] = result[field][i]
+    return row
+
+
+def _execute_batched(db: Session, statement, rows: List[Dict], on_progress: Optional[Callable[[int], None]] = None) -> None:
+    """Execute a statement as executemany over rows, INSERT_BATCH_SIZE at a time"""
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[start:start + INSERT_BATCH_SIZE]
+        db.execute(statement, batch)
+        if on_progress:
+            on_progress(len(batch))
+
+
+def insert_payroll_run(
+    db: Session,
+    payroll_period: str,
+    result: PayrollResult,
+    branch_id: Optional[int] = None,
+    status: str = "calculated",
+    on_progress: Optional[Callable[[int], None]] = None,
+    carried: Optional[Dict] = None,
+    calculation_id: Optional[int] = None,
+) -> Dict:
+    """
+    Insert every PayrollRecord of a computed run with multi-row INSERTs and
+    write its PayrollCalculation summary, totalling as the rows are built.
+    carried (see paid_scope_totals) adds records kept from an earlier run to
+    the summary. Given a calculation_id (see create_calculation), the run's
+    totals are added to that summary instead, so several partial runs can
+    build one calculation.
+
+    No ORM instances are created and nothing is committed; the caller owns
+    the transaction. on_progress, if given, is called with the number of rows
+    written after each batch.
+
+    Returns:
+        Dict with the calculation id, record count and totals
+    """
+    now = datetime.utcnow()
+    pay_date = datetime.now().date()
+    totals = dict.fromkeys(TOTALLED_FIELDS, 0.0)
+    inserted = 0
+
+    batch = []
+    for i in range(len(result)):
+        row = _record_row(result, i, payroll_period, pay_date, status, now)
+        row["created_at"] = now
+        for field in TOTALLED_FIELDS:
+            totals[field] += row[field]
+        batch.append(row)
+
+        if len(batch) >= INSERT_BATCH_SIZE:
+            _execute_batched(db, insert(PayrollRecord), batch, on_progress)
+            inserted += len(batch)
+            batch = []
+
+    if batch:
+        _execute_batched(db, insert(PayrollRecord), batch, on_progress)
+        inserted += len(batch)
+
+    if calculation_id is None:
+        carried = carried or {}
+        calculation_id = create_calculation(db, payroll_period, branch_id, status=status, now=now, totals={
+            "employees": inserted + carried.get("employees", 0),
+            **{field: totals[field] + carried.get(field, 0) for field in TOTALLED_FIELDS}
+        })
+    else:
+        add_to_calculation(db, calculation_id, inserted, totals, now)
+
+    return {
+        "calculation_id": calculation_id,
+        "payroll_records": inserted,
+        "totals": totals,
+    }
+
+
+def create_calculation(
+    db: Session,
+    payroll_period: str,
+    branch_id: Optional[int] = None,
+    status: str = "calculated",
+    totals: Optional[Dict] = None,
+    now: Optional[datetime] = None,
+) -> int:
+    """
+    Insert a PayrollCalculation with the given "employees" count and field
+    totals (zero when omitted) and return its id. Nothing is committed.
+    """
+    now = now or datetime.utcnow()
+    totals = totals or {}
+    return db.execute(
+        insert(PayrollCalculation).values(
+            payroll_period=payroll_period,
+            branch_id=branch_id,
+            total_employees=totals.get("employees", 0),
+            status=status,
+            calculated_at=now,
+            created_at=now,
+            updated_at=now,
+            **{CALCULATION_TOTALS[field]: totals.get(field, 0) for field in TOTALLED_FIELDS}
+        )
+    ).inserted_primary_key[0]
+
+
+def add_to_calculation(db: Session, calculation_id: int, employees: int, deltas: Dict, now: Optional[datetime] = None) -> None:
+    """
+    Adjust a PayrollCalculation's totals in place by the given differences.
+    The increment runs in the database, so concurrent writers don't lose
+    each other's updates. Nothing is committed.
+    """
+    now = now or datetime.utcnow()
+    values = {
+        CALCULATION_TOTALS[field]: getattr(PayrollCalculation, CALCULATION_TOTALS[field]) + deltas[field]
+        for field in TOTALLED_FIELDS
+    }
+    db.execute(
+        update(PayrollCalculation)
+        .where(PayrollCalculation.id == calculation_id)
+        .values(
+            total_employees=PayrollCalculation.total_employees + employees,
+            calculated_at=now,
+            updated_at=now,
+            **values
+        )
+    )
+
+
+def scope_records_query(db: Session, payroll_period: str, branch_id: Optional[int] = None):
+    """
+    PayrollRecords of a period, optionally limited to the branch they were
+    computed for, so staff who moved branch since stay with their run
+    """
+    query = db.query(PayrollRecord).filter(PayrollRecord.payroll_period == payroll_period)
+    if branch_id:
+        query = query.filter(PayrollRecord.branch_id == branch_id)
+    return query
+
+
+def scope_calculations_query(db: Session, payroll_period: str, branch_id: Optional[int] = None):
+    """PayrollCalculations of a period, optionally limited to one branch"""
+    query = db.query(PayrollCalculation).filter(PayrollCalculation.payroll_period == payroll_period)
+    if branch_id:
+        query = query.filter(PayrollCalculation.branch_id == branch_id)
+    return query
+
+
+def _records_totals(records) -> Dict:
+    """Employee count and totals of a PayrollRecord query, in one aggregate"""
+    row = records.with_entities(
+        func.count(PayrollRecord.id),
+        *[func.coalesce(func.sum(getattr(PayrollRecord, field)), 0) for field in TOTALLED_FIELDS]
+    ).one()
+    return {"employees": row[0], **{field: float(value) for field, value in zip(TOTALLED_FIELDS, row[1:])}}
+
+
+def paid_scope_totals(db: Session, payroll_period: str, branch_id: Optional[int] = None) -> Dict:
+    """Employee count and totals of a scope's records already marked paid"""
+    return _records_totals(scope_records_query(db, payroll_period, branch_id).filter(PayrollRecord.status == "paid"))
+
+
+def calculation_owners(db: Session, payroll_period: str) -> Dict[Optional[int], int]:
+    """
+    Latest PayrollCalculation id of a period per branch, None for the
+    all-branch calculation. A branch's records are counted by its own
+    calculation when it has one, otherwise by the all-branch calculation.
+    """
+    rows = db.query(PayrollCalculation.branch_id, func.max(PayrollCalculation.id)).filter(
+        PayrollCalculation.payroll_period == payroll_period
+    ).group_by(PayrollCalculation.branch_id)
+    return {branch_id: calculation_id for branch_id, calculation_id in rows}
+
+
+def owning_calculation(owners: Dict[Optional[int], int], branch_id: Optional[int], default: Optional[int] = None) -> Optional[int]:
+    """Id of the calculation that counts records of branch_id (see calculation_owners)"""
+    return owners.get(branch_id) or owners.get(None) or default
+
+
+def release_branch(db: Session, payroll_period: str, branch_id: int) -> None:
+    """
+    Before a branch's records or calculations are replaced or deleted, take
+    the branch's records out of the period's all-branch calculation if that
+    is the one counting them, so the branch is never counted twice.
+    Nothing is committed.
+    """
+    owners = calculation_owners(db, payroll_period)
+    if branch_id in owners or None not in owners:
+        return
+    totals = _records_totals(scope_records_query(db, payroll_period, branch_id))
+    if totals["employees"]:
+        add_to_calculation(db, owners[None], -totals["employees"], {field: -totals[field] for field in TOTALLED_FIELDS})
+
+
+def clear_scope(db: Session, payroll_period: str, branch_id: Optional[int] = None) -> int:
+    """
+    Delete a scope's unpaid records and its calculations before a full run
+    replaces them. Paid records stay; the run leaves their staff out and
+    carries their totals. A branch counted by the all-branch calculation is
+    taken out of it first (see release_branch). Nothing is committed.
+
+    Returns:
+        Number of records deleted
+    """
+    if branch_id:
+        release_branch(db, payroll_period, branch_id)
+    calculations = scope_calculations_query(db, payroll_period, branch_id)
+    remove_payment_files(db, [calculation_id for (calculation_id,) in calculations.with_entities(PayrollCalculation.id)])
+    deleted = scope_records_query(db, payroll_period, branch_id).filter(
+        func.coalesce(PayrollRecord.status, "") != "paid"
+    ).delete(synchronize_session=False)
+    calculations.delete(synchronize_session=False)
+    return deleted
+
+
+def scope_calculation(db: Session, payroll_period: str, branch_id: Optional[int] = None) -> Optional[PayrollCalculation]:
+    """Latest PayrollCalculation written for exactly this period and branch scope"""
+    branch_filter = PayrollCalculation.branch_id == branch_id if branch_id else PayrollCalculation.branch_id.is_(None)
+    return db.query(PayrollCalculation).filter(
+        PayrollCalculation.payroll_period == payroll_period,
+        branch_filter
+    ).order_by(PayrollCalculation.id.desc()).first()
+
+
+def period_records_for_staff(db: Session, payroll_period: str, staff_ids: Iterable[int]) -> Dict[int, Dict]:
+    """
+    Latest PayrollRecord of a period for each of the given staff, as plain
+    dicts with the id, branch, status, input fingerprint and totalled
+    amounts. Records of every branch are returned, since an employee has one
+    record per period wherever they moved; apply_payroll_changes moves it.
+    """
+    staff_ids = list(staff_ids)
+    fields = [PayrollRecord.id, PayrollRecord.staff_id, PayrollRecord.branch_id, PayrollRecord.status, PayrollRecord.input_fingerprint]
+    fields += [getattr(PayrollRecord, field) for field in TOTALLED_FIELDS]
+
+    records = {}
+    for start in range(0, len(staff_ids), INSERT_BATCH_SIZE):
+        rows = db.query(*fields).filter(
+            PayrollRecord.payroll_period == payroll_period,
+            PayrollRecord.staff_id.in_(staff_ids[start:start + INSERT_BATCH_SIZE])
+        ).order_by(PayrollRecord.id)
+        for row in rows:
+            records[row.staff_id] = dict(row._mapping)  # Later ids win
+    return records
+
+
+def apply_payroll_changes(
+    db: Session,
+    payroll_period: str,
+    result: PayrollResult,
+    existing: Dict[int, Dict],
+    removed_staff_ids: Iterable[int],
+    calculation_id: int,
+    status: str = "calculated",
+    now: Optional[datetime] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> Dict:
+    """
+    Upsert the records of recomputed employees and adjust the period's
+    PayrollCalculation totals by the difference.
+
+    Employees whose input fingerprint and branch match their existing record
+    are left untouched, as are records already marked paid. Records of
+    removed_staff_ids (staff no longer eligible) are deleted. Each change is
+    applied to the calculation counting the record's branch (see
+    calculation_owners), falling back to calculation_id; a record of an
+    employee who moved branch is moved with its totals. Nothing is committed.
+
+    Returns:
+        Dict with inserted, updated, deleted, unchanged and locked counts, and
+        the result indexes of the employees whose records were written
+    """
+    now = now or datetime.utcnow()
+    pay_date = datetime.now().date()
+    owners = calculation_owners(db, payroll_period)
+    # Calculation id -> [employee count delta, field deltas]
+    deltas = {calculation_id: [0, dict.fromkeys(TOTALLED_FIELDS, 0.0)]}
+    inserts, updates, deleted_ids, written = [], [], [], []
+    unchanged = locked = 0
+
+    def adjust(branch_id: Optional[int], values: Dict, sign: int) -> None:
+        target = owning_calculation(owners, branch_id, calculation_id)
+        entry = deltas.setdefault(target, [0, dict.fromkeys(TOTALLED_FIELDS, 0.0)])
+        entry[0] += sign
+        for field in TOTALLED_FIELDS:
+            entry[1][field] += sign * (values[field] or 0)
+
+    for i in range(len(result)):
+        old = existing.get(result.columns.staff_id[i])
+        if old and old["status"] == "paid":
+            locked += 1
+            continue
+        if old and old["input_fingerprint"] == result.fingerprint(i) and old["branch_id"] == result.columns.branch_id[i]:
+            unchanged += 1
+            continue
+
+        row = _record_row(result, i, payroll_period, pay_date, status, now)
+        written.append(i)
+        if old:
+            adjust(old["branch_id"], old, -1)
+            row["id"] = old["id"]
+            updates.append(row)
+        else:
+            row["created_at"] = now
+            inserts.append(row)
+        adjust(row["branch_id"], row, 1)
+
+    for staff_id in removed_staff_ids:
+        old = existing.get(staff_id)
+        if not old:
+            continue
+        if old["status"] == "paid":
+            locked += 1
+            continue
+        deleted_ids.append(old["id"])
+        adjust(old["branch_id"], old, -1)
+
+    _execute_batched(db, insert(PayrollRecord), inserts, on_progress)
+    _execute_batched(db, update(PayrollRecord), updates, on_progress)  # Bulk UPDATE by primary key
+    for start in range(0, len(deleted_ids), INSERT_BATCH_SIZE):
+        db.execute(delete(PayrollRecord).where(PayrollRecord.id.in_(deleted_ids[start:start + INSERT_BATCH_SIZE])))
+
+    # Adjust the summaries in place rather than re-totalling the period
+    for target, (employees, field_deltas) in deltas.items():
+        add_to_calculation(db, target, employees, field_deltas, now)
+
+    return {
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": len(deleted_ids),
+        "unchanged": unchanged,
+        "locked": locked,
+        "written": written,
+    }
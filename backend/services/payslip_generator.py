@@ -0,0 +1,218 @@
+"""
+Payslip Generator Service
+Renders payslip PDFs for a payroll period across a process pool into one ZIP
+"""
+
+import io
+import logging
+import os
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+from database import SessionLocal
+from services.payroll_export import detailed_records_query
+
+logger = logging.getLogger(__name__)
+
+# Payslips sent to a worker per task, to keep pickling overhead per PDF low
+PAYSLIP_CHUNK_SIZE = 50
+
+# Rows fetched per round trip from the server-side cursor
+PAYSLIP_FETCH_SIZE = 1000
+
+PAYSLIP_WORKERS = int(os.getenv("PAYSLIP_WORKERS", str(os.cpu_count() or 2)))
+
+
+def _money(value) -> str:
+    return f"TZS {value or 0:,.2f}"
+
+
+class PayslipRenderer:
+    """Builds the paragraph and table styles once and reuses them for every payslip"""
+
+    def __init__(self):
+        styles = getSampleStyleSheet()
+        self.title_style = ParagraphStyle(
+            'PayslipTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            fontName='Helvetica-Bold',
+            alignment=1,
+            spaceAfter=4,
+            leading=22
+        )
+        self.subtitle_style = ParagraphStyle(
+            'PayslipSubtitle',
+            parent=styles['Normal'],
+            fontSize=11,
+            fontName='Helvetica',
+            textColor=colors.HexColor('#374151'),
+            alignment=1,
+            spaceAfter=16
+        )
+        self.net_style = ParagraphStyle(
+            'PayslipNet',
+            parent=styles['Normal'],
+            fontSize=13,
+            fontName='Helvetica-Bold',
+            alignment=2,
+            spaceBefore=12
+        )
+        self.details_style = TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ])
+        self.amounts_style = TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e5e7eb')),
+            ('LINEABOVE', (0, -1), (-1, -1), 0.5, colors.HexColor('#6b7280')),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('ALIGN', (3, 0), (3, -1), 'RIGHT'),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+        ])
+        self.details_widths = [1.3 * inch, 2.2 * inch, 1.3 * inch, 2.2 * inch]
+        self.amounts_widths = [1.9 * inch, 1.6 * inch, 1.9 * inch, 1.6 * inch]
+
+    def render(self, payslip: Dict) -> bytes:
+        """Render one payslip (a detailed payroll record dict) to PDF bytes"""
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.6 * inch, bottomMargin=0.6 * inch)
+        name = f"{payslip['first_name']} {payslip['last_name']}"
+
+        details = Table([
+            ["Employee", name, "Employee ID", payslip['employee_id'] or payslip['staff_id']],
+            ["Department", payslip['department_name'] or "-", "Branch", payslip['branch_name'] or "-"],
+            ["Pay Date", str(payslip['pay_date'] or "-"), "Bank Account",
+             f"{payslip['bank_name'] or '-'} {payslip['bank_account'] or ''}".strip()],
+        ], colWidths=self.details_widths, style=self.details_style)
+
+        amounts = Table([
+            ["Earnings", "Amount", "Deductions", "Amount"],
+            ["Basic Salary", _money(payslip['basic_salary']), "PAYE", _money(payslip['paye_tax'])],
+            ["Allowances", _money(payslip['allowances']), "NSSF", _money(payslip['nssf'])],
+            ["Overtime", _money(payslip['overtime_pay']), "Loans & Insurance", _money(payslip['other_deductions'])],
+            ["Bonus", _money(payslip['bonus']), "", ""],
+            ["Gross Salary", _money(payslip['gross_salary']), "Total Deductions", _money(payslip['total_deductions'])],
+        ], colWidths=self.amounts_widths, style=self.amounts_style)
+
+        doc.build([
+            Paragraph("PAYSLIP", self.title_style),
+            Paragraph(f"Payroll Period: {payslip['payroll_period']}", self.subtitle_style),
+            details,
+            Spacer(1, 16),
+            amounts,
+            Paragraph(f"Net Pay: {_money(payslip['net_salary'])}", self.net_style),
+        ])
+        return buffer.getvalue()
+
+
+# One renderer per worker process, created by the pool initializer
+_renderer: Optional[PayslipRenderer] = None
+
+
+def _init_worker() -> None:
+    global _renderer
+    _renderer = PayslipRenderer()
+
+
+def _render_chunk(payslips: List[Dict]) -> List[Tuple[str, bytes]]:
+    """Worker task: render a chunk of payslips to (file name, PDF bytes)"""
+    renderer = _renderer or PayslipRenderer()
+    return [
+        (f"payslip_{p['payroll_period']}_{p['employee_id'] or p['staff_id']}_{p['id']}.pdf", renderer.render(p))
+        for p in payslips
+    ]
+
+
+class PayslipPool:
+    """Process pool for payslip rendering, started on first use"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+        return self._executor
+
+
+def _payslip_chunks(payroll_period: str, branch_id: Optional[int]):
+    """Detailed records of a period from a server-side cursor, in PAYSLIP_CHUNK_SIZE lists of dicts"""
+    db = SessionLocal()
+    try:
+        query = detailed_records_query(db, payroll_period, branch_id).execution_options(
+            stream_results=True, yield_per=PAYSLIP_FETCH_SIZE
+        )
+        chunk = []
+        for row in query:
+            chunk.append(dict(row._mapping))
+            if len(chunk) >= PAYSLIP_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        db.close()
+
+
+def write_payslips_zip(payroll_period: str, path: str, branch_id: Optional[int] = None) -> int:
+    """
+    Render a payslip per payroll record of the period into a ZIP at path.
+
+    Chunks are rendered across the process pool with at most two per worker in
+    flight, and written to the ZIP in record order as they complete, so memory
+    stays bounded however many payslips there are. The ZIP is written to a
+    temporary file and moved into place when complete.
+
+    Returns:
+        Number of payslips written
+    """
+    executor = payslip_pool.executor
+    max_in_flight = payslip_pool.max_workers * 2
+    count = 0
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, partial_path = tempfile.mkstemp(suffix=".zip.partial", dir=directory)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(partial_path, "w", compression=zipfile.ZIP_STORED) as archive:  # PDFs are already compressed
+            in_flight = deque()
+            for chunk in _payslip_chunks(payroll_period, branch_id):
+                in_flight.append(executor.submit(_render_chunk, chunk))
+                if len(in_flight) >= max_in_flight:
+                    for file_name, pdf in in_flight.popleft().result():
+                        archive.writestr(file_name, pdf)
+                        count += 1
+            while in_flight:
+                for file_name, pdf in in_flight.popleft().result():
+                    archive.writestr(file_name, pdf)
+                    count += 1
+        os.replace(partial_path, path)
+    except Exception:
+        os.remove(partial_path)
+        raise
+
+    logger.info(f"Generated {count} payslips for payroll period {payroll_period}")
+    return count
+
+
+# Create singleton instance
+payslip_pool = PayslipPool(max_workers=PAYSLIP_WORKERS)
@@ -0,0 +1,175 @@
+"""
+Period Close Service
+Month-end closes with closing-balance snapshots per statement bucket
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from models.transaction import Transaction, TransactionType, LedgerRollup, LedgerPeriodClose, LedgerSnapshot
+from services.category_classifier import category_classifier
+from services.ledger_rollup import period_of, shift_period
+
+logger = logging.getLogger(__name__)
+
+# (type, bucket) -> [amount, transaction count]
+BucketTotals = Dict[Tuple[TransactionType, str], List]
+
+
+class PeriodClosedError(ValueError):
+    """A write would change a transaction dated inside a closed period"""
+
+
+def locked_through(db: Session) -> Optional[str]:
+    """Latest closed period; every month up to and including it is locked"""
+    return db.query(func.max(LedgerPeriodClose.period)).scalar()
+
+
+def ensure_open(db: Session, *dates: datetime) -> None:
+    """Raise PeriodClosedError if any date falls in a closed period"""
+    lock = locked_through(db)
+    if lock is None:
+        return
+    for value in dates:
+        if value is not None and period_of(value) <= lock:
+            raise PeriodClosedError(
+                f"Period {period_of(value)} is closed (ledger locked through {lock}); reopen it to make changes"
+            )
+
+
+def _add(totals: BucketTotals, rows) -> BucketTotals:
+    for transaction_type, bucket, amount, count in rows:
+        entry = totals.setdefault((transaction_type, bucket), [0, 0])
+        entry[0] += amount or 0
+        entry[1] += count or 0
+    return totals
+
+
+def _rollup_totals(db: Session, after: Optional[str], through: str) -> List[tuple]:
+    """Rollup sums per (type, bucket) for periods in (after, through]"""
+    query = db.query(
+        LedgerRollup.type, LedgerRollup.bucket, func.sum(LedgerRollup.amount), func.sum(LedgerRollup.transaction_count)
+    ).filter(LedgerRollup.period <= through)
+    if after:
+        query = query.filter(LedgerRollup.period > after)
+    return query.group_by(LedgerRollup.type, LedgerRollup.bucket).all()
+
+
+def _latest_snapshot(db: Session, through: str) -> Tuple[Optional[str], List[tuple]]:
+    period = db.query(func.max(LedgerSnapshot.period)).filter(LedgerSnapshot.period <= through).scalar()
+    if period is None:
+        return None, []
+    rows = db.query(
+        LedgerSnapshot.type, LedgerSnapshot.bucket, LedgerSnapshot.balance, LedgerSnapshot.transaction_count
+    ).filter(LedgerSnapshot.period == period).all()
+    return period, rows
+
+
+def balance_totals(db: Session, period: str) -> BucketTotals:
+    """Cumulative totals at the end of period: the latest snapshot at or before it plus later rollup months"""
+    snapshot_period, snapshot_rows = _latest_snapshot(db, period)
+    totals = _add({}, snapshot_rows)
+    if snapshot_period != period:
+        _add(totals, _rollup_totals(db, snapshot_period, period))
+    return totals
+
+
+def balance_totals_as_of(db: Session, as_of: datetime) -> BucketTotals:
+    """Cumulative totals at a moment: balances at the end of the previous month plus that month's transactions so far"""
+    month_start = as_of.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    totals = balance_totals(db, shift_period(period_of(as_of), -1))
+    partial = db.query(
+        Transaction.type, Transaction.category, func.sum(Transaction.amount), func.count(Transaction.id)
+    ).filter(
+        Transaction.transaction_date >= month_start,
+        Transaction.transaction_date <= as_of,
+    ).group_by(Transaction.type, Transaction.category)
+    return _add(totals, [
+        (transaction_type, category_classifier.classify(transaction_type, category).statement_bucket, amount, count)
+        for transaction_type, category, amount, count in partial
+    ])
+
+
+def _write_snapshot(db: Session, period: str) -> int:
+    # Built from the previous snapshot, so closing a month reads only the months since
+    db.query(LedgerSnapshot).filter(LedgerSnapshot.period == period).delete(synchronize_session=False)
+    rows = [
+        {"period": period, "type": transaction_type, "bucket": bucket, "balance": amount, "transaction_count": count}
+        for (transaction_type, bucket), (amount, count) in balance_totals(db, period).items()
+    ]
+    if rows:
+        db.execute(insert(LedgerSnapshot), rows)
+    return len(rows)
+
+
+def close_period(db: Session, period: str, closed_by: Optional[str] = None) -> LedgerPeriodClose:
+    """
+    Close every month up to period and snapshot its closing balances.
+    Only finished months after the current lock can be closed.
+    """
+    if period >= period_of(datetime.now()):
+        raise ValueError(f"Period {period} has not ended yet")
+    lock = locked_through(db)
+    if lock is not None and period <= lock:
+        raise PeriodClosedError(f"Ledger is already closed through {lock}")
+
+    try:
+        close = LedgerPeriodClose(period=period, closed_by=closed_by)
+        db.add(close)
+        db.flush()
+        buckets = _write_snapshot(db, period)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    db.refresh(close)
+    logger.info(f"Closed ledger period {period}: {buckets} bucket balances")
+    return close
+
+
+def reopen_period(db: Session, period: str) -> int:
+    """
+    Reopen period and every later closed period, dropping their snapshots.
+
+    Returns:
+        Number of periods reopened
+    """
+    try:
+        reopened = db.query(LedgerPeriodClose).filter(LedgerPeriodClose.period >= period).delete(synchronize_session=False)
+        db.query(LedgerSnapshot).filter(LedgerSnapshot.period >= period).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logger.info(f"Reopened {reopened} ledger periods from {period}")
+    return reopened
+
+
+def rebuild_snapshots(db: Session) -> int:
+    """
+    Recompute the snapshot of every closed period from the rollup, oldest
+    first. Run after rebuilding the rollup or correcting data inside closed
+    periods directly in the database.
+
+    Returns:
+        Number of snapshots rebuilt
+    """
+    periods = [period for (period,) in db.query(LedgerPeriodClose.period).order_by(LedgerPeriodClose.period)]
+    try:
+        db.query(LedgerSnapshot).filter(LedgerSnapshot.period.notin_(periods)).delete(synchronize_session=False)
+        for period in periods:
+            _write_snapshot(db, period)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logger.info(f"Rebuilt {len(periods)} ledger snapshots")
+    return len(periods)
+
+
+def closed_periods(db: Session) -> List[LedgerPeriodClose]:
+    return db.query(LedgerPeriodClose).order_by(LedgerPeriodClose.period).all()
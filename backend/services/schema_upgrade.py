@@ -0,0 +1,111 @@
+"""
+Schema Upgrade Service
+Idempotent startup step that brings an existing database up to date with the models
+"""
+
+import logging
+from typing import Callable, Dict, List
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+
+from database import Base
+from models.escrow import Base as EscrowBase
+from models.transaction import Base as TransactionBase
+from models.supplier import Base as SupplierBase
+from services.category_classifier import category_classifier
+from services import ledger_rollup, search_index
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade_schema(engine: Engine, metadata: MetaData) -> Dict[str, List[str]]:
+    """
+    Add the columns and indexes that tables created by an older version lack,
+    then create missing tables. Only additions are made, so it is safe to run
+    on every start. Added columns must be nullable or have a server default.
+
+    Returns:
+        Names of the tables, "table.column" columns and indexes created
+    """
+    created = {"tables": [], "columns": [], "indexes": []}
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+
+    with engine.begin() as connection:
+        for table in metadata.tables.values():
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    logger.warning(f"Cannot add NOT NULL column {table.name}.{column.name} without a server default")
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}")
+                created["columns"].append(f"{table.name}.{column.name}")
+
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=connection)
+                    created["indexes"].append(index.name)
+
+    missing = [table for table in metadata.tables.values() if table.name not in existing_tables]
+    if missing:
+        metadata.create_all(bind=engine, tables=missing)
+        created["tables"] = [table.name for table in missing]
+
+    for kind, names in created.items():
+        if names:
+            logger.info(f"Schema upgrade created {kind}: {', '.join(names)}")
+    return created
+
+
+def _backfill_payroll_record_branches(db: Session) -> None:
+    # Records written before runs stored their branch get the staff's current one
+    db.execute(text(
+        "UPDATE payroll_records SET branch_id = "
+        "(SELECT staff.branch_id FROM staff WHERE staff.id = payroll_records.staff_id) "
+        "WHERE branch_id IS NULL"
+    ))
+    db.commit()
+
+
+def _backfill_transaction_classification(db: Session) -> None:
+    # statement_bucket, cash_flow_line and cash_flow_activity are added together
+    category_classifier.reclassify_transactions(db)
+
+
+# Data fills run once, in this order, right after the table or "table.column" they depend on is created
+BACKFILLS: Dict[str, Callable[[Session], None]] = {
+    "payroll_records.branch_id": _backfill_payroll_record_branches,
+    "transactions.statement_bucket": _backfill_transaction_classification,
+    "ledger_rollups": ledger_rollup.rebuild,  # Statements read the rollup, so it starts from the existing ledger
+    "ledger_rollups.cash_flow_line": ledger_rollup.rebuild,  # Rollups created before the cash flow columns
+    "search_tokens": search_index.rebuild,  # Searches read only the index, so it starts from the existing rows
+}
+
+
+def upgrade_database(engine: Engine) -> Dict[str, List[str]]:
+    """Upgrade every model metadata, then run the backfills of whatever was just created"""
+    created = {"tables": [], "columns": [], "indexes": []}
+    for metadata in (Base.metadata, EscrowBase.metadata, TransactionBase.metadata, SupplierBase.metadata):
+        for kind, names in upgrade_schema(engine, metadata).items():
+            created[kind] += names
+
+    pending = [name for name in BACKFILLS if name in created["tables"] or name in created["columns"]]
+    if pending:
+        db = Session(bind=engine)
+        try:
+            for name in pending:
+                BACKFILLS[name](db)
+                logger.info(f"Backfilled {name}")
+        finally:
+            db.close()
+    return created
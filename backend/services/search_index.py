@@ -0,0 +1,172 @@
+"""
+Search Index Service
+Inverted token index over the searchable text of transactions, escrows and suppliers
+"""
+
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from models.search_index import SearchToken
+from models.transaction import Transaction
+from models.escrow import Escrow
+from models.supplier import Supplier
+
+logger = logging.getLogger(__name__)
+
+# Index rows written per INSERT round trip during a rebuild
+REBUILD_BATCH_SIZE = 5000
+
+# Entities read per round trip during a rebuild
+REBUILD_FETCH_SIZE = 1000
+
+# Longer words are indexed and searched by their first MAX_TOKEN_LENGTH characters
+MAX_TOKEN_LENGTH = 64
+
+# Search terms used from one query; the rest are ignored
+MAX_QUERY_TERMS = 8
+
+# Per entity type: the model and the columns whose words are indexed
+SEARCH_FIELDS = {
+    "transaction": (Transaction, ("description", "reference", "category")),
+    "escrow": (Escrow, ("title", "payer_name", "payee_name", "escrow_id")),
+    "supplier": (Supplier, ("name", "city", "region", "specialties")),
+}
+
+_WORD = re.compile(r"\w+")
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(*values) -> Set[str]:
+    """Distinct lowercased words of the values; lists (JSON columns) contribute each item"""
+    tokens = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            tokens.update(tokenize(*value))
+            continue
+        tokens.update(word[:MAX_TOKEN_LENGTH] for word in _WORD.findall(str(value).lower()))
+    return tokens
+
+
+def parse_query(text: str) -> List[Tuple[str, bool]]:
+    """
+    Search text to (token, exact) terms. Bare words match any indexed word
+    they start, so "acc" finds "accounts"; a word in double quotes only
+    matches that whole word.
+    """
+    terms = []
+    for quoted, bare in _TERM.findall(text or ""):
+        exact = bool(quoted)
+        for word in _WORD.findall((quoted or bare).lower()):
+            term = (word[:MAX_TOKEN_LENGTH], exact and len(word) <= MAX_TOKEN_LENGTH)
+            if term not in terms:
+                terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def apply_search(query, entity_type: str, id_column, text: Optional[str]):
+    """
+    Restrict query to entities matching every term of text. Each term is an
+    index range scan on (entity_type, token) returning entity ids, so the
+    cost follows the number of matching words, not the size of the table.
+    Text without any word leaves the query unfiltered.
+    """
+    for token, exact in parse_query(text):
+        match = SearchToken.token == token if exact else SearchToken.token.startswith(token, autoescape=True)
+        query = query.filter(id_column.in_(
+            select(SearchToken.entity_id).where(SearchToken.entity_type == entity_type, match)
+        ))
+    return query
+
+
+def entity_tokens(entity_type: str, entity) -> Set[str]:
+    _, fields = SEARCH_FIELDS[entity_type]
+    return tokenize(*(getattr(entity, field) for field in fields))
+
+
+def _token_rows(entity_type: str, entity_id: int, tokens: Iterable[str]) -> List[Dict]:
+    return [{"entity_type": entity_type, "entity_id": entity_id, "token": token} for token in tokens]
+
+
+def remove_entity(db: Session, entity_type: str, entity_id: int) -> None:
+    """Drop an entity's tokens in the caller's transaction"""
+    db.query(SearchToken).filter(
+        SearchToken.entity_type == entity_type,
+        SearchToken.entity_id == entity_id,
+    ).delete(synchronize_session=False)
+
+
+def index_entity(db: Session, entity_type: str, entity) -> None:
+    """
+    Replace an entity's tokens with those of its current text, in the
+    caller's transaction so the index commits or rolls back with the write.
+    New entities are flushed first to get their id.
+    """
+    if entity.id is None:
+        db.flush()
+    remove_entity(db, entity_type, entity.id)
+    rows = _token_rows(entity_type, entity.id, entity_tokens(entity_type, entity))
+    if rows:
+        db.execute(insert(SearchToken), rows)
+
+
+def index_rows(db: Session, entity_type: str, rows: Iterable[Tuple[int, Dict]]) -> None:
+    """Add the tokens of newly inserted entities given as (id, column values), e.g. after a bulk insert"""
+    _, fields = SEARCH_FIELDS[entity_type]
+    token_rows = []
+    for entity_id, values in rows:
+        token_rows.extend(_token_rows(entity_type, entity_id, tokenize(*(values.get(field) for field in fields))))
+    if token_rows:
+        db.execute(insert(SearchToken), token_rows)
+
+
+def rebuild(db: Session, entity_type: Optional[str] = None) -> Dict[str, int]:
+    """
+    Re-index every entity of one type, or of all types, from their tables.
+    Entities are read in chunks keyset-paginated by id and tokens written in
+    batches; each type is replaced in a single transaction. Chunks are fully
+    fetched before any INSERT, since a streamed (unbuffered) MySQL result
+    would be discarded by the next statement on the same connection.
+
+    Returns:
+        Number of index rows written per entity type
+    """
+    written = {}
+    for name in [entity_type] if entity_type else list(SEARCH_FIELDS):
+        model, fields = SEARCH_FIELDS[name]
+        columns = [getattr(model, field) for field in fields]
+        query = db.query(model.id, *columns)
+        if name == "supplier":
+            query = query.filter(Supplier.is_active == True)
+        count = 0
+        try:
+            db.query(SearchToken).filter(SearchToken.entity_type == name).delete(synchronize_session=False)
+            batch = []
+            last_id = None
+            while True:
+                chunk = query.filter(model.id > last_id) if last_id is not None else query
+                rows = chunk.order_by(model.id).limit(REBUILD_FETCH_SIZE).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                for entity_id, *values in rows:
+                    batch.extend(_token_rows(name, entity_id, tokenize(*values)))
+                    if len(batch) >= REBUILD_BATCH_SIZE:
+                        db.execute(insert(SearchToken), batch)
+                        count += len(batch)
+                        batch = []
+            if batch:
+                db.execute(insert(SearchToken), batch)
+                count += len(batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        written[name] = count
+        logger.info(f"Rebuilt {name} search index: {count} tokens")
+    return written
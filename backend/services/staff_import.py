@@ -0,0 +1,376 @@
+"""
+Staff Import Service
+Field mapping for staff payloads and bulk import with set-based validation
+"""
+
+import csv
+import io
+import json
+import logging
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models.payroll import Staff, Branch, Department, Role, EmploymentType, EmploymentStatus, Gender, MaritalStatus
+from services.id_allocator import id_allocator
+
+logger = logging.getLogger(__name__)
+
+# Rows per executemany round trip, and values per IN (...) uniqueness check
+IMPORT_BATCH_SIZE = 500
+
+# Frontend field names and the Staff columns they map to
+STAFF_FIELD_MAPPING = {
+    'firstName': 'first_name',
+    'lastName': 'last_name',
+    'middleName': 'middle_name',
+    'dateOfBirth': 'date_of_birth',
+    'phone': 'phone',
+    'alternativePhone': 'alternative_phone',
+    'emergencyContactName1': 'emergency_contact_name',
+    'emergencyContactRelationship1': 'emergency_contact_relationship',
+    'emergencyContactPhone1': 'emergency_contact_phone',
+    'emergencyContactName2': 'emergency_contact2_name',
+    'emergencyContactRelationship2': 'emergency_contact2_relationship',
+    'emergencyContactPhone2': 'emergency_contact2_phone',
+    'linkedin': 'linkedin_url',
+    'twitter': 'twitter_url',
+    'instagram': 'instagram_url',
+    'addressCity': 'address_city',
+    'addressState': 'address_state',
+    'addressCountry': 'address_country',
+    'addressPostalCode': 'address_postal_code',
+    'hireDate': 'hire_date',
+    'probationEndDate': 'probation_end_date',
+    'contractEndDate': 'contract_end_date',
+    'basicSalary': 'basic_salary',
+    'allowances': 'allowances',
+    'employmentType': 'employment_type',
+    'maritalStatus': 'marital_status',
+    'reportingManager': 'reporting_manager_id',
+    'department': 'department_id',  # Form sends department as ID
+    'branch': 'branch_id',         # Form sends branch as ID
+    'position': 'role_id',         # Form sends position as role ID
+    'bankName': 'bank_name',
+    'bankAccount': 'bank_account',
+    'taxId': 'tax_id',
+    'workSchedule': 'work_schedule',
+    'holidayEntitlement': 'holiday_entitlement',
+    'leaveStatus': 'leave_status',
+    'leaveEndDate': 'leave_end_date',
+    'documents': 'documents'
+}
+
+# Numeric keys coerced to float inside each staff JSON column
+STAFF_JSON_NUMERIC_KEYS = {
+    'allowances_detail': ('amount',),
+    'social_security': ('percentage',),
+    'insurance': ('annualAmount',),
+    'loans': ('amount', 'monthlyDeduction'),
+    'documents': (),
+}
+
+# Frontend employment type labels
+EMPLOYMENT_TYPE_MAPPING = {
+    'full-time': 'full_time',
+    'part-time': 'part_time',
+    'contract': 'contract',
+    'intern': 'intern'
+}
+
+STAFF_DATE_FIELDS = (
+    'date_of_birth', 'hire_date', 'probation_end_date', 'contract_end_date',
+    'leave_end_date', 'last_review_date', 'next_review_date',
+)
+STAFF_ENUM_FIELDS = {
+    'employment_type': EmploymentType,
+    'employment_status': EmploymentStatus,
+    'gender': Gender,
+    'marital_status': MaritalStatus,
+}
+REQUIRED_STAFF_FIELDS = ('first_name', 'last_name', 'email', 'phone', 'basic_salary')
+
+# Columns that must be unique across staff, checked in bulk before inserting
+UNIQUE_STAFF_FIELDS = ('email', 'national_id', 'employee_id', 'employee_number')
+
+
+def normalize_staff_json(field: str, value) -> str:
+    """Coerce the amounts in a staff JSON column to floats (in place) and serialize it for storage"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return value  # Keep original value if parsing fails
+    if isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict):
+                for key in STAFF_JSON_NUMERIC_KEYS.get(field, ()):
+                    if key in item:
+                        try:
+                            item[key] = float(item[key])
+                        except (ValueError, TypeError):
+                            pass
+    return json.dumps(value)
+
+
+def map_staff_fields(staff_data: Dict) -> Dict:
+    """Rename frontend fields to Staff columns, keeping any unmapped fields as they are"""
+    mapped_data = {}
+    for frontend_field, backend_field in STAFF_FIELD_MAPPING.items():
+        if frontend_field in staff_data:
+            mapped_data[backend_field] = staff_data[frontend_field]
+    for field, value in staff_data.items():
+        if field not in STAFF_FIELD_MAPPING:
+            mapped_data[field] = value
+    return mapped_data
+
+
+def parse_staff_csv(content: bytes) -> List[Dict]:
+    """Rows of a staff CSV upload as dicts keyed by the header, blank cells dropped"""
+    text = content.decode("utf-8-sig")
+    return [
+        {key.strip(): value.strip() for key, value in row.items() if key and value is not None and value.strip() != ""}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+
+
+def _org_lookup(db: Session, model) -> Dict:
+    """Org units keyed by id (int and text) and by lower-cased name, in one query"""
+    lookup = {}
+    for unit_id, name in db.query(model.id, model.name):
+        lookup[unit_id] = unit_id
+        lookup[str(unit_id)] = unit_id
+        if name:
+            lookup.setdefault(name.strip().lower(), unit_id)
+    return lookup
+
+
+def _resolve_org(value, lookup: Dict) -> Optional[int]:
+    if isinstance(value, str):
+        return lookup.get(value.strip()) or lookup.get(value.strip().lower())
+    return lookup.get(value)
+
+
+def _parse_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def _parse_enum(enum_type, value):
+    if isinstance(value, enum_type):
+        return value
+    text = str(value).strip().lower()
+    text = EMPLOYMENT_TYPE_MAPPING.get(text, text).replace("-", "_")
+    return enum_type(text)
+
+
+def _json_total(value, key: str) -> float:
+    """Sum of a numeric key across a JSON list given as text or a list"""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return sum(float(item.get(key) or 0) for item in value if isinstance(item, dict)) if isinstance(value, list) else 0.0
+
+
+def _prepare_row(raw: Dict, branches: Dict, departments: Dict, roles: Dict) -> Tuple[Dict, List[str]]:
+    """Map and validate one import row; returns the Staff values and the row's errors"""
+    data = map_staff_fields(raw)
+    errors = []
+
+    for field in REQUIRED_STAFF_FIELDS:
+        if data.get(field) in (None, ""):
+            errors.append(f"{field} is required")
+
+    for field, lookup, label in (("branch_id", branches, "branch"), ("department_id", departments, "department"), ("role_id", roles, "role")):
+        value = data.get(field)
+        if value in (None, ""):
+            errors.append(f"{label} is required")
+            continue
+        resolved = _resolve_org(value, lookup)
+        if resolved is None:
+            errors.append(f"Unknown {label}: {value}")
+        data[field] = resolved
+
+    try:
+        basic_salary = float(data.get("basic_salary") or 0)
+    except (ValueError, TypeError):
+        errors.append(f"Invalid basic_salary: {data.get('basic_salary')}")
+        basic_salary = 0.0
+    data["basic_salary"] = basic_salary
+
+    # Allowances may be a total or a list of allowance objects, as in create_staff
+    allowances = data.get("allowances")
+    try:
+        if isinstance(allowances, list) or (isinstance(allowances, str) and allowances.lstrip().startswith("[")):
+            data["allowances_detail"] = allowances
+            data["allowances"] = _json_total(allowances, "amount")
+        else:
+            data["allowances"] = float(allowances or 0)
+    except (ValueError, TypeError, json.JSONDecodeError):
+        errors.append(f"Invalid allowances: {allowances}")
+        data["allowances"] = 0.0
+
+    try:
+        data["total_package"] = float(data.get("total_package") or 0) or basic_salary + data["allowances"]
+    except (ValueError, TypeError):
+        errors.append(f"Invalid total_package: {data.get('total_package')}")
+
+    data.setdefault("employment_type", "full_time")
+    data.setdefault("employment_status", "active")
+    for field, enum_type in STAFF_ENUM_FIELDS.items():
+        if data.get(field) not in (None, ""):
+            try:
+                data[field] = _parse_enum(enum_type, data[field])
+            except ValueError:
+                errors.append(f"Invalid {field}: {data[field]}")
+
+    data["hire_date"] = data.get("hire_date") or date.today()
+    for field in STAFF_DATE_FIELDS:
+        if data.get(field) not in (None, ""):
+            try:
+                data[field] = _parse_date(data[field])
+            except ValueError:
+                errors.append(f"Invalid {field}: {data[field]} (expected YYYY-MM-DD)")
+
+    if data.get("reporting_manager_id") not in (None, ""):
+        try:
+            data["reporting_manager_id"] = int(data["reporting_manager_id"])
+        except (ValueError, TypeError):
+            data["reporting_manager_id"] = None  # A manager name can't be resolved to an id
+
+    for field in STAFF_JSON_NUMERIC_KEYS:
+        if data.get(field):
+            data[field] = normalize_staff_json(field, data[field])
+
+    if data.get("email"):
+        data["email"] = str(data["email"]).strip().lower()
+
+    values = {
+        field: value for field, value in data.items()
+        if hasattr(Staff, field) and field not in ("id", "created_at", "updated_at") and value is not None and value != ''
+    }
+    return values, errors
+
+
+def _column_default(column: str):
+    """Scalar default of a Staff column, or None"""
+    default = Staff.__table__.c[column].default
+    return default.arg if default is not None and default.is_scalar else None
+
+
+def _existing_values(db: Session, column, values: Iterable) -> set:
+    """Which of the values already exist in a Staff column, checked in IN (...) chunks"""
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), IMPORT_BATCH_SIZE):
+        chunk = values[start:start + IMPORT_BATCH_SIZE]
+        found.update(v for (v,) in db.query(column).filter(column.in_(chunk)))
+    return found
+
+
+def _check_unique(db: Session, prepared: List[Tuple[int, Dict]], fields: Iterable[str], errors: Dict[int, List[str]]) -> None:
+    """
+    Record an error on every row whose value of a unique field repeats an
+    earlier row's or already exists, one IN query per column chunk. Of two
+    clashing rows the later one in prepared gets the error.
+    """
+    for field in fields:
+        seen = {}
+        for row_number, values in prepared:
+            value = values.get(field)
+            if value is None:
+                continue
+            if value in seen:
+                errors.setdefault(row_number, []).append(f"Duplicate {field} {value} (also in row {seen[value]})")
+            else:
+                seen[value] = row_number
+        taken = _existing_values(db, getattr(Staff, field), seen)
+        for value in taken:
+            errors.setdefault(seen[value], []).append(f"{field} {value} already exists")
+
+
+def import_staff(db: Session, rows: List[Dict], dry_run: bool = False) -> Dict:
+    """
+    Validate and insert a batch of staff rows (frontend or column field names).
+
+    Every row is validated before anything is written: required fields, org
+    units by id or name, enums, dates, and uniqueness of email, national_id,
+    employee_id and employee_number within the batch and against existing
+    staff with one IN query per column chunk. Valid rows without an employee
+    number get one from a contiguous reserved block, and employee_id defaults
+    to the employee number; generated values are checked the same way, so a
+    clash rejects the row instead of failing the insert. Valid rows are
+    inserted in chunks in a single transaction; invalid rows are reported with
+    their errors and skipped. With dry_run nothing is written.
+
+    Returns:
+        Dict with row counts, the employee numbers assigned and per-row errors
+    """
+    branches = _org_lookup(db, Branch)
+    departments = _org_lookup(db, Department)
+    roles = _org_lookup(db, Role)
+
+    prepared = []
+    errors: Dict[int, List[str]] = {}
+    for row_number, raw in enumerate(rows, start=1):
+        if not isinstance(raw, dict):
+            errors[row_number] = ["Row must be an object"]
+            continue
+        values, row_errors = _prepare_row(raw, branches, departments, roles)
+        if row_errors:
+            errors[row_number] = row_errors
+        if values.get("employee_number"):
+            values.setdefault("employee_id", values["employee_number"])
+        prepared.append((row_number, values))
+
+    _check_unique(db, prepared, UNIQUE_STAFF_FIELDS, errors)
+
+    assigned = []
+    if not dry_run:
+        # One contiguous block of employee numbers for the valid rows that need one
+        numbered = [(row_number, values) for row_number, values in prepared if row_number not in errors and not values.get("employee_number")]
+        numbers = id_allocator.reserve_block("staff", len(numbered))
+        for number, (row_number, values) in zip(numbers, numbered):
+            values["employee_number"] = id_allocator.format("staff", number)
+            values.setdefault("employee_id", values["employee_number"])
+
+        # Generated numbers may still clash with supplied or older identifiers
+        if numbered:
+            numbered_rows = {row_number for row_number, _ in numbered}
+            supplied = [(row_number, values) for row_number, values in prepared if row_number not in errors and row_number not in numbered_rows]
+            _check_unique(db, supplied + numbered, ("employee_id", "employee_number"), errors)
+        assigned = [values["employee_number"] for row_number, values in numbered if row_number not in errors]
+
+    valid = [values for row_number, values in prepared if row_number not in errors]
+    result = {
+        "total_rows": len(rows),
+        "valid_rows": len(valid),
+        "failed_rows": len(errors),
+        "imported": 0,
+        "employee_numbers": None,
+        "errors": [{"row": row_number, "errors": errors[row_number]} for row_number in sorted(errors)],
+        "dry_run": dry_run,
+    }
+    if dry_run or not valid:
+        return result
+
+    now = datetime.utcnow()
+    for values in valid:
+        values["created_at"] = now
+        values["updated_at"] = now
+
+    # executemany needs every row to have the same keys; fill gaps with the column defaults
+    columns = set().union(*valid)
+    fill = {column: _column_default(column) for column in columns}
+    for start in range(0, len(valid), IMPORT_BATCH_SIZE):
+        chunk = [{**fill, **values} for values in valid[start:start + IMPORT_BATCH_SIZE]]
+        db.execute(insert(Staff), chunk)
+    db.commit()
+
+    logger.info(f"Imported {len(valid)} staff, {len(errors)} rows rejected")
+    result["imported"] = len(valid)
+    if assigned:
+        result["employee_numbers"] = {"first": assigned[0], "last": assigned[-1], "count": len(assigned)}
+    return result
@@ -0,0 +1,190 @@
+"""
+Tax Rules Service
+Versioned PAYE brackets and employer levy rates, compiled for bisect lookup
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import List, Optional, Sequence
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
+
+from models.payroll import TaxRuleSet
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the tax_rule_sets watermark for changes made by other processes
+RELOAD_CHECK_SECONDS = 30
+
+# Tanzania monthly PAYE and employer levies, used until a rule set is stored
+DEFAULT_PAYE_LOWER_BOUNDS = [0, 270000, 520000, 760000, 1000000]
+DEFAULT_PAYE_RATES = [0, 0.08, 0.20, 0.25, 0.30]
+DEFAULT_SDL_RATE = 0.035  # Skills Development Levy - 3.5% of gross salary
+DEFAULT_WCF_RATE = 0.005  # Workers Compensation Fund - 0.5% of gross salary
+DEFAULT_NSSF_EMPLOYER_RATE = 0.10  # NSSF employer portion - 10% of basic salary only
+
+
+class CompiledTaxRules:
+    """
+    One rule set compiled into parallel arrays. Income up to and including an
+    upper bound falls in that bracket; tax = base + (income - lower) * rate,
+    where base is the cumulative tax of all brackets below.
+    """
+
+    __slots__ = (
+        "rule_set_id", "name", "effective_from", "updated_at", "version",
+        "lower_bounds", "upper_bounds", "base_tax", "rates",
+        "sdl_rate", "wcf_rate", "nssf_employer_rate",
+    )
+
+    def __init__(
+        self,
+        lower_bounds: Sequence[float],
+        rates: Sequence[float],
+        sdl_rate: float,
+        wcf_rate: float,
+        nssf_employer_rate: float,
+        effective_from: date = date.min,
+        rule_set_id: Optional[int] = None,
+        name: str = "Tanzania PAYE (built-in)",
+        updated_at: Optional[datetime] = None,
+    ):
+        brackets = sorted(zip(lower_bounds, rates))
+        if not brackets or brackets[0][0] > 0:
+            brackets.insert(0, (0.0, 0.0))  # Income below the first bracket is untaxed
+
+        self.lower_bounds = [float(lower) for lower, _ in brackets]
+        self.rates = [float(rate) for _, rate in brackets]
+        self.upper_bounds = self.lower_bounds[1:]
+        self.base_tax = [0.0]
+        for i, upper in enumerate(self.upper_bounds):
+            self.base_tax.append(self.base_tax[i] + (upper - self.lower_bounds[i]) * self.rates[i])
+
+        self.sdl_rate = float(sdl_rate)
+        self.wcf_rate = float(wcf_rate)
+        self.nssf_employer_rate = float(nssf_employer_rate)
+        self.effective_from = effective_from
+        self.rule_set_id = rule_set_id
+        self.name = name
+        self.updated_at = updated_at
+
+        # Content hash, so payroll fingerprints change only when the rules do
+        content = (self.lower_bounds, self.rates, self.sdl_rate, self.wcf_rate, self.nssf_employer_rate)
+        self.version = hashlib.sha1(repr(content).encode()).hexdigest()[:12]
+
+    def paye(self, taxable_income: float) -> float:
+        """PAYE due on a month's gross taxable income"""
+        bracket = bisect_left(self.upper_bounds, taxable_income)
+        return self.base_tax[bracket] + (taxable_income - self.lower_bounds[bracket]) * self.rates[bracket]
+
+    def to_dict(self) -> dict:
+        return {
+            "rule_set_id": self.rule_set_id,
+            "name": self.name,
+            "effective_from": self.effective_from.isoformat() if self.effective_from != date.min else None,
+            "version": self.version,
+            "brackets": [
+                {
+                    "lower_bound": self.lower_bounds[i],
+                    "upper_bound": self.upper_bounds[i] if i < len(self.upper_bounds) else None,
+                    "base_tax": self.base_tax[i],
+                    "rate": self.rates[i],
+                }
+                for i in range(len(self.rates))
+            ],
+            "sdl_rate": self.sdl_rate,
+            "wcf_rate": self.wcf_rate,
+            "nssf_employer_rate": self.nssf_employer_rate,
+        }
+
+    @classmethod
+    def from_rule_set(cls, rule_set: TaxRuleSet) -> "CompiledTaxRules":
+        return cls(
+            [bracket.lower_bound for bracket in rule_set.brackets],
+            [bracket.rate for bracket in rule_set.brackets],
+            rule_set.sdl_rate or 0,
+            rule_set.wcf_rate or 0,
+            rule_set.nssf_employer_rate or 0,
+            effective_from=rule_set.effective_from,
+            rule_set_id=rule_set.id,
+            name=rule_set.name,
+            updated_at=rule_set.updated_at,
+        )
+
+
+DEFAULT_TAX_RULES = CompiledTaxRules(
+    DEFAULT_PAYE_LOWER_BOUNDS, DEFAULT_PAYE_RATES,
+    DEFAULT_SDL_RATE, DEFAULT_WCF_RATE, DEFAULT_NSSF_EMPLOYER_RATE,
+)
+
+
+def period_start(payroll_period: Optional[str]) -> date:
+    """First day of a YYYY-MM payroll period, or today if it can't be parsed"""
+    try:
+        return datetime.strptime(payroll_period, "%Y-%m").date()
+    except (TypeError, ValueError):
+        return date.today()
+
+
+class TaxRuleCache:
+    """
+    Compiled rule sets held in memory, ordered by effective date. Reloaded when
+    invalidated after a write, or when the table's watermark (row count and
+    latest updated_at) moves, checked at most every RELOAD_CHECK_SECONDS.
+    """
+
+    def __init__(self, check_interval: float = RELOAD_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._effective_dates: List[date] = []
+        self._compiled: List[CompiledTaxRules] = []
+        self._watermark = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._checked_at = None
+            self._watermark = None
+
+    def for_date(self, db: Session, on_date: date) -> CompiledTaxRules:
+        """Rule set in force on a date, falling back to the built-in rules"""
+        self._refresh(db)
+        with self._lock:
+            i = bisect_right(self._effective_dates, on_date) - 1
+            return self._compiled[i] if i >= 0 else DEFAULT_TAX_RULES
+
+    def for_period(self, db: Session, payroll_period: Optional[str]) -> CompiledTaxRules:
+        return self.for_date(db, period_start(payroll_period))
+
+    def _refresh(self, db: Session) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+
+        watermark = tuple(db.query(func.count(TaxRuleSet.id), func.max(TaxRuleSet.updated_at)).one())
+        with self._lock:
+            if watermark == self._watermark:
+                self._checked_at = now
+                return
+
+        rule_sets = db.query(TaxRuleSet).options(selectinload(TaxRuleSet.brackets)).order_by(
+            TaxRuleSet.effective_from, TaxRuleSet.id
+        ).all()
+        compiled = [CompiledTaxRules.from_rule_set(rule_set) for rule_set in rule_sets]
+
+        with self._lock:
+            self._effective_dates = [rules.effective_from for rules in compiled]
+            self._compiled = compiled
+            self._watermark = watermark
+            self._checked_at = now
+        logger.info(f"Loaded {len(compiled)} tax rule sets")
+
+
+# Create singleton instance
+tax_rules = TaxRuleCache()
@@ -0,0 +1,254 @@
+"""
+Transaction Import Service
+Streaming bulk ingestion of ledger transactions from JSON lines or CSV feeds
+"""
+
+import csv
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models.transaction import Transaction, TransactionType, PaymentMethod
+from services.id_allocator import id_allocator
+from services.category_classifier import category_classifier
+from services import ledger_rollup
+from services.transaction_stats import transaction_stats
+from services.period_close import locked_through
+from services import search_index
+
+logger = logging.getLogger(__name__)
+
+# Valid lines inserted per database transaction
+INGEST_CHUNK_SIZE = 2000
+
+# Values per IN (...) lookup of existing references
+REFERENCE_LOOKUP_BATCH_SIZE = 500
+
+# Feed column names accepted in place of the API's field names
+TRANSACTION_FIELD_ALIASES = {
+    'payment_method': 'paymentMethod',
+    'transaction_date': 'transactionDate',
+    'created_by': 'createdBy',
+}
+
+REQUIRED_FIELDS = ("description", "type", "amount", "paymentMethod")
+
+# A parsed feed line: (line number, fields) or (line number, parse error)
+FeedLine = Tuple[int, Union[Dict, str]]
+
+
+def iter_json_lines(lines: Iterable[str]) -> Iterator[FeedLine]:
+    """One transaction object per non-blank line"""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, f"Invalid JSON: {e.msg}"
+            continue
+        yield line_number, value if isinstance(value, dict) else "Each line must be a JSON object"
+
+
+def iter_csv_rows(lines: Iterable[str]) -> Iterator[FeedLine]:
+    """CSV with a header row; line numbers are those of the file"""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        if not any((value or '').strip() for value in row.values() if isinstance(value, str)):
+            continue
+        yield reader.line_num, {key.strip(): value for key, value in row.items() if key}
+
+
+def validate_transaction(raw: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """Feed fields to Transaction column values, with the same rules as create_transaction"""
+    data = {TRANSACTION_FIELD_ALIASES.get(key, key): value for key, value in raw.items()}
+    for field in REQUIRED_FIELDS:
+        if not data.get(field):
+            return None, f"Missing required field: {field}"
+    try:
+        amount = float(data["amount"])
+    except (ValueError, TypeError):
+        return None, "Invalid amount format"
+    try:
+        transaction_type = TransactionType(str(data["type"]).strip().upper())
+    except ValueError:
+        return None, f"Invalid type: {data['type']}"
+    try:
+        payment_method = PaymentMethod(str(data["paymentMethod"]).strip().upper())
+    except ValueError:
+        return None, f"Invalid paymentMethod: {data['paymentMethod']}"
+    transaction_date = None
+    if data.get("transactionDate"):
+        try:
+            transaction_date = datetime.fromisoformat(str(data["transactionDate"]).strip())
+        except ValueError:
+            return None, "Invalid transaction date format"
+
+    return {
+        "description": str(data["description"]).strip(),
+        "type": transaction_type,
+        "category": data.get("category") or None,
+        "amount": amount,
+        "payment_method": payment_method,
+        "reference": str(data["reference"]).strip() if data.get("reference") else None,
+        "account": str(data["account"]).strip() if data.get("account") else None,
+        "notes": data.get("notes") or None,
+        "created_by": data.get("createdBy") or "bulk-import",
+        "transaction_date": transaction_date or datetime.now(),
+    }, None
+
+
+def _dedupe_key(values: Dict) -> Optional[tuple]:
+    if not values["reference"]:
+        return None  # Lines without a reference can't be recognised as repeats
+    return values["reference"], values["account"] or ""
+
+
+def _existing_keys(db: Session, keys: List[tuple]) -> set:
+    references = sorted({reference for reference, _ in keys})
+    existing = set()
+    for start in range(0, len(references), REFERENCE_LOOKUP_BATCH_SIZE):
+        batch = references[start:start + REFERENCE_LOOKUP_BATCH_SIZE]
+        for reference, account in db.query(Transaction.reference, Transaction.account).filter(
+            Transaction.reference.in_(batch)
+        ):
+            existing.add((reference, account or ""))
+    return existing
+
+
+class TransactionIngestor:
+    """
+    Consumes parsed feed lines one at a time, holding at most one chunk of
+    valid lines in memory. Each full chunk is checked against existing
+    (reference, account) pairs with batched IN lookups, then inserted with one
+    executemany together with its search tokens and ledger rollup deltas, and
+    committed on its own: a failing chunk rolls back alone and its lines are reported as failed.
+    """
+
+    def __init__(self, db: Session, dry_run: bool = False, chunk_size: int = INGEST_CHUNK_SIZE):
+        self.db = db
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size
+        self.results: List[Dict] = []
+        self.counts = {"created": 0, "duplicate": 0, "invalid": 0, "failed": 0, "valid": 0}
+        self._seen: Dict[tuple, int] = {}  # Dedupe key -> first line carrying it
+        self._pending: List[Tuple[int, Dict]] = []
+        self._locked_through = locked_through(db)  # Lines dated in closed periods are rejected
+
+    def _result(self, line_number: int, status: str, **details) -> None:
+        self.counts[status] += 1
+        self.results.append({"line": line_number, "status": status, **details})
+
+    def feed(self, line_number: int, raw: Union[Dict, str]) -> None:
+        if isinstance(raw, str):
+            self._result(line_number, "invalid", error=raw)
+            return
+        values, error = validate_transaction(raw)
+        if error:
+            self._result(line_number, "invalid", error=error)
+            return
+        period = ledger_rollup.period_of(values["transaction_date"])
+        if self._locked_through and period <= self._locked_through:
+            self._result(line_number, "invalid", error=f"Period {period} is closed")
+            return
+        key = _dedupe_key(values)
+        if key is not None:
+            if key in self._seen:
+                self._result(line_number, "duplicate", error=f"Same reference and account as line {self._seen[key]}")
+                return
+            self._seen[key] = line_number
+        self._pending.append((line_number, values))
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        keys = [key for key in (_dedupe_key(values) for _, values in pending) if key is not None]
+        existing = _existing_keys(self.db, keys) if keys else set()
+        chunk = []
+        for line_number, values in pending:
+            if _dedupe_key(values) in existing:
+                self._result(line_number, "duplicate", error="Transaction with this reference and account already exists")
+            else:
+                chunk.append((line_number, values))
+        if not chunk:
+            return
+        if self.dry_run:
+            for line_number, _ in chunk:
+                self._result(line_number, "valid")
+            return
+
+        try:
+            self._insert(chunk)
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Transaction import chunk failed: {str(e)}")
+            for line_number, _ in chunk:
+                self._result(line_number, "failed", error=str(e))
+            return
+        for line_number, values in chunk:
+            self._result(line_number, "created", transaction_id=values["transaction_id"])
+
+    def _insert(self, chunk: List[Tuple[int, Dict]]) -> None:
+        numbers = id_allocator.reserve_block("transaction", len(chunk))
+        now = datetime.now()
+        rows = []
+        deltas: Dict[tuple, List] = {}
+        for number, (_, values) in zip(numbers, chunk):
+            classification = category_classifier.classify(values["type"], values["category"])
+            values["transaction_id"] = id_allocator.format("transaction", number)
+            rows.append({
+                **values,
+                **classification._asdict(),
+                "is_reconciled": False,
+                "created_at": now,
+                "updated_at": now,
+            })
+            rollup_key = (
+                ledger_rollup.period_of(values["transaction_date"]),
+                values["type"],
+                classification.statement_bucket,
+                values["category"] or "",
+            )
+            delta = deltas.setdefault(rollup_key, [0, 0])
+            delta[0] += values["amount"]
+            delta[1] += 1
+
+        self.db.execute(insert(Transaction), rows)
+        # Ids of the new rows for the search index; MySQL has no INSERT ... RETURNING
+        ids = dict(self.db.query(Transaction.transaction_id, Transaction.id).filter(
+            Transaction.transaction_id.in_([row["transaction_id"] for row in rows])
+        ))
+        search_index.index_rows(self.db, "transaction", ((ids[row["transaction_id"]], row) for row in rows))
+        for rollup_key, (amount, count) in deltas.items():
+            ledger_rollup.apply_delta(self.db, rollup_key, amount, count)
+        self.db.commit()
+
+    def finish(self) -> Dict:
+        self.flush()
+        if self.counts["created"]:
+            transaction_stats.invalidate()
+        self.results.sort(key=lambda result: result["line"])
+        logger.info(f"Transaction import: {self.counts}")
+        return {
+            "total_lines": len(self.results),
+            **self.counts,
+            "dry_run": self.dry_run,
+            "results": self.results,
+        }
+
+
+def ingest_transactions(db: Session, lines: Iterable[FeedLine], dry_run: bool = False,
+                        chunk_size: int = INGEST_CHUNK_SIZE) -> Dict:
+    """Validate, dedupe and insert parsed feed lines; returns counts and a result per line"""
+    ingestor = TransactionIngestor(db, dry_run=dry_run, chunk_size=chunk_size)
+    for line_number, raw in lines:
+        ingestor.feed(line_number, raw)
+    return ingestor.finish()
@@ -0,0 +1,121 @@
+"""
+Transaction Stats Service
+Ledger summary totals from one grouped query, cached per filter until the ledger changes
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models.transaction import Transaction, TransactionType
+
+logger = logging.getLogger(__name__)
+
+# Distinct date filters kept in the cache, least recently used dropped first
+STATS_CACHE_SIZE = 64
+
+# Seconds between checks of the data version for writes made by other processes
+VERSION_CHECK_SECONDS = 30
+
+
+class TransactionStatsCache:
+    """
+    Per-type counts and sums for /transactions/stats/summary.
+
+    Totals come from a single GROUP BY type aggregate, so no transaction rows
+    are loaded. Results are cached per (start, end) filter. Every write path
+    calls invalidate(), which drops them. Writes made by other processes are
+    caught by the data version (the row count, highest id and latest
+    updated_at, read in one statement), checked at most every
+    VERSION_CHECK_SECONDS rather than on each request.
+    """
+
+    def __init__(self, max_entries: int = STATS_CACHE_SIZE, check_interval: float = VERSION_CHECK_SECONDS):
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._entries: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._generation = 0  # Bumped whenever the entries are dropped
+        self._version = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    @staticmethod
+    def data_version(db: Session) -> tuple:
+        return tuple(db.execute(
+            select(func.count(Transaction.id), func.max(Transaction.id), func.max(Transaction.updated_at))
+        ).one())
+
+    def _check_version(self, db: Session) -> None:
+        """Drop the cache if another process changed the ledger since the last check"""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+
+        version = self.data_version(db)
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._generation += 1
+                self._version = version
+            self._checked_at = now
+
+    @staticmethod
+    def _totals_by_type(db: Session, start: Optional[datetime], end: Optional[datetime]) -> Dict[TransactionType, Dict]:
+        query = db.query(Transaction.type, func.count(Transaction.id), func.coalesce(func.sum(Transaction.amount), 0))
+        if start:
+            query = query.filter(Transaction.transaction_date >= start)
+        if end:
+            query = query.filter(Transaction.transaction_date <= end)
+        return {
+            transaction_type: {"count": count, "total": total}
+            for transaction_type, count, total in query.group_by(Transaction.type)
+        }
+
+    def summary(self, db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict:
+        self._check_version(db)
+        key = (start, end)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            generation = self._generation
+
+        by_type = self._totals_by_type(db, start, end)
+
+        def total(transaction_type: TransactionType):
+            return by_type.get(transaction_type, {}).get("total", 0)
+
+        result = {
+            "total_transactions": sum(entry["count"] for entry in by_type.values()),
+            "total_revenue": total(TransactionType.REVENUE),
+            "total_expenses": total(TransactionType.EXPENSE),
+            "total_assets": total(TransactionType.ASSET),
+            "total_liabilities": total(TransactionType.LIABILITY),
+            "net_income": total(TransactionType.REVENUE) - total(TransactionType.EXPENSE),
+            "by_type": {transaction_type.value: entry for transaction_type, entry in by_type.items()},
+        }
+
+        with self._lock:
+            if generation != self._generation:
+                return result  # Invalidated while computing; don't cache totals that may predate the write
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+
+# Create singleton instance
+transaction_stats = TransactionStatsCache()
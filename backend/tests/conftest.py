@@ -0,0 +1,31 @@
+"""
+Shared fixtures: an in-memory SQLite database with every model table
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models.payroll  # noqa: F401 - registers the payroll tables on database.Base
+import models.search_index  # noqa: F401
+from database import Base
+from models.escrow import Base as EscrowBase
+from models.supplier import Base as SupplierBase
+from models.transaction import Base as TransactionBase
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for metadata in (Base.metadata, EscrowBase.metadata, SupplierBase.metadata, TransactionBase.metadata):
+        metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
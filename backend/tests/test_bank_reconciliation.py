@@ -0,0 +1,101 @@
+"""
+Statement line parsing and candidate matching, without a database
+"""
+
+from datetime import datetime, timedelta
+
+from services.bank_reconciliation import _Candidates, parse_statement_line
+
+WINDOW = timedelta(days=3)
+DAY = datetime(2025, 5, 10, 12, 0)
+
+
+def line(amount, reference="", date=DAY):
+    parsed, error = parse_statement_line({"amount": amount, "reference": reference, "date": date.isoformat()})
+    assert error is None
+    return parsed
+
+
+def candidates(*rows):
+    """_Candidates from (pk, amount, reference, date) tuples; transaction ids are TXN-<pk>"""
+    return _Candidates([(pk, f"TXN-{pk}", amount, reference, date) for pk, amount, reference, date in rows])
+
+
+def test_statement_lines_are_normalised():
+    parsed, error = parse_statement_line({"amount": "-1250.50", "reference": " ref-9 ", "valueDate": "2025-05-10"})
+
+    assert error is None
+    assert parsed == {"amount": 125050, "reference": "REF-9", "date": datetime(2025, 5, 10), "description": ""}
+
+
+def test_invalid_statement_lines_report_why():
+    assert parse_statement_line({"amount": "x", "date": "2025-05-10"}) == (None, "Invalid amount format")
+    assert parse_statement_line({"amount": 1}) == (None, "Missing date")
+    assert parse_statement_line({"amount": 1, "date": "10/05/2025"}) == (None, "Invalid date format")
+
+
+def test_reference_match_needs_the_same_amount_and_ignores_case():
+    pool = candidates((1, 100.0, "inv-1", DAY), (2, 250.0, "INV-2", DAY - timedelta(days=30)))
+
+    assert pool.match_reference(line(-100, "INV-1")) == 1
+    assert pool.match_reference(line(250, " inv-2 ")) == 2
+    assert pool.match_reference(line(99.99, "INV-1")) is None
+    assert pool.match_reference(line(100, "")) is None
+
+
+def test_reference_match_skips_used_transactions():
+    pool = candidates((1, 100.0, "INV-1", DAY), (2, 100.0, "INV-1", DAY))
+    pool.used.add(1)
+
+    assert pool.match_reference(line(100, "INV-1")) == 2
+    pool.used.add(2)
+    assert pool.match_reference(line(100, "INV-1")) is None
+
+
+def test_date_match_takes_the_nearest_date_inside_the_window():
+    pool = candidates(
+        (1, 100.0, None, DAY - timedelta(days=2)),
+        (2, 100.0, None, DAY + timedelta(days=1)),
+        (3, 100.0, None, DAY + timedelta(days=3, seconds=1)),
+        (4, 200.0, None, DAY),
+    )
+
+    assert pool.match_date(line(100), WINDOW) == 2
+    pool.used.add(2)
+    assert pool.match_date(line(100), WINDOW) == 1
+    pool.used.add(1)
+    assert pool.match_date(line(100), WINDOW) is None  # Just outside the window
+
+
+def test_window_bounds_are_inclusive():
+    pool = candidates((1, 100.0, None, DAY - WINDOW), (2, 100.0, None, DAY + WINDOW + timedelta(days=1)))
+
+    assert pool.match_date(line(100), WINDOW) == 1
+
+
+def test_equally_near_dates_are_left_unmatched_and_suggested():
+    pool = candidates((1, 100.0, None, DAY - timedelta(days=1)), (2, 100.0, None, DAY + timedelta(days=1)))
+
+    assert pool.match_date(line(100), WINDOW) is None
+    assert [s["transaction_id"] for s in pool.suggestions(line(100), WINDOW)] == ["TXN-1", "TXN-2"]
+
+
+def test_tie_with_a_used_transaction_is_not_a_tie():
+    pool = candidates((1, 100.0, None, DAY - timedelta(days=1)), (2, 100.0, None, DAY + timedelta(days=1)))
+    pool.used.add(1)
+
+    assert pool.match_date(line(100), WINDOW) == 2
+
+
+def test_suggestions_list_reference_matches_first_then_nearest_amounts():
+    pool = candidates(
+        (1, 100.0, None, DAY + timedelta(days=20)),
+        (2, 100.0, None, DAY - timedelta(days=5)),
+        (3, 75.0, "INV-9", DAY - timedelta(days=60)),
+        (4, 100.0, None, DAY + timedelta(days=8)),
+        (5, 100.0, None, DAY + timedelta(days=31)),
+    )
+
+    suggestions = pool.suggestions(line(100, "INV-9"), WINDOW)
+
+    assert [(s["transaction_id"], s["reason"]) for s in suggestions] == [("TXN-3", "reference"), ("TXN-2", "amount"), ("TXN-4", "amount")]
@@ -0,0 +1,124 @@
+"""
+Compiled category rules against the keyword checks they replaced
+"""
+
+import itertools
+
+import pytest
+
+from models.transaction import TransactionType
+from services.category_classifier import CategoryClassifier, category_classifier
+
+T = TransactionType
+
+
+def legacy_statement_bucket(transaction_type, category):
+    """ledger_rollup.statement_bucket before the classifier"""
+    category = (category or '').lower()
+    if transaction_type == T.REVENUE:
+        return "revenue"
+    if transaction_type == T.EXPENSE:
+        if any(keyword in category for keyword in ['cost', 'goods', 'inventory', 'materials']):
+            return "cost_of_goods_sold"
+        if 'interest' in category:
+            return "interest_expense"
+        if 'tax' in category:
+            return "income_tax"
+        return "operating_expenses"
+    if transaction_type == T.ASSET:
+        if any(keyword in category for keyword in ['cash', 'bank', 'receivable', 'inventory', 'prepaid']):
+            return "current_assets"
+        return "fixed_assets"
+    if transaction_type == T.LIABILITY:
+        if any(keyword in category for keyword in ['payable', 'short', 'accrued']):
+            return "current_liabilities"
+        return "long_term_liabilities"
+    if transaction_type == T.EQUITY:
+        if any(keyword in category for keyword in ['capital', 'owner']):
+            return "owner_equity"
+        return "retained_earnings"
+    return "other"
+
+
+def legacy_cash_flow_line(transaction_type, category):
+    """Adjustment branches of the old cash flow statement loop"""
+    category = (category or '').lower()
+    if transaction_type == T.EXPENSE:
+        if 'depreciation' in category:
+            return "depreciation"
+    elif transaction_type == T.ASSET:
+        if 'receivable' in category:
+            return "accounts_receivable"
+        elif 'inventory' in category:
+            return "inventory"
+        elif any(keyword in category for keyword in ['equipment', 'machinery']):
+            return "equipment_purchases"
+    elif transaction_type == T.LIABILITY:
+        if 'payable' in category:
+            return "accounts_payable"
+        elif 'loan' in category:
+            return "loan_proceeds"
+    elif transaction_type == T.EQUITY:
+        if any(keyword in category for keyword in ['withdrawal', 'drawing']):
+            return "owner_withdrawals"
+    return None
+
+
+def legacy_cash_flow_activity(transaction_type, category):
+    """Activity branches of the old cash flow analytics loop"""
+    category = (category or '').lower()
+    if transaction_type == T.EXPENSE:
+        if 'depreciation' in category:
+            return "non_cash"
+    elif transaction_type == T.ASSET:
+        if any(keyword in category for keyword in ['equipment', 'machinery', 'building', 'vehicle']):
+            return "investing"
+    elif transaction_type == T.LIABILITY:
+        if 'loan' in category:
+            return "financing"
+    elif transaction_type == T.EQUITY:
+        if any(keyword in category for keyword in ['withdrawal', 'drawing']):
+            return "financing"
+    return None
+
+
+KEYWORDS = [
+    'cost', 'goods', 'inventory', 'materials', 'interest', 'tax', 'cash', 'bank', 'receivable', 'prepaid',
+    'payable', 'short', 'accrued', 'capital', 'owner', 'depreciation', 'equipment', 'machinery',
+    'building', 'vehicle', 'loan', 'withdrawal', 'drawing',
+]
+
+# Every keyword alone, every ordered pair, and texts with case, padding and line breaks
+CATEGORIES = (
+    [None, '', 'Office supplies', 'Rent']
+    + KEYWORDS
+    + [f"{a} {b}" for a, b in itertools.permutations(KEYWORDS, 2)]
+    + ['Cost of Goods', 'Bank Interest', 'Short-term LOAN', 'Tax\non interest', 'Accrued payable', 'Vehicle depreciation', 'Owner drawings']
+)
+
+
+@pytest.mark.parametrize("transaction_type", list(TransactionType))
+def test_classification_matches_the_old_keyword_lists(transaction_type):
+    classifier = CategoryClassifier()
+    for category in CATEGORIES:
+        assert classifier.classify(transaction_type, category) == (
+            legacy_statement_bucket(transaction_type, category),
+            legacy_cash_flow_line(transaction_type, category),
+            legacy_cash_flow_activity(transaction_type, category),
+        ), category
+
+
+def test_first_matching_rule_wins_regardless_of_keyword_position():
+    # 'tax' comes first in the text but the cost_of_goods_sold rule is listed first
+    assert category_classifier.classify(T.EXPENSE, "tax on goods").statement_bucket == "cost_of_goods_sold"
+    assert category_classifier.classify(T.ASSET, "machinery receivable").cash_flow_line == "accounts_receivable"
+
+
+def test_results_are_memoized_per_type_and_category():
+    classifier = CategoryClassifier(cache_size=8)
+    classifier.classify(T.EXPENSE, "Interest")
+    classifier.classify(T.EXPENSE, "Interest")
+    classifier.classify(T.ASSET, "Interest")
+
+    info = classifier.classify.cache_info()
+    assert (info.hits, info.misses) == (1, 2)
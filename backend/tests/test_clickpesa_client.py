@@ -0,0 +1,139 @@
+"""
+ClickPesaClient against the in-process ClickPesa mock (clickpesa_mock_server)
+Run from backend/: python -m pytest tests
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from clickpesa_mock_server import app, state
+from services.clickpesa_client import ClickPesaClient, ClickPesaError
+
+BILL = {"billDescription": "Card top-up", "billPaymentMode": "ALLOW_PARTIAL_AND_OVER_PAYMENT", "customerName": "Test Customer"}
+
+
+@pytest.fixture(autouse=True)
+def reset_mock():
+    state.reset()
+    yield
+    state.reset()
+
+
+def make_client() -> ClickPesaClient:
+    return ClickPesaClient(
+        base_url="http://clickpesa.mock",
+        api_key="test-key",
+        client_id="test-client",
+        retry_backoff=0,
+        transport=httpx.ASGITransport(app=app),
+    )
+
+
+def run(coroutine_fn):
+    """Run a test body with a fresh client on its own event loop, closing the client afterwards"""
+    async def body():
+        client = make_client()
+        try:
+            return await coroutine_fn(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(body())
+
+
+def test_concurrent_callers_share_one_token_request():
+    async def body(client):
+        return await asyncio.gather(*[client.get_token() for _ in range(20)])
+
+    tokens = run(body)
+
+    assert len(set(tokens)) == 1
+    assert state.counts["generate_token"] == 1
+
+
+def test_cached_token_is_reused_across_calls():
+    async def body(client):
+        await client.create_customer_control_number({**BILL, "billReference": "REF-1"})
+        await client.create_customer_control_number({**BILL, "billReference": "REF-2"})
+
+    run(body)
+
+    assert state.counts["generate_token"] == 1
+    assert state.counts["create_control_number"] == 2
+
+
+def test_expired_token_is_refreshed_once_on_401():
+    async def body(client):
+        first = await client.get_token()
+        state.tokens.clear()  # ClickPesa expired the token early
+        bill = await client.create_customer_control_number({**BILL, "billReference": "REF-1"})
+        return first, await client.get_token(), bill
+
+    first, second, bill = run(body)
+
+    assert bill["billReference"] == "REF-1"
+    assert second != first
+    assert state.counts["generate_token"] == 2
+    assert state.counts["create_control_number"] == 2
+
+
+def test_token_request_is_retried_on_5xx():
+    async def body(client):
+        state.failures.extend([503, 502])
+        return await client.get_token()
+
+    token = run(body)
+
+    assert token.startswith("Bearer mock-")
+    assert state.counts["generate_token"] == 3
+
+
+def test_token_request_gives_up_after_max_retries():
+    async def body(client):
+        state.failures.extend([503] * (client.max_retries + 1))
+        with pytest.raises(ClickPesaError):
+            await client.get_token()
+
+    run(body)
+
+    assert state.counts["generate_token"] == make_client().max_retries + 1
+
+
+def test_control_number_post_is_not_retried_on_5xx():
+    async def body(client):
+        await client.get_token()
+        state.failures.append(503)
+        with pytest.raises(ClickPesaError):
+            await client.create_customer_control_number({**BILL, "billReference": "REF-1"})
+
+    run(body)
+
+    assert state.counts["create_control_number"] == 1
+    assert state.bills == {}
+
+
+def test_control_number_post_is_not_retried_on_connection_error():
+    class FailingTransport(httpx.AsyncBaseTransport):
+        def __init__(self):
+            self.inner = httpx.ASGITransport(app=app)
+
+        async def handle_async_request(self, request):
+            if request.url.path.endswith("create-customer-control-number"):
+                state.counts["create_control_number"] += 1
+                raise httpx.ConnectError("connection reset", request=request)
+            return await self.inner.handle_async_request(request)
+
+    async def body():
+        client = make_client()
+        client.transport = FailingTransport()
+        try:
+            with pytest.raises(ClickPesaError):
+                await client.create_customer_control_number({**BILL, "billReference": "REF-1"})
+        finally:
+            await client.aclose()
+
+    asyncio.run(body())
+
+    assert state.counts["create_control_number"] == 1
+    assert state.counts["generate_token"] == 1
@@ -0,0 +1,97 @@
+"""
+Keyset cursors: encoding, validation and the row-after condition
+"""
+
+import itertools
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, Date, DateTime, Integer, String, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from models.transaction import TransactionType
+from services.pagination import InvalidCursor, _after, decode_cursor, encode_cursor, paginate
+
+ItemBase = declarative_base()
+
+
+class Item(ItemBase):
+    __tablename__ = "items"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    name = Column(String(20), nullable=False)
+    due = Column(Date)
+
+
+@pytest.fixture
+def items():
+    engine = create_engine("sqlite://")
+    ItemBase.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    start = datetime(2025, 1, 1, 8, 30)
+    # Few distinct timestamps and names, so every key has ties
+    db.add_all([
+        Item(id=i, created_at=start + timedelta(minutes=i % 4), name="abc"[i % 3], due=date(2025, 2, 1 + i % 2))
+        for i in range(1, 31)
+    ])
+    db.commit()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def test_cursor_round_trips_dates_enums_and_scalars():
+    values = [datetime(2025, 3, 4, 5, 6, 7, 891011), date(2025, 3, 4), TransactionType.EXPENSE, "a b/c", 42, None]
+
+    cursor = encode_cursor(values)
+
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor, len(values)) == [values[0], values[1], TransactionType.EXPENSE.value, "a b/c", 42, None]
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor([1])[:-2] + "@@", "bnVsbA", "e30"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, 1)
+
+
+def test_cursor_for_another_listing_is_rejected():
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor([1, 2]), 3)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(encode_cursor([{"x": 1}]), 1)
+
+
+@pytest.mark.parametrize("directions", list(itertools.product([False, True], repeat=3)))
+def test_after_returns_exactly_the_rows_later_in_key_order(items, directions):
+    keys = list(zip((Item.created_at, Item.name, Item.id), directions))
+    everything = items.query(Item).all()
+    # Reverse a descending column's order by negating its rank among the distinct values
+    ranks = {column.key: sorted({getattr(item, column.key) for item in everything}) for column, _ in keys}
+
+    def sort_key(item):
+        return [
+            -ranks[column.key].index(getattr(item, column.key)) if descending else ranks[column.key].index(getattr(item, column.key))
+            for column, descending in keys
+        ]
+
+    ordered = sorted(everything, key=sort_key)
+    for position, item in enumerate(ordered):
+        values = [getattr(item, column.key) for column, _ in keys]
+        after = {row.id for row in items.query(Item).filter(_after(keys, values))}
+        assert after == {later.id for later in ordered[position + 1:]}
+
+
+def test_paginating_with_cursors_visits_every_row_once(items):
+    keys = [(Item.due, True), (Item.created_at, False), (Item.id, True)]
+    seen, cursor = [], None
+    while True:
+        rows, cursor = paginate(items.query(Item), keys, limit=7, cursor=cursor)
+        seen += [row.id for row in rows]
+        if cursor is None:
+            break
+
+    expected, _ = paginate(items.query(Item), keys, limit=100)
+    assert seen == [row.id for row in expected]
+    assert len(seen) == len(set(seen)) == 30
@@ -0,0 +1,75 @@
+"""
+Columnar payroll computation against the per-employee calculation it replaced
+"""
+
+import json
+
+import pytest
+
+from services.payroll_engine import StaffColumns, compute_payroll
+from services.tax_rules import DEFAULT_TAX_RULES
+from tests.test_tax_rules import legacy_paye
+
+
+def staff_columns(*staff):
+    """StaffColumns from (basic_salary, allowances, paye_eligible, loans, insurance) tuples, 10% NSSF each"""
+    columns = StaffColumns()
+    for i, (basic, allowances, eligible, loans, insurance) in enumerate(staff, start=1):
+        columns.append((
+            i, f"First{i}", "Last", 1, 1, 1,
+            basic, allowances, basic + allowances, eligible,
+            json.dumps([{"name": "NSSF", "percentage": "10"}]),
+            json.dumps([{"name": "Health", "amount": insurance, "frequency": "monthly"}]),
+            json.dumps([{"name": "Loan", "amount": loans}]),
+            "Ops", "HQ",
+        ))
+    return columns
+
+
+def legacy_payroll(basic, allowances, eligible, loans, insurance):
+    """calculate_payroll_without_sdl as it stood in routers/payroll.py"""
+    paye = legacy_paye(basic + allowances) if eligible else 0
+    nssf = basic * 0.10
+    return {"paye_tax": paye, "nssf": nssf, "net_salary": basic - (paye + nssf) + allowances - loans - insurance}
+
+
+STAFF = [
+    (250000, 0, True, 0, 0),
+    (400000, 50000, True, 20000, 0),
+    (700000, 100000, True, 0, 15000),
+    (1500000, 300000, True, 50000, 25000),
+    (900000, 0, False, 0, 0),
+]
+
+
+def test_batch_matches_the_per_employee_calculation():
+    result = compute_payroll(staff_columns(*STAFF))
+
+    for i, staff in enumerate(STAFF):
+        for name, expected in legacy_payroll(*staff).items():
+            assert result[name][i] == pytest.approx(expected), (i, name)
+
+
+def test_employer_costs_are_not_deducted_from_net_pay():
+    result = compute_payroll(staff_columns((1000000, 200000, True, 0, 0)))
+
+    assert result["sdl_tax"] == [pytest.approx(1200000 * DEFAULT_TAX_RULES.sdl_rate)]
+    assert result["wcf"] == [pytest.approx(1200000 * DEFAULT_TAX_RULES.wcf_rate)]
+    assert result["nssf_employer"] == [pytest.approx(1000000 * DEFAULT_TAX_RULES.nssf_employer_rate)]
+    assert result["total_employer_costs"][0] == pytest.approx(result["sdl_tax"][0] + result["wcf"][0] + result["nssf_employer"][0])
+    assert result["net_salary"][0] == pytest.approx(1200000 - result["total_deductions"][0])
+
+
+def test_totals_sum_every_column():
+    result = compute_payroll(staff_columns(*STAFF))
+
+    assert result.totals["net_salary"] == pytest.approx(sum(legacy_payroll(*staff)["net_salary"] for staff in STAFF))
+    assert result.totals["paye_tax"] == pytest.approx(sum(result["paye_tax"]))
+
+
+def test_fingerprint_changes_with_inputs_and_rules():
+    columns = staff_columns((400000, 0, True, 0, 0), (400000, 0, True, 0, 0), (400000, 1, True, 0, 0))
+
+    assert columns.fingerprint(0) == columns.fingerprint(1)
+    assert columns.fingerprint(0) != columns.fingerprint(2)
+    assert columns.fingerprint(0, "v1") != columns.fingerprint(0, "v2")
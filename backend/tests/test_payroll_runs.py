@@ -0,0 +1,136 @@
+"""
+Payroll runs keep every branch counted by exactly one calculation
+"""
+
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models.payroll import Staff, Branch, Department, Role, PayrollRecord, PayrollCalculation, EmploymentType
+from services.payroll_jobs import run_payroll, run_payroll_incremental
+from services.payroll_store import CALCULATION_TOTALS
+
+PERIOD = "2026-10"
+
+
+@pytest.fixture
+def branches(db):
+    """Two branches with three staff each"""
+    ids = []
+    for name in ("HQ", "Arusha"):
+        branch = Branch(name=name)
+        db.add(branch)
+        db.flush()
+        department = Department(name=f"{name} Ops", branch_id=branch.id)
+        db.add(department)
+        db.flush()
+        role = Role(name="Clerk", department_id=department.id)
+        db.add(role)
+        db.flush()
+        for i in range(3):
+            basic = 400000 + 10000 * i + 100000 * len(ids)
+            db.add(Staff(
+                first_name=f"{name}{i}", last_name="Test", email=f"{name}{i}@example.com", phone=f"{name}{i}",
+                branch_id=branch.id, department_id=department.id, role_id=role.id,
+                employment_type=EmploymentType.FULL_TIME, hire_date=date(2024, 1, 1),
+                basic_salary=basic, allowances=0, total_package=basic,
+                social_security=json.dumps([{"name": "NSSF", "percentage": "10"}]),
+            ))
+        ids.append(branch.id)
+    db.commit()
+    return ids
+
+
+def summary(db):
+    """Totals over every calculation of the period, as /payroll/summary sums them"""
+    calculations = db.query(PayrollCalculation).filter(PayrollCalculation.payroll_period == PERIOD).all()
+    return {
+        "employees": sum(c.total_employees for c in calculations),
+        "net_salary": round(sum(c.total_net_salary for c in calculations), 2),
+    }
+
+
+def record_totals(db, branch_id=None):
+    records = db.query(PayrollRecord).filter(PayrollRecord.payroll_period == PERIOD)
+    if branch_id:
+        records = records.filter(PayrollRecord.branch_id == branch_id)
+    records = records.all()
+    return {"employees": len(records), "net_salary": round(sum(r.net_salary for r in records), 2)}
+
+
+def calculation_totals(db, branch_id):
+    calculation = db.query(PayrollCalculation).filter(
+        PayrollCalculation.payroll_period == PERIOD, PayrollCalculation.branch_id == branch_id
+    ).one()
+    return {"employees": calculation.total_employees, "net_salary": round(calculation.total_net_salary, 2)}
+
+
+def test_branch_rerun_after_all_branch_run_counts_branch_once(db, branches):
+    run_payroll(db, PERIOD)
+    before = summary(db)
+
+    run_payroll(db, PERIOD, branch_id=branches[0])
+    db.expire_all()
+
+    assert summary(db) == before == record_totals(db)
+    assert calculation_totals(db, branches[0]) == record_totals(db, branches[0])
+
+
+def test_repeated_branch_reruns_keep_the_summary(db, branches):
+    run_payroll(db, PERIOD)
+    before = summary(db)
+
+    for _ in range(2):
+        run_payroll(db, PERIOD, branch_id=branches[0])
+        run_payroll(db, PERIOD, branch_id=branches[1])
+    db.expire_all()
+
+    assert summary(db) == before == record_totals(db)
+
+
+def test_paid_records_move_with_a_branch_rerun(db, branches):
+    run_payroll(db, PERIOD)
+    before = summary(db)
+    paid = db.query(PayrollRecord).filter(PayrollRecord.branch_id == branches[0]).first()
+    paid.status = "paid"
+    db.commit()
+
+    run_payroll(db, PERIOD, branch_id=branches[0])
+    db.expire_all()
+
+    assert summary(db) == before == record_totals(db)
+    assert db.query(PayrollRecord).filter(PayrollRecord.staff_id == paid.staff_id).count() == 1
+
+
+def test_incremental_run_moves_a_transferred_employee(db, branches):
+    old_branch, new_branch = branches
+    run_payroll(db, PERIOD, branch_id=old_branch)
+    run_payroll(db, PERIOD, branch_id=new_branch)
+    before = summary(db)
+
+    moved = db.query(Staff).filter(Staff.branch_id == old_branch).first()
+    moved.branch_id = new_branch
+    moved.updated_at = datetime.utcnow() + timedelta(seconds=5)
+    db.commit()
+
+    changes = run_payroll_incremental(db, PERIOD, branch_id=new_branch)["changes"]
+    db.expire_all()
+
+    assert changes["updated"] == 1 and changes["inserted"] == 0
+    record = db.query(PayrollRecord).filter(PayrollRecord.staff_id == moved.id).one()
+    assert record.branch_id == new_branch
+    for branch_id in branches:
+        assert calculation_totals(db, branch_id) == record_totals(db, branch_id)
+    assert summary(db) == before
+
+
+def test_calculation_totals_cover_every_totalled_field(db, branches):
+    run_payroll(db, PERIOD)
+    run_payroll(db, PERIOD, branch_id=branches[1])
+    db.expire_all()
+
+    records = db.query(PayrollRecord).filter(PayrollRecord.payroll_period == PERIOD).all()
+    calculations = db.query(PayrollCalculation).filter(PayrollCalculation.payroll_period == PERIOD).all()
+    for field, total in CALCULATION_TOTALS.items():
+        assert sum(getattr(c, total) for c in calculations) == pytest.approx(sum(getattr(r, field) for r in records))
@@ -0,0 +1,90 @@
+"""
+Search index tokenizing, query parsing and rebuilds
+"""
+
+from datetime import datetime
+
+from sqlalchemy import event
+
+from models.search_index import SearchToken
+from models.transaction import Transaction, TransactionType, PaymentMethod
+from services import search_index
+from services.schema_upgrade import upgrade_database
+
+
+def add_transactions(db, count: int) -> None:
+    db.execute(Transaction.__table__.insert(), [
+        {
+            "transaction_id": f"TXN-{i:06d}",
+            "description": f"Payment word{i}",
+            "reference": f"REF{i}",
+            "category": "Office supplies",
+            "type": TransactionType.EXPENSE,
+            "amount": 10.0,
+            "payment_method": PaymentMethod.CASH,
+            "transaction_date": datetime(2025, 1, 1),
+        }
+        for i in range(count)
+    ])
+    db.commit()
+
+
+def test_tokenize_lowercases_and_splits_lists():
+    assert search_index.tokenize("Acme Ltd.", None, ["Dar es Salaam", "ACME"]) == {"acme", "ltd", "dar", "es", "salaam"}
+
+
+def test_parse_query_marks_quoted_words_exact():
+    assert search_index.parse_query('acc "rent" acc') == [("acc", False), ("rent", True)]
+
+
+def test_rebuild_indexes_every_entity_across_batches(engine, db, monkeypatch):
+    # Small batches so the rebuild spans many fetch chunks and INSERT flushes
+    monkeypatch.setattr(search_index, "REBUILD_FETCH_SIZE", 7)
+    monkeypatch.setattr(search_index, "REBUILD_BATCH_SIZE", 10)
+    add_transactions(db, 50)
+
+    # On MySQL the INSERTs would discard the rest of a streamed (unbuffered) read
+    streamed = []
+
+    def record_streaming(conn, cursor, statement, parameters, context, executemany):
+        if context.execution_options.get("stream_results"):
+            streamed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record_streaming)
+    try:
+        written = search_index.rebuild(db, "transaction")
+    finally:
+        event.remove(engine, "before_cursor_execute", record_streaming)
+
+    assert streamed == []
+
+    # payment, word<i>, ref<i>, office, supplies per transaction
+    assert written == {"transaction": 50 * 5}
+    assert written["transaction"] > search_index.REBUILD_BATCH_SIZE
+    indexed = {entity_id for (entity_id,) in db.query(SearchToken.entity_id).distinct()}
+    assert indexed == {transaction_id for (transaction_id,) in db.query(Transaction.id)}
+
+
+def test_rebuild_replaces_stale_tokens(db):
+    add_transactions(db, 3)
+    search_index.rebuild(db, "transaction")
+    db.query(Transaction).filter(Transaction.transaction_id == "TXN-000000").update({"description": "Renamed"})
+    db.commit()
+
+    search_index.rebuild(db, "transaction")
+
+    query = search_index.apply_search(db.query(Transaction.transaction_id), "transaction", Transaction.id, '"word0"')
+    assert query.all() == []
+    query = search_index.apply_search(db.query(Transaction.transaction_id), "transaction", Transaction.id, "renam")
+    assert [transaction_id for (transaction_id,) in query] == ["TXN-000000"]
+
+
+def test_schema_upgrade_fills_a_new_index_from_existing_rows(engine, db):
+    add_transactions(db, 3)
+    SearchToken.__table__.drop(bind=engine)
+
+    created = upgrade_database(engine)
+
+    assert "search_tokens" in created["tables"]
+    query = search_index.apply_search(db.query(Transaction.transaction_id), "transaction", Transaction.id, "word2")
+    assert [transaction_id for (transaction_id,) in query] == ["TXN-000002"]
@@ -0,0 +1,87 @@
+"""
+Bulk staff import: uniqueness checks and employee numbering
+"""
+
+from datetime import date
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from models.payroll import Staff, Branch, Department, Role, EmploymentType
+from services import staff_import
+from services.id_allocator import IdAllocator
+
+
+@pytest.fixture
+def org(engine, db, monkeypatch):
+    """One branch, department and role, and an allocator on the test database"""
+    monkeypatch.setattr(staff_import, "id_allocator", IdAllocator(session_factory=sessionmaker(bind=engine)))
+    branch = Branch(name="HQ")
+    db.add(branch)
+    db.flush()
+    department = Department(name="Ops", branch_id=branch.id)
+    db.add(department)
+    db.flush()
+    db.add(Role(name="Clerk", department_id=department.id))
+    db.commit()
+    return branch, department
+
+
+def add_staff(db, org, email, **identifiers):
+    branch, department = org
+    db.add(Staff(
+        first_name="Old", last_name="Staff", email=email, phone="1",
+        branch_id=branch.id, department_id=department.id, role_id=1,
+        employment_type=EmploymentType.FULL_TIME, hire_date=date(2024, 1, 1),
+        basic_salary=300000, allowances=0, total_package=300000, **identifiers,
+    ))
+    db.commit()
+
+
+def rows(count, **extra):
+    return [
+        {"firstName": f"New{i}", "lastName": "Staff", "email": f"new{i}@example.com", "phone": str(i),
+         "basicSalary": 400000, "branch": "HQ", "department": "Ops", "position": "Clerk", **extra}
+        for i in range(count)
+    ]
+
+
+def test_rows_are_numbered_from_one_block(db, org):
+    result = staff_import.import_staff(db, rows(3))
+
+    assert result["imported"] == 3 and result["errors"] == []
+    assert result["employee_numbers"] == {"first": "EMP0001", "last": "EMP0003", "count": 3}
+    assert {s.employee_id for s in db.query(Staff)} == {"EMP0001", "EMP0002", "EMP0003"}
+
+
+def test_generated_employee_id_clashing_with_existing_staff_rejects_the_row(db, org):
+    # Staff id 1 seeds the sequence, so the next number is EMP0002, already someone's employee_id
+    add_staff(db, org, "old@example.com", employee_id="EMP0002")
+
+    result = staff_import.import_staff(db, rows(2))
+
+    assert result["imported"] == 1
+    assert result["errors"] == [{"row": 1, "errors": ["employee_id EMP0002 already exists"]}]
+    assert result["employee_numbers"] == {"first": "EMP0003", "last": "EMP0003", "count": 1}
+
+
+def test_generated_number_clashing_with_a_supplied_one_rejects_the_generated_row(db, org):
+    batch = rows(2)
+    batch[1]["employee_number"] = "EMP0001"
+
+    result = staff_import.import_staff(db, batch)
+
+    assert result["imported"] == 1
+    assert result["errors"] == [{"row": 1, "errors": ["Duplicate employee_id EMP0001 (also in row 2)", "Duplicate employee_number EMP0001 (also in row 2)"]}]
+    assert result["employee_numbers"] is None
+
+
+def test_supplied_employee_number_defaults_employee_id_before_the_uniqueness_check(db, org):
+    add_staff(db, org, "old@example.com", employee_id="E-7")
+    batch = rows(1)
+    batch[0]["employee_number"] = "E-7"
+
+    result = staff_import.import_staff(db, batch, dry_run=True)
+
+    assert result["valid_rows"] == 0
+    assert result["errors"] == [{"row": 1, "errors": ["employee_id E-7 already exists"]}]
@@ -0,0 +1,59 @@
+"""
+Compiled PAYE brackets against the hard-coded Tanzania brackets they replaced
+"""
+
+import pytest
+
+from services.tax_rules import CompiledTaxRules, DEFAULT_TAX_RULES
+
+
+def legacy_paye(income: float) -> float:
+    """The if/elif bracket chain payroll used before rule sets were stored"""
+    if income <= 270000:
+        return 0
+    elif income <= 520000:
+        return (income - 270000) * 0.08
+    elif income <= 760000:
+        return 20000 + (income - 520000) * 0.20
+    elif income <= 1000000:
+        return 68000 + (income - 760000) * 0.25
+    return 128000 + (income - 1000000) * 0.30
+
+
+def test_default_bracket_bases_are_the_cumulative_tax_below():
+    assert DEFAULT_TAX_RULES.upper_bounds == [270000, 520000, 760000, 1000000]
+    assert DEFAULT_TAX_RULES.base_tax == [0, 0, 20000, 68000, 128000]
+
+
+@pytest.mark.parametrize("income", [
+    0, 1, 269999, 270000, 270001, 519999.5, 520000, 520001,
+    759999, 760000, 760001, 999999, 1000000, 1000001, 2500000, 12345678.9,
+])
+def test_default_paye_matches_the_legacy_brackets(income):
+    assert DEFAULT_TAX_RULES.paye(income) == pytest.approx(legacy_paye(income))
+
+
+def test_brackets_are_sorted_and_untaxed_below_the_first_lower_bound():
+    rules = CompiledTaxRules([500, 100], [0.2, 0.1], 0, 0, 0)
+
+    assert rules.lower_bounds == [0, 100, 500]
+    assert rules.rates == [0, 0.1, 0.2]
+    assert rules.base_tax == [0, 0, 40]
+    assert rules.paye(100) == 0
+    assert rules.paye(500) == pytest.approx(40)
+    assert rules.paye(600) == pytest.approx(60)
+
+
+def test_version_changes_only_with_the_rules():
+    same = CompiledTaxRules([0, 270000, 520000, 760000, 1000000], [0, 0.08, 0.20, 0.25, 0.30], 0.035, 0.005, 0.10, name="Copy")
+    changed = CompiledTaxRules([0, 270000, 520000, 760000, 1000000], [0, 0.09, 0.20, 0.25, 0.30], 0.035, 0.005, 0.10)
+
+    assert same.version == DEFAULT_TAX_RULES.version
+    assert changed.version != DEFAULT_TAX_RULES.version
+
+
+def test_to_dict_lists_each_bracket_with_its_base():
+    brackets = DEFAULT_TAX_RULES.to_dict()["brackets"]
+
+    assert brackets[2] == {"lower_bound": 520000, "upper_bound": 760000, "base_tax": 20000, "rate": 0.20}
+    assert brackets[-1]["upper_bound"] is None